@@ -0,0 +1,396 @@
+"""
+Pricing analytics over equipment and reservations.
+
+Columns are pulled with `COPY ... (FORMAT binary)` straight into NumPy
+arrays (no per-row Python objects), and every statistic is
+computed with grouped array operations. Each worker caches the latest
+snapshot and rebuilds it every REFRESH_SECONDS from main.lifespan.
+"""
+import asyncio
+import io
+import struct
+import threading
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+
+from .database import get_read_db
+
+router = APIRouter()
+
+REFRESH_SECONDS = 10 * 60
+# Utilization and revenue look at reservations overlapping this trailing window
+WINDOW_DAYS = 365
+PERCENTILES = (10, 25, 50, 75, 90)
+# Each category's price curve splits its items into this many equal-size price bands
+PRICE_BANDS = 5
+# Category/location groups with fewer items are not reported
+MIN_LOCATION_ITEMS = 5
+# Reservations that count as rented days
+RENTED_STATUSES = ('running', 'returned', 'completed')
+
+# Binary COPY sends DATE as int4 days since this date
+_EPOCH = date(2000, 1, 1)
+# Binary COPY: 11-byte signature, 4-byte flags, 4-byte header extension length
+_COPY_HEADER_BYTES = 19
+
+
+def fetch_columns(cursor, columns, from_clause: str, params=()):
+    """
+    Fetch whole columns as NumPy arrays: {name: ndarray}.
+
+    `columns` is [(name, sql expression, '>i4' | '>f8')]; expressions must be
+    NOT NULL. Each column is aggregated server-side with array_agg and sent
+    as one binary COPY row, so the client does no per-row work at all.
+    """
+    select = ", ".join(f"array_agg({expression})" for _, expression, _ in columns)
+    query = cursor.mogrify(f"SELECT {select} {from_clause}", params).decode("utf-8")
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT (FORMAT binary)", buffer)
+    data = buffer.getvalue()
+
+    result = {}
+    offset = _COPY_HEADER_BYTES + 2     # skip the row's field count
+    for name, _, dtype in columns:
+        (length,) = struct.unpack_from(">i", data, offset)
+        offset += 4
+        if length < 0:
+            # array_agg over no rows is NULL
+            result[name] = np.empty(0, dtype=dtype.replace(">", "="))
+            continue
+        # Array header: ndim, has-nulls flag, element oid, then (size, lower bound) per dimension
+        ndim, _, _ = struct.unpack_from(">iii", data, offset)
+        count = struct.unpack_from(">i", data, offset + 12)[0] if ndim else 0
+        elements = np.frombuffer(data, dtype=[("length", ">i4"), ("value", dtype)],
+                                 count=count, offset=offset + 12 + 8 * ndim)
+        result[name] = elements["value"].astype(dtype.replace(">", "="))
+        offset += length
+    return result
+
+
+def _group_bounds(sorted_groups, n_groups: int):
+    counts = np.bincount(sorted_groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return counts, starts
+
+
+def _grouped_percentiles(groups, values, n_groups: int, qs):
+    """Percentiles (linear interpolation, like np.percentile) of values within each group; NaN for empty groups"""
+    out = np.full((n_groups, len(qs)), np.nan)
+    if len(values) == 0:
+        return out
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts, starts = _group_bounds(groups[order], n_groups)
+
+    position = starts[:, None] + (np.asarray(qs) / 100.0)[None, :] * np.maximum(counts - 1, 0)[:, None]
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, np.maximum(starts + counts - 1, 0)[:, None])
+    low = np.minimum(low, len(sorted_values) - 1)
+    high = np.minimum(high, len(sorted_values) - 1)
+    fraction = position - low
+    result = sorted_values[low] + (sorted_values[high] - sorted_values[low]) * fraction
+
+    present = counts > 0
+    out[present] = result[present]
+    return out
+
+
+def _grouped_weighted_percentiles(groups, values, weights, n_groups: int, qs):
+    """Weighted percentiles (lowest value reaching the weight quantile) per group; NaN where total weight is 0"""
+    out = np.full((n_groups, len(qs)), np.nan)
+    if len(values) == 0:
+        return out
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    sorted_values = values[order]
+    cumulative = np.cumsum(weights[order])
+
+    counts, starts = _group_bounds(sorted_groups, n_groups)
+    before = np.concatenate(([0.0], cumulative))[starts]
+    totals = np.bincount(sorted_groups, weights=weights[order], minlength=n_groups)
+    within = cumulative - before[sorted_groups]
+
+    for column, q in enumerate(qs):
+        reached = np.flatnonzero(within >= totals[sorted_groups] * (q / 100.0))
+        # First row of each group that reaches its target weight
+        first_groups, first_rows = np.unique(sorted_groups[reached], return_index=True)
+        out[first_groups, column] = sorted_values[reached[first_rows]]
+    out[totals <= 0] = np.nan
+    return out
+
+
+class PricingSnapshot:
+    """Per-item arrays plus the aggregated per-category/location statistics"""
+
+    def __init__(self, categories, locations, equipment, reservations, today: date):
+        self.categories = categories
+        self.locations = locations
+        self.generated_at = datetime.now(timezone.utc)
+
+        # Sorted by id so reservations can be matched with searchsorted
+        order = np.argsort(equipment['equipment_id'])
+        self.equipment_ids = equipment['equipment_id'][order]
+        self.category = equipment['category'][order]
+        self.location = equipment['location'][order]
+        self.price = equipment['daily_price'][order]
+        n_items = len(self.equipment_ids)
+        n_categories = len(categories)
+        self.reservation_count = len(reservations['equipment_id'])
+
+        # Rented days and (pro-rated) revenue inside the window, per item
+        window_end = (today - _EPOCH).days + 1
+        window_start = window_end - WINDOW_DAYS
+        item = np.searchsorted(self.equipment_ids, reservations['equipment_id'])
+        known = item < n_items
+        known[known] = self.equipment_ids[item[known]] == reservations['equipment_id'][known]
+        start = reservations['start_day'][known]
+        end = reservations['end_day'][known]
+        item = item[known]
+        rented = np.clip(np.minimum(end, window_end) - np.maximum(start, window_start), 0, None)
+        revenue = reservations['total_price'][known] * rented / np.maximum(end - start, 1)
+
+        self.utilization = np.minimum(np.bincount(item, weights=rented, minlength=n_items) / WINDOW_DAYS, 1.0)
+        self.revenue = np.bincount(item, weights=revenue, minlength=n_items)
+
+        # Per category
+        items = np.bincount(self.category, minlength=n_categories)
+        self.category_items = items
+        self.category_percentiles = _grouped_percentiles(self.category, self.price, n_categories, PERCENTILES)
+        # Prices weighted by how much of the window items at that price were rented
+        self.category_fair_range = _grouped_weighted_percentiles(
+            self.category, self.price, self.utilization, n_categories, (25, 50, 75)
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.category_utilization = np.bincount(self.category, weights=self.utilization, minlength=n_categories) / items
+            self.category_revenue_per_item = np.bincount(self.category, weights=self.revenue, minlength=n_categories) / items
+        self.price_curves = self._price_curves(n_categories)
+
+        # Per category and location, for groups big enough to be meaningful
+        located = self.location >= 0
+        keys = self.category[located].astype(np.int64) * max(len(locations), 1) + self.location[located]
+        self.location_keys, inverse = np.unique(keys, return_inverse=True)
+        self.location_items = np.bincount(inverse, minlength=len(self.location_keys))
+        self.location_percentiles = _grouped_percentiles(
+            inverse, self.price[located], len(self.location_keys), PERCENTILES
+        )
+
+    def _price_curves(self, n_categories: int):
+        """Utilization and revenue per item for equal-size price bands within each category"""
+        order = np.lexsort((self.price, self.category))
+        sorted_categories = self.category[order]
+        counts, starts = _group_bounds(sorted_categories, n_categories)
+        rank = np.arange(len(order)) - starts[sorted_categories]
+        band = rank * PRICE_BANDS // np.maximum(counts[sorted_categories], 1)
+        key = sorted_categories.astype(np.int64) * PRICE_BANDS + band
+        n_keys = n_categories * PRICE_BANDS
+
+        band_items = np.bincount(key, minlength=n_keys)
+        band_utilization = np.bincount(key, weights=self.utilization[order], minlength=n_keys)
+        band_revenue = np.bincount(key, weights=self.revenue[order], minlength=n_keys)
+        band_low = np.full(n_keys, np.inf)
+        band_high = np.full(n_keys, -np.inf)
+        np.minimum.at(band_low, key, self.price[order])
+        np.maximum.at(band_high, key, self.price[order])
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "items": band_items.reshape(n_categories, PRICE_BANDS),
+                "price_from": band_low.reshape(n_categories, PRICE_BANDS),
+                "price_to": band_high.reshape(n_categories, PRICE_BANDS),
+                "utilization": (band_utilization / band_items).reshape(n_categories, PRICE_BANDS),
+                "revenue_per_item": (band_revenue / band_items).reshape(n_categories, PRICE_BANDS),
+            }
+
+    def category_summary(self, code: int):
+        curve = self.price_curves
+        return {
+            "category": self.categories[code],
+            "items": int(self.category_items[code]),
+            "price_percentiles": _percentile_dict(self.category_percentiles[code]),
+            "fair_price_range": {
+                "low": _money(self.category_fair_range[code][0]),
+                "median": _money(self.category_fair_range[code][1]),
+                "high": _money(self.category_fair_range[code][2]),
+            },
+            "utilization": _ratio(self.category_utilization[code]),
+            "revenue_per_item": _money(self.category_revenue_per_item[code]),
+            "price_curve": [
+                {
+                    "price_from": _money(curve["price_from"][code][band]),
+                    "price_to": _money(curve["price_to"][code][band]),
+                    "items": int(curve["items"][code][band]),
+                    "utilization": _ratio(curve["utilization"][code][band]),
+                    "revenue_per_item": _money(curve["revenue_per_item"][code][band]),
+                }
+                for band in range(PRICE_BANDS)
+                if curve["items"][code][band]
+            ],
+        }
+
+    def meta(self):
+        return {
+            "generated_at": self.generated_at,
+            "window_days": WINDOW_DAYS,
+            "items": int(len(self.equipment_ids)),
+            "reservations": self.reservation_count,
+        }
+
+
+def _money(value):
+    return None if not np.isfinite(value) else round(float(value), 2)
+
+
+def _ratio(value):
+    return None if not np.isfinite(value) else round(float(value), 4)
+
+
+def _percentile_dict(values):
+    return {f"p{q}": _money(value) for q, value in zip(PERCENTILES, values)}
+
+
+def load_snapshot(today: date = None) -> PricingSnapshot:
+    today = today or date.today()
+    window_end = today
+    window_start = date.fromordinal(today.toordinal() - WINDOW_DAYS)
+
+    conn = get_read_db()
+    try:
+        # One snapshot so category/location codes match the rows that use them
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT COALESCE(category, 'Uncategorized')
+            FROM equipment
+            ORDER BY 1
+        """)
+        categories = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT lower(btrim(pickup_location)) as location_key, MIN(btrim(pickup_location))
+            FROM equipment
+            WHERE btrim(pickup_location) <> ''
+            GROUP BY 1
+            ORDER BY 1
+        """)
+        location_rows = cursor.fetchall()
+        location_keys = [row[0] for row in location_rows]
+        locations = [row[1] for row in location_rows]
+
+        equipment = fetch_columns(cursor, [
+            ("equipment_id", "e.equipment_id", ">i4"),
+            ("category", "(c.code - 1)::int4", ">i4"),
+            ("location", "COALESCE(l.code - 1, -1)::int4", ">i4"),
+            ("daily_price", "e.daily_price::float8", ">f8"),
+        ], """
+            FROM equipment e
+            JOIN unnest(%s::text[]) WITH ORDINALITY AS c(category, code)
+                ON c.category = COALESCE(e.category, 'Uncategorized')
+            LEFT JOIN unnest(%s::text[]) WITH ORDINALITY AS l(location_key, code)
+                ON l.location_key = lower(btrim(e.pickup_location))
+        """, (categories, location_keys))
+        reservations = fetch_columns(cursor, [
+            ("equipment_id", "equipment_id", ">i4"),
+            ("start_day", "start_date", ">i4"),
+            ("end_day", "end_date", ">i4"),
+            ("total_price", "total_price::float8", ">f8"),
+        ], """
+            FROM reservation
+            WHERE status IN %s AND end_date >= %s AND start_date <= %s
+        """, (RENTED_STATUSES, window_start, window_end))
+        conn.rollback()
+        cursor.close()
+    finally:
+        conn.close()
+
+    return PricingSnapshot(categories, locations, equipment, reservations, today)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+stats = {"refreshes": 0, "last_refresh_ms": None}
+
+
+def refresh() -> PricingSnapshot:
+    global _snapshot
+    started = time.perf_counter()
+    snapshot = load_snapshot()
+    _snapshot = snapshot
+    stats["refreshes"] += 1
+    stats["last_refresh_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return snapshot
+
+
+def get_snapshot() -> PricingSnapshot:
+    """Cached snapshot; the first caller builds it while concurrent callers wait"""
+    if _snapshot is not None:
+        return _snapshot
+    with _snapshot_lock:
+        return _snapshot if _snapshot is not None else refresh()
+
+
+async def run_forever():
+    """Rebuild this worker's snapshot periodically once something has asked for it"""
+    while True:
+        await asyncio.sleep(REFRESH_SECONDS)
+        if _snapshot is None:
+            continue
+        try:
+            await asyncio.to_thread(refresh)
+        except Exception as e:
+            print(f"[analytics] refresh failed: {e}")
+
+
+# GET price distribution, fair price range and price curve per category (admin)
+@router.get("/pricing")
+def get_pricing_by_category(category: str = None):
+    snapshot = get_snapshot()
+    codes = range(len(snapshot.categories))
+    if category:
+        if category not in snapshot.categories:
+            raise HTTPException(status_code=404, detail="Category not found")
+        codes = [snapshot.categories.index(category)]
+    return dict(snapshot.meta(), categories=[snapshot.category_summary(code) for code in codes])
+
+
+# GET price distribution per category and pickup location (admin)
+@router.get("/pricing/locations")
+def get_pricing_by_location(category: str = None, min_items: int = MIN_LOCATION_ITEMS):
+    snapshot = get_snapshot()
+    n_locations = max(len(snapshot.locations), 1)
+    groups = []
+    for index in np.flatnonzero(snapshot.location_items >= min_items):
+        category_code, location_code = divmod(int(snapshot.location_keys[index]), n_locations)
+        if category and snapshot.categories[category_code] != category:
+            continue
+        groups.append({
+            "category": snapshot.categories[category_code],
+            "location": snapshot.locations[location_code],
+            "items": int(snapshot.location_items[index]),
+            "price_percentiles": _percentile_dict(snapshot.location_percentiles[index]),
+        })
+    return dict(snapshot.meta(), locations=groups)
+
+
+# GET how one listing's price compares with its category (owner)
+@router.get("/pricing/equipment/{equipment_id}")
+def get_pricing_for_equipment(equipment_id: int):
+    snapshot = get_snapshot()
+    index = int(np.searchsorted(snapshot.equipment_ids, equipment_id))
+    if index >= len(snapshot.equipment_ids) or snapshot.equipment_ids[index] != equipment_id:
+        raise HTTPException(status_code=404, detail="Equipment not found (new listings appear after the next refresh)")
+
+    code = int(snapshot.category[index])
+    same_category = snapshot.price[snapshot.category == code]
+    price = snapshot.price[index]
+    return dict(
+        snapshot.meta(),
+        equipment_id=equipment_id,
+        daily_price=_money(price),
+        utilization=_ratio(snapshot.utilization[index]),
+        revenue=_money(snapshot.revenue[index]),
+        # Share of the category priced below this listing
+        price_rank=_ratio(np.count_nonzero(same_category < price) / len(same_category)),
+        category=snapshot.category_summary(code),
+    )
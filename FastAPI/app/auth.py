@@ -1,15 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from psycopg2.extras import RealDictCursor
 from .database import get_db
 from .schemas import UserRegister, UserLogin
-from .security import verify_password, create_access_token
+from .security import create_access_token, hash_password_async, verify_and_update_async
+from .identity import current_user
 
 router = APIRouter()
 
 
-# REGISTER
-@router.post("/signup")
-def signup(user: UserRegister):
+def _insert_user(user: UserRegister, password_hash: str):
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -30,69 +30,108 @@ def signup(user: UserRegister):
             INSERT INTO "User" ("UserName_PK", "Email", "Password", "Location")
             VALUES (%s, %s, %s, %s)
             RETURNING "UserName_PK", "Email", "Role", "Location", "VerificationStatus", "CreatedAt"
-        """, (user.username, user.email, user.password, user.location))
+        """, (user.username, user.email, password_hash, user.location))
         
         new_user = cursor.fetchone()
         conn.commit()
         cursor.close()
-        
-        token = create_access_token({
-            "sub": new_user["UserName_PK"],
-            "role": new_user["Role"]
-        })
-        
-        return {
-            "message": "User registered successfully",
-            "token": token,
-            "user": {
-                "UserName_PK": new_user['UserName_PK'],
-                "Email": new_user['Email'],
-                "Role": new_user['Role'],
-                "Location": new_user['Location'],
-                "CreatedAt": new_user['CreatedAt'].isoformat() if new_user['CreatedAt'] else None
-            }
-        }
+        return new_user
     finally:
         conn.close()
 
 
-# LOGIN
-@router.post("/login")
-def login(user: UserLogin):
+def _get_user_by_email(email: str):
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get user by email
         cursor.execute("""
             SELECT "UserName_PK", "Email", "Password", "Role", "Location", "CreatedAt"
             FROM "User"
             WHERE "Email" = %s
-        """, (user.email,))
+        """, (email,))
         db_user = cursor.fetchone()
         cursor.close()
-        
-        if not db_user:
-            raise HTTPException(status_code=401, detail="Invalid user")
-        
-        if not verify_password(user.password, db_user['Password']):
-            raise HTTPException(status_code=401, detail="Invalid password")
-        
-        token = create_access_token({
-            "sub": db_user['UserName_PK'],
-            "role": db_user['Role']
-        })
-        
-        return {
-            "access_token": token,
-            "token_type": "bearer",
-            "user": {
-                "UserName_PK": db_user['UserName_PK'],
-                "Email": db_user['Email'],
-                "Role": db_user['Role'],
-                "Location": db_user['Location'],
-                "CreatedAt": db_user['CreatedAt'].isoformat() if db_user['CreatedAt'] else None
-            }
-        }
+        return db_user
+    finally:
+        conn.close()
+
+
+def _store_password_hash(username: str, stored: str, password_hash: str):
+    """Replace a legacy or outdated password value (unless it changed meanwhile)"""
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE "User" SET "Password" = %s, "UpdatedAt" = CURRENT_TIMESTAMP
+            WHERE "UserName_PK" = %s AND "Password" = %s
+        """, (password_hash, username, stored))
+        conn.commit()
+        cursor.close()
     finally:
         conn.close()
+
+
+# REGISTER
+# Handlers are async so waiting on the hash pool doesn't pin a request thread;
+# database work still runs in the threadpool
+@router.post("/signup")
+async def signup(user: UserRegister):
+    password_hash = await hash_password_async(user.password)
+    new_user = await run_in_threadpool(_insert_user, user, password_hash)
+    
+    token = create_access_token({
+        "sub": new_user["UserName_PK"],
+        "role": new_user["Role"]
+    })
+    
+    return {
+        "message": "User registered successfully",
+        "token": token,
+        "user": {
+            "UserName_PK": new_user['UserName_PK'],
+            "Email": new_user['Email'],
+            "Role": new_user['Role'],
+            "Location": new_user['Location'],
+            "CreatedAt": new_user['CreatedAt'].isoformat() if new_user['CreatedAt'] else None
+        }
+    }
+
+
+# LOGIN
+@router.post("/login")
+async def login(user: UserLogin):
+    db_user = await run_in_threadpool(_get_user_by_email, user.email)
+    
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid user")
+    
+    valid, new_hash = await verify_and_update_async(user.password, db_user['Password'])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid password")
+    
+    # Rehash legacy plain-text passwords (or old cost factors) on successful login
+    if new_hash:
+        await run_in_threadpool(_store_password_hash, db_user['UserName_PK'], db_user['Password'], new_hash)
+    
+    token = create_access_token({
+        "sub": db_user['UserName_PK'],
+        "role": db_user['Role']
+    })
+    
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "user": {
+            "UserName_PK": db_user['UserName_PK'],
+            "Email": db_user['Email'],
+            "Role": db_user['Role'],
+            "Location": db_user['Location'],
+            "CreatedAt": db_user['CreatedAt'].isoformat() if db_user['CreatedAt'] else None
+        }
+    }
+
+
+# GET the user behind the bearer token
+@router.get("/me")
+def get_me(user=Depends(current_user)):
+    return user
@@ -0,0 +1,310 @@
+"""
+Search-box suggestions for equipment names and categories.
+
+Every worker keeps a prefix index in memory: a sorted list of match keys
+(each word start of a name, and each category) searched with bisect. A term
+weighs the popularity of the listings behind it (1 + their reservations),
+and the top suggestions of every busy prefix (more than SCAN_LIMIT keys) are
+precomputed at build and adjusted in place as weights change, so short
+prefixes like "c" never rescan thousands of keys.
+
+Writes on this worker are applied right after commit. Writes on other
+workers are picked up from 'equipment.changed' outbox events every
+SYNC_SECONDS, and a periodic full rebuild catches what events don't cover
+(popularity drift, listings removed by cascades).
+"""
+import asyncio
+import bisect
+import heapq
+import threading
+import time
+from collections import deque
+
+from fastapi import APIRouter
+
+from .database import get_read_db
+
+router = APIRouter()
+
+DEFAULT_LIMIT = 8
+MAX_SUGGESTIONS = 10
+# Prefixes matching more keys than this get their top suggestions cached
+SCAN_LIMIT = 64
+# Other workers' writes show up here within this many seconds
+SYNC_SECONDS = 5
+# Outbox events are re-read for this long, so transactions that commit out of id order are not missed
+SYNC_OVERLAP_SECONDS = 30
+FULL_REBUILD_SECONDS = 60 * 60
+
+_POPULARITY = """
+    SELECT e.equipment_id, e.name, e.category,
+           1 + COUNT(r.reservation_id) FILTER (WHERE r.status <> 'cancelled') AS popularity
+    FROM equipment e
+    LEFT JOIN reservation r ON r.equipment_id = e.equipment_id
+    WHERE e.status <> 'unavailable' {condition}
+    GROUP BY e.equipment_id
+"""
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def _terms_of(name, category):
+    """(term id, display text) pairs a listing contributes to"""
+    terms = []
+    if name and _normalize(name):
+        terms.append(("name\0" + _normalize(name), name.strip()))
+    if category and _normalize(category):
+        terms.append(("category\0" + _normalize(category), category.strip()))
+    return terms
+
+
+def _match_keys(term_id: str):
+    """Keys a term is found under: every word start of its text, each followed by the term id"""
+    text = term_id.partition("\0")[2]
+    words = text.split(" ")
+    return [" ".join(words[i:]) + "\0" + term_id for i in range(len(words))]
+
+
+def _top(keys, terms, top, prefix, lo, hi):
+    """
+    Best MAX_SUGGESTIONS term ids among keys[lo:hi], the keys starting with
+    `prefix`. Busy prefixes are answered from, or stored in, `top`, and are
+    computed by merging the lists of their one-character-longer children, so
+    only small ranges are ever scanned key by key.
+    """
+    def order(term_id):
+        return -terms[term_id][1], term_id
+
+    if hi - lo <= SCAN_LIMIT:
+        return heapq.nsmallest(MAX_SUGGESTIONS, {key.partition("\0")[2] for key in keys[lo:hi]}, key=order)
+    if prefix in top:
+        return top[prefix]
+
+    candidates = set()
+    depth = len(prefix)
+    i = lo
+    while i < hi:
+        key = keys[i]
+        if key[depth] == "\0":
+            # The key's text is the prefix itself
+            candidates.add(key[depth + 1:])
+            i += 1
+            continue
+        child = key[:depth + 1]
+        end = bisect.bisect_left(keys, child + "\U0010ffff", i, hi)
+        candidates.update(_top(keys, terms, top, child, i, end))
+        i = end
+    ranked = heapq.nsmallest(MAX_SUGGESTIONS, candidates, key=order)
+    if prefix:
+        top[prefix] = ranked
+    return ranked
+
+
+class SuggestIndex:
+    def __init__(self):
+        self.lock = threading.Lock()            # guards the structures below
+        self.refresh_lock = threading.Lock()    # one rebuild/sync at a time
+        self.listings = {}     # equipment_id -> (name, category, popularity)
+        self.terms = {}        # term id ('name\0<text>' / 'category\0<text>') -> [display, weight, listings]
+        self.keys = []         # sorted match keys
+        self.top = {}          # cached prefix -> term ids by weight, at most MAX_SUGGESTIONS
+        self.marks = deque()   # (monotonic time, highest outbox id seen) per sync
+        self.built_at = 0.0
+        self.stats = {"full_builds": 0, "syncs": 0, "applied": 0, "terms": 0, "last_build_ms": None}
+
+    # Terms
+
+    def _order(self, term_id):
+        """Sort key: heaviest first, ties by text"""
+        return -self.terms[term_id][1], term_id
+
+    def _add_term(self, term_id, display, popularity):
+        term = self.terms.get(term_id)
+        if term is None:
+            term = self.terms[term_id] = [display, 0, 0]
+            for key in _match_keys(term_id):
+                bisect.insort(self.keys, key)
+        term[1] += popularity
+        term[2] += 1
+        # A heavier term can only move up in the cached lists it belongs to
+        for prefix in self._cached_prefixes(term_id):
+            ranked = self.top[prefix]
+            if term_id not in ranked:
+                if len(ranked) == MAX_SUGGESTIONS and self._order(ranked[-1]) < self._order(term_id):
+                    continue
+                ranked.append(term_id)
+            ranked.sort(key=self._order)
+            del ranked[MAX_SUGGESTIONS:]
+
+    def _remove_term(self, term_id, popularity):
+        term = self.terms[term_id]
+        term[1] -= popularity
+        term[2] -= 1
+        # A lighter term may drop out of a cached list; those are rebuilt from their children on next use
+        for prefix in self._cached_prefixes(term_id):
+            if term_id in self.top[prefix]:
+                del self.top[prefix]
+        if term[2] == 0:
+            del self.terms[term_id]
+            for key in _match_keys(term_id):
+                i = bisect.bisect_left(self.keys, key)
+                if i < len(self.keys) and self.keys[i] == key:
+                    del self.keys[i]
+
+    def _cached_prefixes(self, term_id):
+        if not self.top:
+            return []
+        prefixes = set()
+        for key in _match_keys(term_id):
+            text = key.partition("\0")[0]
+            prefixes.update(prefix for prefix in (text[:n] for n in range(1, len(text) + 1))
+                            if prefix in self.top)
+        return prefixes
+
+    # Listings
+
+    def _apply(self, equipment_id, row):
+        """Replace one listing's contribution; `row` is (name, category, popularity) or None if gone"""
+        old = self.listings.get(equipment_id)
+        if old == row:
+            return
+        if old is not None:
+            for term_id, _ in _terms_of(old[0], old[1]):
+                self._remove_term(term_id, old[2])
+            del self.listings[equipment_id]
+        if row is not None:
+            for term_id, display in _terms_of(row[0], row[1]):
+                self._add_term(term_id, display, row[2])
+            self.listings[equipment_id] = row
+        self.stats["applied"] += 1
+
+    def apply(self, equipment):
+        """Write hook: apply a created/updated listing as returned by the write"""
+        with self.lock:
+            if self.built_at:
+                old = self.listings.get(equipment['equipment_id'])
+                row = None
+                if equipment.get('status') != 'unavailable':
+                    row = (equipment['name'], equipment['category'], old[2] if old else 1)
+                self._apply(equipment['equipment_id'], row)
+
+    def remove(self, equipment_id: int):
+        """Write hook: drop a deleted listing"""
+        with self.lock:
+            if self.built_at:
+                self._apply(equipment_id, None)
+
+    # Lookup
+
+    def _ranked(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + "\U0010ffff")
+        return _top(self.keys, self.terms, self.top, prefix, lo, hi)
+
+    def suggest(self, q: str, limit: int = DEFAULT_LIMIT):
+        prefix = _normalize(q)
+        if not prefix:
+            return []
+        with self.lock:
+            suggestions = []
+            for term_id in self._ranked(prefix)[:limit]:
+                display, weight, listings = self.terms[term_id]
+                suggestions.append({
+                    "text": display,
+                    "type": term_id.partition("\0")[0],
+                    "listings": listings,
+                    "score": weight,
+                })
+            return suggestions
+
+    # Loading
+
+    def refresh(self, full: bool = False):
+        """Full rebuild when due, otherwise apply listings named by new outbox events"""
+        with self.refresh_lock:
+            full = full or not self.built_at or time.monotonic() - self.built_at >= FULL_REBUILD_SECONDS
+            started = time.perf_counter()
+            conn = get_read_db()
+            try:
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                cursor = conn.cursor()
+                if full:
+                    self._rebuild(cursor)
+                else:
+                    self._sync(cursor)
+                conn.rollback()
+                cursor.close()
+            finally:
+                conn.close()
+            if full:
+                self.stats["last_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _rebuild(self, cursor):
+        # Events from here on are replayed by the next syncs
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM outbox")
+        watermark = cursor.fetchone()[0]
+        cursor.execute(_POPULARITY.format(condition=""))
+        listings = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+        terms = {}
+        for name, category, popularity in listings.values():
+            for term_id, display in _terms_of(name, category):
+                term = terms.setdefault(term_id, [display, 0, 0])
+                term[1] += popularity
+                term[2] += 1
+        keys = sorted(key for term_id in terms for key in _match_keys(term_id))
+        top = {}
+        _top(keys, terms, top, "", 0, len(keys))
+
+        with self.lock:
+            self.listings, self.terms, self.keys, self.top = listings, terms, keys, top
+            self.marks = deque([(time.monotonic(), watermark)])
+            self.built_at = time.monotonic()
+            self.stats["full_builds"] += 1
+            self.stats["terms"] = len(terms)
+
+    def _sync(self, cursor):
+        now = time.monotonic()
+        while len(self.marks) > 1 and self.marks[1][0] <= now - SYNC_OVERLAP_SECONDS:
+            self.marks.popleft()
+        since = self.marks[0][1]
+        cursor.execute("""
+            SELECT array_agg(DISTINCT aggregate_id), MAX(id)
+            FROM outbox
+            WHERE id > %s AND event_type = 'equipment.changed'
+        """, (since,))
+        equipment_ids, watermark = cursor.fetchone()
+        self.marks.append((now, max(watermark or 0, self.marks[-1][1])))
+        if not equipment_ids:
+            return
+
+        cursor.execute(_POPULARITY.format(condition="AND e.equipment_id = ANY(%s)"), (equipment_ids,))
+        rows = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+        with self.lock:
+            for equipment_id in equipment_ids:
+                self._apply(equipment_id, rows.get(equipment_id))
+            self.stats["syncs"] += 1
+            self.stats["terms"] = len(self.terms)
+
+
+index = SuggestIndex()
+
+
+async def run_forever():
+    """Build this worker's index at startup, then keep it in sync"""
+    while True:
+        try:
+            await asyncio.to_thread(index.refresh)
+        except Exception as e:
+            print(f"[autocomplete] refresh failed: {e}")
+        await asyncio.sleep(SYNC_SECONDS)
+
+
+# GET name and category suggestions for the search box, most popular first
+@router.get("/suggest")
+def suggest_equipment(q: str = "", limit: int = DEFAULT_LIMIT):
+    if not index.built_at:
+        index.refresh()
+    return {"q": q, "suggestions": index.suggest(q, min(max(limit, 1), MAX_SUGGESTIONS))}
@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+from .singleflight import fetch_shared
+
+router = APIRouter()
+
+
+# GET category/status counts and price ranges for the catalog sidebar
+@router.get("/facets")
+def get_equipment_facets():
+    """
+    Served from the equipment_facets materialized view (refreshed by the
+    scheduler), so it never scans the equipment table
+    """
+    rows = fetch_shared("""
+        SELECT category, count, available, booked, unavailable,
+               min_price, median_price, max_price, refreshed_at
+        FROM equipment_facets
+        ORDER BY category
+    """, many=True)
+    
+    status_totals = {"available": 0, "booked": 0, "unavailable": 0}
+    categories = []
+    for row in rows:
+        for status in status_totals:
+            status_totals[status] += row[status]
+        categories.append({
+            "category": row['category'],
+            "count": row['count'],
+            "status": {status: row[status] for status in status_totals},
+            "min_price": float(row['min_price']),
+            "median_price": round(float(row['median_price']), 2),
+            "max_price": float(row['max_price'])
+        })
+    
+    return {
+        "total": sum(category['count'] for category in categories),
+        "status": status_totals,
+        "categories": categories,
+        "refreshed_at": rows[0]['refreshed_at'] if rows else None
+    }
@@ -0,0 +1,108 @@
+"""
+Maintained row counters.
+
+Triggers from counters.sql append signed deltas to counter_delta in the
+writing transaction; reading a count sums the few rows left for it since
+the last compaction, instead of scanning the table. Counters are named
+'<name>' (total) and '<name>.<column>:<value>' (per group).
+
+For very large tables where an estimate is enough, `approximate=True`
+reads the planner's row estimate from pg_class instead.
+"""
+from fastapi import APIRouter, Depends
+from psycopg2.extras import RealDictCursor
+
+from .database import get_read_db
+from .identity import require_role
+
+router = APIRouter()
+
+# counter name -> (table, grouped columns), matching the triggers in counters.sql
+TRACKED = {
+    "users": ('"User"', ("Role", "VerificationStatus")),
+    "reports": ("report", ("status", "priority")),
+}
+
+
+def read(cursor, names=None) -> dict:
+    """Exact counts: {name: {"count": n, "<column>": {value: n}}}"""
+    names = list(names or TRACKED)
+    cursor.execute("""
+        SELECT counter, SUM(delta) AS value
+        FROM counter_delta
+        WHERE split_part(counter, '.', 1) = ANY(%s)
+        GROUP BY counter
+    """, (names,))
+    result = {name: {"count": 0, **{column: {} for column in TRACKED[name][1]}} for name in names}
+    for row in cursor.fetchall():
+        name, _, group = row['counter'].partition(".")
+        value = int(row['value'])
+        if not group:
+            result[name]["count"] = value
+        elif value:
+            column, _, key = group.partition(":")
+            result[name].setdefault(column, {})[key] = value
+    return result
+
+
+def estimate(cursor, name: str):
+    """Planner row estimate for a tracked table, scaled to its current size; None if never analyzed"""
+    cursor.execute("""
+        SELECT CASE WHEN c.reltuples < 0 OR c.relpages = 0 THEN NULL
+               ELSE (c.reltuples / c.relpages
+                     * (pg_relation_size(c.oid) / current_setting('block_size')::int))::bigint
+               END AS estimate
+        FROM pg_class c
+        WHERE c.oid = %s::regclass
+    """, (TRACKED[name][0],))
+    row = cursor.fetchone()
+    return row['estimate'] if row else None
+
+
+def count(name: str, approximate: bool = False) -> dict:
+    """Counts for one counter; the approximate total falls back to exact if there is no estimate"""
+    conn = get_read_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        if approximate:
+            total = estimate(cursor, name)
+            if total is not None:
+                cursor.close()
+                return {"count": total, "approximate": True}
+        result = read(cursor, [name])[name]
+        cursor.close()
+        return dict(result, approximate=False)
+    finally:
+        conn.close()
+
+
+def compact(cursor):
+    """Fold each counter's deltas into one row; returns the number of rows removed"""
+    cursor.execute("""
+        WITH folded AS (
+            DELETE FROM counter_delta
+            RETURNING counter, delta
+        ), inserted AS (
+            INSERT INTO counter_delta (counter, delta)
+            SELECT counter, SUM(delta)
+            FROM folded
+            GROUP BY counter
+            HAVING SUM(delta) <> 0
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM folded) - (SELECT COUNT(*) FROM inserted)
+    """)
+    return cursor.fetchone()[0]
+
+
+# GET all maintained counters in one call (admin dashboard)
+@router.get("/stats")
+def get_admin_stats(admin=Depends(require_role("Admin"))):
+    conn = get_read_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        stats = read(cursor)
+        cursor.close()
+        return stats
+    finally:
+        conn.close()
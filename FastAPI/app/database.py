@@ -1,6 +1,8 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import threading
+import time
 
 # Database connection parameters
 DB_PARAMS = {
@@ -11,6 +13,18 @@ DB_PARAMS = {
     'port': 5432
 }
 
+# Read replicas, as comma-separated libpq DSNs/URIs, e.g.
+# GEARSHARE_REPLICA_DSNS="postgresql://postgres:pw@replica1/GearShare,postgresql://postgres:pw@replica2/GearShare"
+REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("GEARSHARE_REPLICA_DSNS", "").split(",") if dsn.strip()]
+# Replicas further behind than this are skipped until they catch up
+MAX_REPLICA_LAG_SECONDS = 5.0
+# Lag is re-checked on a replica at most this often
+LAG_CHECK_INTERVAL_SECONDS = 2.0
+# A replica that fails to connect is not retried for this long
+REPLICA_RETRY_SECONDS = 30.0
+# After a user writes, their reads stay on the primary for this long
+READ_YOUR_WRITES_SECONDS = 5.0
+
 def get_db():
     """Create and return a database connection"""
     return psycopg2.connect(**DB_PARAMS)
@@ -20,3 +34,139 @@ def get_db_dict():
     conn = psycopg2.connect(**DB_PARAMS)
     return conn, conn.cursor(cursor_factory=RealDictCursor)
 
+
+class _Replica:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.active = 0
+        self.skip_until = 0.0
+        self.lag_checked_at = 0.0
+
+
+class _ReplicaConnection(psycopg2.extensions.connection):
+    """Connection that releases its replica's active count when closed"""
+    replica = None
+
+    def close(self):
+        if self.replica is not None and not self.closed:
+            with _router.lock:
+                self.replica.active -= 1
+        super().close()
+
+
+class ReplicaRouter:
+    """Pick a read replica (least active connections, round-robin on ties)"""
+
+    def __init__(self, dsns):
+        self.replicas = [_Replica(dsn) for dsn in dsns]
+        self.lock = threading.Lock()
+        self._next = 0
+        self._recent_writers = {}   # username -> time of last write
+        self.stats = {"replica_reads": 0, "primary_reads": 0, "fallbacks": 0}
+
+    def mark_write(self, *usernames):
+        now = time.monotonic()
+        with self.lock:
+            for username in usernames:
+                if username:
+                    self._recent_writers[username] = now
+            if len(self._recent_writers) > 10_000:
+                cutoff = now - READ_YOUR_WRITES_SECONDS
+                self._recent_writers = {u: t for u, t in self._recent_writers.items() if t > cutoff}
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _is_sticky(self, username):
+        if not username:
+            return False
+        written_at = self._recent_writers.get(username)
+        return written_at is not None and time.monotonic() - written_at < READ_YOUR_WRITES_SECONDS
+
+    def _candidates(self):
+        now = time.monotonic()
+        with self.lock:
+            healthy = [r for r in self.replicas if r.skip_until <= now]
+            if not healthy:
+                return []
+            # Rotate first so equally loaded replicas take turns
+            start = self._next % len(healthy)
+            self._next += 1
+            rotated = healthy[start:] + healthy[:start]
+            return sorted(rotated, key=lambda r: r.active)
+
+    def _lag_ok(self, replica, conn):
+        now = time.monotonic()
+        if now - replica.lag_checked_at < LAG_CHECK_INTERVAL_SECONDS:
+            return True
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT CASE
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """)
+        lag = float(cursor.fetchone()[0])
+        cursor.close()
+        conn.rollback()
+        replica.lag_checked_at = now
+        return lag <= MAX_REPLICA_LAG_SECONDS
+
+    def connect(self, username=None):
+        if not self.replicas or self._is_sticky(username):
+            self._count("primary_reads")
+            return get_db()
+
+        for replica in self._candidates():
+            try:
+                conn = psycopg2.connect(replica.dsn, connect_timeout=2, connection_factory=_ReplicaConnection)
+            except psycopg2.OperationalError:
+                replica.skip_until = time.monotonic() + REPLICA_RETRY_SECONDS
+                continue
+            try:
+                if not self._lag_ok(replica, conn):
+                    replica.skip_until = time.monotonic() + LAG_CHECK_INTERVAL_SECONDS
+                    conn.close()
+                    continue
+            except psycopg2.Error:
+                replica.skip_until = time.monotonic() + REPLICA_RETRY_SECONDS
+                conn.close()
+                continue
+            with self.lock:
+                replica.active += 1
+                conn.replica = replica
+            self._count("replica_reads")
+            return conn
+
+        self._count("fallbacks")
+        return get_db()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            return dict(self.stats, replicas=[
+                {"active": r.active, "available": r.skip_until <= now} for r in self.replicas
+            ])
+
+
+_router = ReplicaRouter(REPLICA_DSNS)
+
+
+def get_read_db(username: str = None):
+    """Connection for read-only handlers: a healthy replica, or the primary.
+
+    Reads on behalf of a user who wrote within READ_YOUR_WRITES_SECONDS go
+    to the primary so they see their own changes.
+    """
+    return _router.connect(username)
+
+
+def mark_write(*usernames):
+    """Record that these users just wrote, for read-your-writes stickiness"""
+    _router.mark_write(*usernames)
+
+
+def replica_snapshot():
+    """Read routing counters and replica availability on this worker"""
+    return _router.snapshot()
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, Header, File, UploadFile, Form
+from fastapi import APIRouter, HTTPException, Header, File, UploadFile, Form, Response
 import base64
 from psycopg2.extras import RealDictCursor
-from .database import get_db
+from .database import get_db, get_read_db, mark_write
 from .schemas import EquipmentCreate, EquipmentUpdate, EquipmentResponse
+from .versioning import parse_if_match, set_etag
+from .idempotency import run_idempotent, fingerprint
+from .singleflight import fetch_shared
+from .outbox import enqueue
+from . import autocomplete
 
 router = APIRouter()
 
@@ -10,7 +15,7 @@ router = APIRouter()
 # GET all equipment
 @router.get("/", response_model=list[EquipmentResponse])
 def get_all_equipment(category: str = None, user: str = None):
-    conn = get_db()
+    conn = get_read_db(user)
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
@@ -19,7 +24,7 @@ def get_all_equipment(category: str = None, user: str = None):
                 cursor.execute("""
                     SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
                            owner_username, pickup_location, status, booked_till, rating_avg, 
-                           rating_count, created_at
+                           rating_count, created_at, version
                     FROM equipment
                     WHERE (status != %s OR owner_username = %s) AND category = %s
                 """, ('unavailable', user, category))
@@ -27,7 +32,7 @@ def get_all_equipment(category: str = None, user: str = None):
                 cursor.execute("""
                     SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
                            owner_username, pickup_location, status, booked_till, rating_avg, 
-                           rating_count, created_at
+                           rating_count, created_at, version
                     FROM equipment
                     WHERE (status != %s OR owner_username = %s)
                 """, ('unavailable', user))
@@ -36,7 +41,7 @@ def get_all_equipment(category: str = None, user: str = None):
                 cursor.execute("""
                     SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
                            owner_username, pickup_location, status, booked_till, rating_avg, 
-                           rating_count, created_at
+                           rating_count, created_at, version
                     FROM equipment
                     WHERE status != %s AND category = %s
                 """, ('unavailable', category))
@@ -44,7 +49,7 @@ def get_all_equipment(category: str = None, user: str = None):
                 cursor.execute("""
                     SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
                            owner_username, pickup_location, status, booked_till, rating_avg, 
-                           rating_count, created_at
+                           rating_count, created_at, version
                     FROM equipment
                     WHERE status != %s
                 """, ('unavailable',))
@@ -58,38 +63,33 @@ def get_all_equipment(category: str = None, user: str = None):
 
 # GET equipment by ID
 @router.get("/{equipment_id}", response_model=EquipmentResponse)
-def get_equipment(equipment_id: int):
-    conn = get_db()
-    try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
-                   owner_username, pickup_location, status, booked_till, rating_avg, 
-                   rating_count, created_at
-            FROM equipment
-            WHERE equipment_id = %s
-        """, (equipment_id,))
-        equipment = cursor.fetchone()
-        cursor.close()
-        
-        if not equipment:
-            raise HTTPException(status_code=404, detail="Equipment not found")
-        
-        return equipment
-    finally:
-        conn.close()
+def get_equipment(equipment_id: int, response: Response):
+    # Concurrent requests for the same listing share one DB round trip
+    equipment = fetch_shared("""
+        SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
+               owner_username, pickup_location, status, booked_till, rating_avg, 
+               rating_count, created_at, version
+        FROM equipment
+        WHERE equipment_id = %s
+    """, (equipment_id,))
+    
+    if not equipment:
+        raise HTTPException(status_code=404, detail="Equipment not found")
+    
+    set_etag(response, equipment)
+    return equipment
 
 
 # GET equipment by owner
 @router.get("/owner/{username}", response_model=list[EquipmentResponse])
 def get_user_equipment(username: str):
-    conn = get_db()
+    conn = get_read_db(username)
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
                    owner_username, pickup_location, status, booked_till, rating_avg, 
-                   rating_count, created_at
+                   rating_count, created_at, version
             FROM equipment
             WHERE owner_username = %s
         """, (username,))
@@ -103,45 +103,96 @@ def get_user_equipment(username: str):
 # CREATE equipment
 @router.post("/", response_model=EquipmentResponse)
 def create_equipment(
+    response: Response,
     name: str = Form(...),
     category: str = Form(...),
     daily_price: float = Form(...),
     pickup_location: str = Form(...),
     photo: UploadFile = File(None),
-    owner_username: str = Header(..., alias="owner_username")
+    owner_username: str = Header(..., alias="owner_username"),
+    idempotency_key: str = Header(None, alias="Idempotency-Key")
 ):
+    contents = photo.file.read() if photo else None
     photo_binary_data = None
-    if photo:
-        import io
-        # Read file and convert to base64
-        contents = photo.file.read()
+    if contents is not None:
+        # Convert to base64
         photo_binary_data = base64.b64encode(contents).decode("utf-8")
     
+    # The stored (replayable) response leaves out photo_binary, which can be megabytes
+    def insert_equipment():
+        conn = get_db()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                INSERT INTO equipment (name, category, daily_price, photo_url, photo_binary, 
+                                      pickup_location, owner_username, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING equipment_id, name, category, daily_price, photo_url,
+                         owner_username, pickup_location, status, booked_till, rating_avg, 
+                         rating_count, created_at, version
+            """, (name, category, daily_price, None, photo_binary_data, pickup_location, 
+                  owner_username, 'available'))
+            
+            new_equipment = cursor.fetchone()
+            enqueue(cursor, "equipment.changed", new_equipment['equipment_id'], {"action": "created"})
+            conn.commit()
+            cursor.close()
+            mark_write(owner_username)
+            autocomplete.index.apply(new_equipment)
+            return new_equipment
+        finally:
+            conn.close()
+    
+    new_equipment, replayed = run_idempotent(
+        f"POST /equipment/:{owner_username}",
+        idempotency_key,
+        fingerprint(name, category, daily_price, pickup_location, contents or b""),
+        insert_equipment
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+        photo_binary_data = _stored_photo(new_equipment['equipment_id'])
+    return {**new_equipment, "photo_binary": photo_binary_data}
+
+
+def _stored_photo(equipment_id: int):
     conn = get_db()
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            INSERT INTO equipment (name, category, daily_price, photo_url, photo_binary, 
-                                  pickup_location, owner_username, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING equipment_id, name, category, daily_price, photo_url, photo_binary,
-                     owner_username, pickup_location, status, booked_till, rating_avg, 
-                     rating_count, created_at
-        """, (name, category, daily_price, None, photo_binary_data, pickup_location, 
-              owner_username, 'available'))
-        
-        new_equipment = cursor.fetchone()
-        conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("SELECT photo_binary FROM equipment WHERE equipment_id = %s", (equipment_id,))
+        row = cursor.fetchone()
         cursor.close()
-        return new_equipment
+        return row[0] if row else None
     finally:
         conn.close()
 
 
+# Explain why a conditional write matched no rows: missing row, wrong owner or stale version
+def _raise_write_failure(cursor, equipment_id: int, owner_username: str, expected_version, action: str):
+    cursor.execute("""
+        SELECT owner_username, version
+        FROM equipment
+        WHERE equipment_id = %s
+    """, (equipment_id,))
+    equipment = cursor.fetchone()
+    
+    if not equipment:
+        raise HTTPException(status_code=404, detail="Equipment not found")
+    
+    if equipment['owner_username'] != owner_username:
+        raise HTTPException(status_code=403, detail=f"Not authorized to {action} this equipment")
+    
+    if expected_version is not None and equipment['version'] != expected_version:
+        raise HTTPException(status_code=412, detail="Equipment was modified by another request")
+    
+    raise HTTPException(status_code=409, detail="Equipment changed while processing the request")
+
+
 # UPDATE equipment
 @router.put("/{equipment_id}", response_model=EquipmentResponse)
 def update_equipment(
     equipment_id: int,
+    response: Response,
     name: str = Form(None),
     category: str = Form(None),
     daily_price: float = Form(None),
@@ -149,51 +200,57 @@ def update_equipment(
     photo_url: str = Form(None),
     status: str = Form(None),
     photo: UploadFile = File(None),
-    owner_username: str = Header(..., alias="owner_username")
+    owner_username: str = Header(..., alias="owner_username"),
+    if_match: str = Header(None, alias="If-Match")
 ):
+    expected_version = parse_if_match(if_match)
+    
+    # Build update query
+    updates = {}
+    if name is not None:
+        updates['name'] = name
+    if category is not None:
+        updates['category'] = category
+    if daily_price is not None:
+        updates['daily_price'] = daily_price
+    if pickup_location is not None:
+        updates['pickup_location'] = pickup_location
+    if photo_url is not None:
+        updates['photo_url'] = photo_url
+    if status is not None:
+        updates['status'] = status
+    
+    if photo:
+        contents = photo.file.read()
+        photo_binary_data = base64.b64encode(contents).decode("utf-8")
+        updates['photo_binary'] = photo_binary_data
+        updates['photo_url'] = None
+    
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Get current equipment
-        cursor.execute("""
-            SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
-                   owner_username, pickup_location, status, booked_till, rating_avg, 
-                   rating_count, created_at
-            FROM equipment
-            WHERE equipment_id = %s
-        """, (equipment_id,))
-        equipment = cursor.fetchone()
-        
-        if not equipment:
-            raise HTTPException(status_code=404, detail="Equipment not found")
-        
-        if equipment['owner_username'] != owner_username:
-            raise HTTPException(status_code=403, detail="Not authorized to update this equipment")
-        
-        # Build update query
-        updates = {}
-        if name is not None:
-            updates['name'] = name
-        if category is not None:
-            updates['category'] = category
-        if daily_price is not None:
-            updates['daily_price'] = daily_price
-        if pickup_location is not None:
-            updates['pickup_location'] = pickup_location
-        if photo_url is not None:
-            updates['photo_url'] = photo_url
-        if status is not None:
-            updates['status'] = status
-        
-        if photo:
-            contents = photo.file.read()
-            photo_binary_data = base64.b64encode(contents).decode("utf-8")
-            updates['photo_binary'] = photo_binary_data
-            updates['photo_url'] = None
-        
         if not updates:
+            cursor.execute("""
+                SELECT equipment_id, name, category, daily_price, photo_url, photo_binary,
+                       owner_username, pickup_location, status, booked_till, rating_avg, 
+                       rating_count, created_at, version
+                FROM equipment
+                WHERE equipment_id = %s
+            """, (equipment_id,))
+            equipment = cursor.fetchone()
             cursor.close()
+            
+            if not equipment:
+                raise HTTPException(status_code=404, detail="Equipment not found")
+            
+            if equipment['owner_username'] != owner_username:
+                raise HTTPException(status_code=403, detail="Not authorized to update this equipment")
+
+            if expected_version is not None and equipment['version'] != expected_version:
+                raise HTTPException(status_code=412, detail="Equipment was modified by another request")
+
+            set_etag(response, equipment)
             return equipment
         
         set_clauses = []
@@ -202,21 +259,35 @@ def update_equipment(
             set_clauses.append(f"{field} = %s")
             values.append(value)
         
-        values.append(equipment_id)
+        # Ownership (and version, when If-Match is sent) are checked by the UPDATE itself
+        conditions = "equipment_id = %s AND owner_username = %s"
+        values.extend([equipment_id, owner_username])
+        if expected_version is not None:
+            conditions += " AND version = %s"
+            values.append(expected_version)
         
         query = f"""
             UPDATE equipment
-            SET {', '.join(set_clauses)}
-            WHERE equipment_id = %s
+            SET {', '.join(set_clauses)}, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE {conditions}
             RETURNING equipment_id, name, category, daily_price, photo_url, photo_binary,
                      owner_username, pickup_location, status, booked_till, rating_avg, 
-                     rating_count, created_at
+                     rating_count, created_at, version
         """
         
         cursor.execute(query, values)
         updated_equipment = cursor.fetchone()
+        
+        if not updated_equipment:
+            conn.rollback()
+            _raise_write_failure(cursor, equipment_id, owner_username, expected_version, "update")
+        
+        enqueue(cursor, "equipment.changed", equipment_id, {"action": "updated", "fields": list(updates)})
         conn.commit()
         cursor.close()
+        mark_write(owner_username)
+        autocomplete.index.apply(updated_equipment)
+        set_etag(response, updated_equipment)
         return updated_equipment
     finally:
         conn.close()
@@ -226,28 +297,32 @@ def update_equipment(
 @router.delete("/{equipment_id}")
 def delete_equipment(
     equipment_id: int,
-    owner_username: str = Header(..., alias="owner_username")
+    owner_username: str = Header(..., alias="owner_username"),
+    if_match: str = Header(None, alias="If-Match")
 ):
+    expected_version = parse_if_match(if_match)
+    
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("""
-            SELECT equipment_id, owner_username
-            FROM equipment
-            WHERE equipment_id = %s
-        """, (equipment_id,))
-        equipment = cursor.fetchone()
+        conditions = "equipment_id = %s AND owner_username = %s"
+        values = [equipment_id, owner_username]
+        if expected_version is not None:
+            conditions += " AND version = %s"
+            values.append(expected_version)
         
-        if not equipment:
-            raise HTTPException(status_code=404, detail="Equipment not found")
+        cursor.execute(f"DELETE FROM equipment WHERE {conditions} RETURNING equipment_id", values)
         
-        if equipment['owner_username'] != owner_username:
-            raise HTTPException(status_code=403, detail="Not authorized to delete this equipment")
+        if not cursor.fetchone():
+            conn.rollback()
+            _raise_write_failure(cursor, equipment_id, owner_username, expected_version, "delete")
         
-        cursor.execute("DELETE FROM equipment WHERE equipment_id = %s", (equipment_id,))
+        enqueue(cursor, "equipment.changed", equipment_id, {"action": "deleted"})
         conn.commit()
         cursor.close()
+        mark_write(owner_username)
+        autocomplete.index.remove(equipment_id)
         
         return {"message": "Equipment deleted successfully"}
     finally:
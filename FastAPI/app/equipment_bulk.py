@@ -0,0 +1,391 @@
+"""
+Bulk equipment import and export for rental shops.
+
+Imports stream CSV/NDJSON rows into a temporary staging table with COPY, then
+validate and merge them into `equipment` with a handful of set-based
+statements. Exports stream `COPY ... TO STDOUT` straight to the client.
+"""
+from fastapi import APIRouter, HTTPException, Header, File, UploadFile, Query
+from fastapi.responses import StreamingResponse
+import base64
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import zipfile
+from psycopg2.extras import RealDictCursor
+from .database import get_db, get_read_db, mark_write
+
+router = APIRouter()
+
+MAX_IMPORT_ROWS = 100_000
+# Photos larger than this (uncompressed) are rejected per row
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+# Only the first errors are returned in full; the counts are always exact
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_COLUMNS = ["name", "category", "daily_price", "pickup_location", "status", "photo", "equipment_id"]
+STAGING_COLUMNS = ["line_no", "name", "category", "daily_price", "pickup_location", "status",
+                   "equipment_ref", "photo_binary", "error"]
+EXPORT_COLUMNS = """equipment_id, name, category, daily_price, pickup_location, status,
+                    booked_till, rating_avg, rating_count, created_at"""
+
+
+class _RowStream(io.RawIOBase):
+    """
+    File-like object feeding CSV-encoded staging rows to COPY FROM STDIN.
+    psycopg2 turns exceptions raised from read() into QueryCanceled, so the
+    first error from `rows` ends the stream and is kept in `error` for the
+    caller to re-raise once COPY returns.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self.error = None
+        self._buffer = b""
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while self.error is None and (size < 0 or len(self._buffer) < size):
+            try:
+                row = next(self._rows, None)
+            except Exception as e:
+                self.error = e
+                break
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._buffer += self._text.getvalue().encode("utf-8")
+            self._text.seek(0)
+            self._text.truncate()
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def _parse_records(upload: UploadFile, fmt: str):
+    """Yield (line_no, record dict or None, parse error or None) from the uploaded file"""
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    try:
+        yield from _decoded_records(text, fmt)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+
+
+def _decoded_records(text, fmt: str):
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or "name" not in reader.fieldnames:
+            raise HTTPException(status_code=400, detail=f"CSV header must include: {', '.join(IMPORT_COLUMNS[:4])}")
+        for record in reader:
+            # line_num is the physical line the record ends on (header is line 1)
+            yield reader.line_num, record, None
+    else:
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, None, "invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "each line must be a JSON object"
+                continue
+            yield line_no, record, None
+
+
+def _staging_rows(records, photos):
+    """Turn parsed records into staging rows; only checks that need Python happen here"""
+    for count, (line_no, record, error) in enumerate(records, start=1):
+        if count > MAX_IMPORT_ROWS:
+            raise HTTPException(status_code=413, detail=f"Imports are limited to {MAX_IMPORT_ROWS} rows")
+        if record is None:
+            yield [line_no, None, None, None, None, None, None, None, error]
+            continue
+
+        values = {
+            column: (str(record[column]).strip() if record.get(column) not in (None, "") else None)
+            for column in IMPORT_COLUMNS
+        }
+
+        photo_binary = None
+        photo_name = values["photo"]
+        if photo_name:
+            info = photos.get(os.path.basename(photo_name)) if photos else None
+            if info is None:
+                error = f"photo '{photo_name}' not found in archive"
+            elif info.file_size > MAX_PHOTO_BYTES:
+                error = f"photo '{photo_name}' is larger than {MAX_PHOTO_BYTES // (1024 * 1024)}MB"
+            else:
+                photo_binary = base64.b64encode(photos.zip.read(info)).decode("utf-8")
+
+        yield [line_no, values["name"], values["category"], values["daily_price"], values["pickup_location"],
+               values["status"], values["equipment_id"], photo_binary, error]
+
+
+class _PhotoArchive(dict):
+    """basename -> ZipInfo for the image files in an uploaded zip"""
+
+    def __init__(self, upload: UploadFile):
+        super().__init__()
+        try:
+            self.zip = zipfile.ZipFile(upload.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="photos must be a zip archive")
+        for info in self.zip.infolist():
+            if not info.is_dir():
+                self[os.path.basename(info.filename)] = info
+
+
+# IMPORT equipment in bulk (CSV or NDJSON, optional zip of photos)
+@router.post("/import")
+def import_equipment(
+    file: UploadFile = File(...),
+    photos: UploadFile = File(None),
+    fmt: str = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    owner_username: str = Header(..., alias="owner_username")
+):
+    """
+    Create or update many equipment rows at once. Rows with an equipment_id
+    update that listing (it must belong to the owner); other rows are created.
+    Invalid rows are skipped and reported with their line number.
+    """
+    fmt = fmt or ("ndjson" if (file.filename or "").lower().endswith((".ndjson", ".jsonl")) else "csv")
+    archive = _PhotoArchive(photos) if photos else None
+
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("""
+            CREATE TEMP TABLE equipment_import (
+                line_no INTEGER PRIMARY KEY,
+                name TEXT,
+                category TEXT,
+                daily_price TEXT,
+                pickup_location TEXT,
+                status TEXT,
+                equipment_ref TEXT,
+                photo_binary TEXT,
+                error TEXT,
+                price NUMERIC(10, 2),
+                ref_id INTEGER
+            ) ON COMMIT DROP
+        """)
+
+        stream = _RowStream(_staging_rows(_parse_records(file, fmt), archive))
+        cursor.copy_expert(
+            f"COPY equipment_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            stream
+        )
+        # Missing header (400), too many rows (413), undecodable file (400)
+        if stream.error is not None:
+            conn.rollback()
+            raise stream.error
+
+        # Validate every row in one pass; the first failing rule wins
+        cursor.execute(r"""
+            UPDATE equipment_import
+            SET error = CASE
+                WHEN name IS NULL THEN 'name is required'
+                WHEN length(name) > 150 THEN 'name is longer than 150 characters'
+                WHEN category IS NULL THEN 'category is required'
+                WHEN length(category) > 100 THEN 'category is longer than 100 characters'
+                WHEN daily_price IS NULL THEN 'daily_price is required'
+                WHEN daily_price !~ '^[0-9]{1,8}(\.[0-9]{1,2})?$' THEN 'daily_price must be a positive number with at most 2 decimals'
+                WHEN length(pickup_location) > 255 THEN 'pickup_location is longer than 255 characters'
+                WHEN status IS NOT NULL AND status NOT IN ('available', 'booked', 'unavailable') THEN 'status must be available, booked or unavailable'
+                WHEN equipment_ref IS NOT NULL AND equipment_ref !~ '^[0-9]{1,9}$' THEN 'equipment_id must be an integer'
+            END
+            WHERE error IS NULL
+        """)
+        # Casts only run on rows that passed validation
+        cursor.execute("""
+            UPDATE equipment_import
+            SET price = daily_price::numeric, ref_id = equipment_ref::integer
+            WHERE error IS NULL
+        """)
+        cursor.execute("""
+            UPDATE equipment_import s
+            SET error = 'equipment_id not found for this owner'
+            WHERE s.error IS NULL AND s.ref_id IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM equipment e
+                  WHERE e.equipment_id = s.ref_id AND e.owner_username = %s
+              )
+        """, (owner_username,))
+        cursor.execute("""
+            UPDATE equipment_import s
+            SET error = 'equipment_id appears more than once in the file'
+            WHERE s.error IS NULL AND s.ref_id IS NOT NULL
+              AND EXISTS (
+                  SELECT 1 FROM equipment_import d
+                  WHERE d.ref_id = s.ref_id AND d.line_no < s.line_no AND d.error IS NULL
+              )
+        """)
+
+        cursor.execute("""
+            WITH updated AS (
+                UPDATE equipment e
+                SET name = s.name,
+                    category = s.category,
+                    daily_price = s.price,
+                    pickup_location = s.pickup_location,
+                    status = COALESCE(s.status, e.status),
+                    photo_binary = COALESCE(s.photo_binary, e.photo_binary),
+                    photo_url = CASE WHEN s.photo_binary IS NULL THEN e.photo_url END,
+                    version = e.version + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM equipment_import s
+                WHERE s.error IS NULL AND e.equipment_id = s.ref_id
+                RETURNING e.equipment_id
+            ), events AS (
+                INSERT INTO outbox (event_type, aggregate_id, payload)
+                SELECT 'equipment.changed', equipment_id, '{"action": "updated"}'
+                FROM updated
+                RETURNING 1
+            )
+            SELECT COUNT(*) as count FROM events
+        """)
+        updated = cursor.fetchone()['count']
+
+        cursor.execute("""
+            WITH inserted AS (
+                INSERT INTO equipment (name, category, daily_price, photo_binary,
+                                       pickup_location, owner_username, status)
+                SELECT name, category, price, photo_binary, pickup_location, %s, COALESCE(status, 'available')
+                FROM equipment_import
+                WHERE error IS NULL AND ref_id IS NULL
+                ORDER BY line_no
+                RETURNING equipment_id
+            ), events AS (
+                INSERT INTO outbox (event_type, aggregate_id, payload)
+                SELECT 'equipment.changed', equipment_id, '{"action": "created"}'
+                FROM inserted
+                RETURNING 1
+            )
+            SELECT COUNT(*) as count FROM events
+        """, (owner_username,))
+        created = cursor.fetchone()['count']
+
+        cursor.execute("SELECT COUNT(*) as count FROM equipment_import WHERE error IS NOT NULL")
+        failed = cursor.fetchone()['count']
+        cursor.execute("""
+            SELECT line_no as line, error
+            FROM equipment_import
+            WHERE error IS NOT NULL
+            ORDER BY line_no
+            LIMIT %s
+        """, (MAX_REPORTED_ERRORS,))
+        errors = cursor.fetchall()
+
+        conn.commit()
+        cursor.close()
+        mark_write(owner_username)
+
+        return {
+            "owner_username": owner_username,
+            "created": created,
+            "updated": updated,
+            "failed": failed,
+            "errors": errors
+        }
+    finally:
+        conn.close()
+
+
+class _CopyPipe:
+    """Writable file for COPY TO STDOUT that hands ~64KB chunks to a streaming response"""
+
+    def __init__(self, maxsize: int = 16, chunk_bytes: int = 64 * 1024):
+        self.chunks = queue.Queue(maxsize=maxsize)
+        self._parts = []
+        self._size = 0
+        self._chunk_bytes = chunk_bytes
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.chunks.put(b"".join(self._parts))
+            self._parts, self._size = [], 0
+
+
+# EXPORT an owner's equipment (CSV or NDJSON stream)
+@router.get("/owner/{username}/export")
+def export_equipment(username: str, fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$")):
+    """Stream all equipment of an owner; the CSV can be edited and re-imported"""
+    query = f"""
+        SELECT {EXPORT_COLUMNS}
+        FROM equipment
+        WHERE owner_username = %s
+        ORDER BY equipment_id
+    """
+    conn = get_read_db(username)
+    cursor = conn.cursor()
+    if fmt == "csv":
+        copy_sql = cursor.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", (username,))
+    else:
+        # JSON never contains raw control characters, so \x01/\x02 as CSV
+        # quote/delimiter passes row_to_json output through unescaped
+        copy_sql = cursor.mogrify(
+            f"COPY (SELECT row_to_json(e) FROM ({query}) e) TO STDOUT "
+            "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')",
+            (username,)
+        )
+
+    pipe = _CopyPipe()
+    done = object()
+
+    def produce():
+        try:
+            cursor.copy_expert(copy_sql.decode("utf-8"), pipe)
+            pipe.flush()
+        except Exception as e:
+            pipe.chunks.put(e)
+        finally:
+            pipe.chunks.put(done)
+
+    def stream():
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        finished = False
+        try:
+            while True:
+                chunk = pipe.chunks.get()
+                if chunk is done:
+                    finished = True
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            if not finished:
+                # Client went away mid-export: stop the COPY and unblock the producer
+                conn.cancel()
+                while pipe.chunks.get() is not done:
+                    pass
+            producer.join()
+            cursor.close()
+            conn.close()
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"{username}-equipment.{fmt}"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import select
+import threading
+
+import psycopg2
+from fastapi.encoders import jsonable_encoder
+
+from .database import DB_PARAMS
+
+# Postgres NOTIFY channel shared by every API worker
+CHANNEL = "reservation_events"
+# Idle connections get a heartbeat this often; queued events are flushed with it
+HEARTBEAT_SECONDS = 15.0
+# Events arriving within this window are sent to a client as one batch
+BATCH_WINDOW_SECONDS = 0.05
+MAX_CONNECTIONS = 1000
+MAX_CONNECTIONS_PER_USER = 5
+# Per-connection backlog; a client that falls this far behind is dropped
+MAX_QUEUED_EVENTS = 100
+
+
+def _payload(event_type: str, reservation) -> str:
+    return json.dumps(jsonable_encoder({
+        "type": event_type,
+        "reservation_id": reservation['reservation_id'],
+        "equipment_id": reservation.get('equipment_id'),
+        "owner_username": reservation['owner_username'],
+        "reserver_username": reservation['reserver_username'],
+        "status": reservation.get('status'),
+        "version": reservation.get('version'),
+    }))
+
+
+def notify_reservation(cursor, event_type: str, reservation):
+    """Queue a reservation event on the caller's transaction.
+
+    Postgres only delivers the NOTIFY once the transaction commits, so
+    rolled-back writes never reach clients.
+    """
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, _payload(event_type, reservation)))
+
+
+def notify_reservations(cursor, event_type: str, reservations):
+    """Queue one event per reservation with a single statement"""
+    payloads = [_payload(event_type, reservation) for reservation in reservations]
+    if payloads:
+        cursor.execute("SELECT COUNT(pg_notify(%s, payload)) FROM unnest(%s::text[]) AS payload", (CHANNEL, payloads))
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+class EventBroker:
+    """Fan reservation events out to the SSE/WebSocket clients of this worker"""
+
+    def __init__(self):
+        self._subscribers = {}      # username -> set of asyncio.Queue
+        self._count = 0
+        self._loop = None
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def subscribe(self, username: str) -> asyncio.Queue:
+        queues = self._subscribers.setdefault(username, set())
+        if self._count >= MAX_CONNECTIONS or len(queues) >= MAX_CONNECTIONS_PER_USER:
+            if not queues:
+                del self._subscribers[username]
+            raise TooManyConnections()
+        queue = asyncio.Queue(maxsize=MAX_QUEUED_EVENTS)
+        queues.add(queue)
+        self._count += 1
+        return queue
+
+    def unsubscribe(self, username: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(username)
+        if queues and queue in queues:
+            queues.discard(queue)
+            self._count -= 1
+            if not queues:
+                del self._subscribers[username]
+
+    def dispatch(self, event: dict):
+        """Deliver an event to both parties of the reservation (event loop thread only)"""
+        for username in {event.get('owner_username'), event.get('reserver_username')}:
+            for queue in list(self._subscribers.get(username, ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Slow consumer: close it rather than buffering without bound
+                    self.unsubscribe(username, queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+
+    def dispatch_threadsafe(self, event: dict):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.dispatch, event)
+
+    async def next_batch(self, queue: asyncio.Queue):
+        """Wait for events (or the heartbeat) and return everything queued.
+
+        Returns an empty list on heartbeat and None when the connection
+        was dropped by the broker.
+        """
+        try:
+            first = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            return []
+        if first is None:
+            return None
+        await asyncio.sleep(BATCH_WINDOW_SECONDS)
+        batch = [first]
+        while not queue.empty():
+            event = queue.get_nowait()
+            if event is None:
+                return None
+            batch.append(event)
+        return batch
+
+    def stats(self):
+        return {"connections": self._count, "users": len(self._subscribers)}
+
+
+broker = EventBroker()
+
+
+class NotificationListener(threading.Thread):
+    """LISTEN on the events channel and hand notifications to the broker"""
+
+    def __init__(self):
+        super().__init__(name="reservation-events-listener", daemon=True)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                print(f"Reservation event listener error: {e}; retrying in {backoff:.0f}s")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def _listen(self):
+        conn = psycopg2.connect(**DB_PARAMS)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CHANNEL}")
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        broker.dispatch_threadsafe(json.loads(notify.payload))
+                    except ValueError:
+                        continue
+        finally:
+            conn.close()
+
+
+_listener = None
+
+
+def start_listener():
+    global _listener
+    broker.bind(asyncio.get_running_loop())
+    if _listener is None or not _listener.is_alive():
+        _listener = NotificationListener()
+        _listener.start()
+
+
+def stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,321 @@
+"""
+Pickup locations on the map, and "near me" search.
+
+`pickup_location` is free text: either "lat, lon" as written by the map
+picker in the equipment form, or a place name ("House 4, Dhanmondi, Dhaka").
+Place names are resolved with the bundled gazetteer (data/gazetteer.csv), so
+geocoding needs no network. The outbox worker geocodes each listing after
+it is created or edited, and stores latitude/longitude plus a geohash
+(geo.sql).
+
+Nearby search covers the circle's bounding box with a few geohash cells,
+fetches those cells with btree range scans on the geohash index, and orders
+the survivors by exact great-circle distance.
+
+Listings created before geo.sql was applied are geocoded by
+`python -m app.geo`.
+"""
+import base64
+import binascii
+import csv
+import math
+import os
+import re
+
+import psycopg2
+from fastapi import APIRouter, HTTPException
+from psycopg2.extras import RealDictCursor
+
+from .database import DB_PARAMS, get_read_db
+
+router = APIRouter()
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "gazetteer.csv")
+# ~5 m cells; searches only ever use the first MAX_COVER_PRECISION characters
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+BACKFILL_BATCH_SIZE = 1000
+# A search scans at most this many geohash cells (fewer index ranges once adjacent cells merge)
+MAX_COVER_CELLS = 64
+MAX_COVER_PRECISION = 7
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# More specific places win when a location names several ("Gulshan, Dhaka")
+_KIND_RANK = {"area": 0, "town": 1, "district": 2}
+_COORDINATES = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*[,; ]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", text.casefold().replace("'", "")).split())
+
+
+def _load_gazetteer():
+    """normalized name -> (kind rank, latitude, longitude, name)"""
+    places = {}
+    with open(GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(line for line in f if not line.startswith("#"))
+        for row in rows:
+            place = (_KIND_RANK[row["kind"]], float(row["latitude"]), float(row["longitude"]), row["name"])
+            for name in [row["name"]] + [alias for alias in row["aliases"].split("|") if alias]:
+                places.setdefault(_normalize(name), place)
+    return places
+
+
+_places = _load_gazetteer()
+_longest_name = max(len(name.split()) for name in _places)
+
+
+def geocode(location):
+    """(latitude, longitude) for a pickup location, or None if it can't be placed"""
+    if not location:
+        return None
+    match = _COORDINATES.match(location)
+    if match:
+        lat, lon = float(match.group(1)), float(match.group(2))
+        return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+    words = _normalize(location).split()
+    best = None
+    for size in range(min(_longest_name, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            place = _places.get(" ".join(words[start:start + size]))
+            # Most specific kind first, then the longer name, then the earlier mention
+            if place and (best is None or place[0] < best[0]):
+                best = place
+    return (best[1], best[2]) if best else None
+
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision: int):
+    """(height, width) of a geohash cell in degrees"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(lat: float, lon: float, radius_km: float):
+    """
+    Geohash ranges covering the circle, as (first cell, last cell) pairs: the
+    cells overlapping its bounding box at the finest precision that needs at
+    most MAX_COVER_CELLS of them, with runs of consecutive cells merged
+    """
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180
+    d_lat = radius_km / km_per_degree
+    # Degrees of longitude are shortest at the box edge farthest from the equator
+    d_lon = d_lat / math.cos(math.radians(min(abs(lat) + d_lat, 89.9)))
+    south, north = max(-90.0, lat - d_lat), min(90.0, lat + d_lat)
+    west, east = lon - d_lon, lon + d_lon
+
+    for precision in range(MAX_COVER_PRECISION, 0, -1):
+        height, width = _cell_size(precision)
+        first_row, first_col = math.floor((south + 90) / height), math.floor((west + 180) / width)
+        rows = math.floor((north + 90) / height) - first_row + 1
+        cols = min(math.floor((east + 180) / width) - first_col + 1, round(360 / width))
+        if rows * cols <= MAX_COVER_CELLS:
+            break
+
+    cells = sorted({
+        encode_geohash(min((first_row + row + 0.5) * height - 90, 90.0),
+                       ((first_col + col + 0.5) * width) % 360 - 180,
+                       precision)
+        for row in range(rows) for col in range(cols)
+    })
+    ranges = []
+    for cell in cells:
+        if ranges and _geohash_value(cell) == _geohash_value(ranges[-1][1]) + 1:
+            ranges[-1][1] = cell
+        else:
+            ranges.append([cell, cell])
+    return [tuple(cell_range) for cell_range in ranges]
+
+
+def _geohash_value(geohash: str) -> int:
+    value = 0
+    for char in geohash:
+        value = value * 32 + _BASE32.index(char)
+    return value
+
+
+def _encode_cursor(distance: float, equipment_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{distance!r}|{equipment_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        distance, equipment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(distance), int(equipment_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def locate(cursor, equipment_id: int):
+    """Geocode one listing's pickup location; used by the outbox worker"""
+    cursor.execute("SELECT pickup_location FROM equipment WHERE equipment_id = %s", (equipment_id,))
+    row = cursor.fetchone()
+    if not row:
+        return
+    point = geocode(row['pickup_location'])
+    lat, lon = point or (None, None)
+    geohash = encode_geohash(lat, lon) if point else None
+    cursor.execute("""
+        UPDATE equipment
+        SET latitude = %s, longitude = %s, geohash = %s
+        WHERE equipment_id = %s AND geohash IS DISTINCT FROM %s
+    """, (lat, lon, geohash, equipment_id, geohash))
+
+
+def _nearest(db_cursor, lat, lon, radius, category, after, limit):
+    """Listings within `radius` km ordered by distance, after the (distance, equipment_id) cursor"""
+    ranges = covering_cells(lat, lon, radius)
+    values = [lat, lat, lon]
+    for first, last in ranges:
+        # '{' sorts right after 'z', the last geohash character
+        values += [first, last + "{"]
+    conditions = [
+        "(" + " OR ".join("(geohash >= %s AND geohash < %s)" for _ in ranges) + ")",
+        "status <> 'unavailable'",
+    ]
+    if category and category != 'All':
+        conditions.append("category = %s")
+        values.append(category)
+    page = "distance_km <= %s"
+    values.append(radius)
+    if after:
+        page += " AND (distance_km, equipment_id) > (%s, %s)"
+        values.extend(after)
+    values.append(limit)
+
+    db_cursor.execute(f"""
+        SELECT * FROM (
+            SELECT equipment_id, name, category, daily_price, photo_url, owner_username,
+                   pickup_location, status, booked_till, rating_avg, rating_count,
+                   latitude, longitude,
+                   {2 * EARTH_RADIUS_KM} * asin(LEAST(1, sqrt(
+                       power(sin(radians(latitude - %s) / 2), 2)
+                       + cos(radians(%s)) * cos(radians(latitude)) * power(sin(radians(longitude - %s) / 2), 2)
+                   ))) AS distance_km
+            FROM equipment
+            WHERE {' AND '.join(conditions)}
+        ) candidates
+        WHERE {page}
+        ORDER BY distance_km, equipment_id
+        LIMIT %s
+    """, values)
+    return db_cursor.fetchall()
+
+
+# GET listings near a point (or a place name), nearest first
+@router.get("/nearby")
+def get_nearby_equipment(
+    lat: float = None,
+    lon: float = None,
+    place: str = None,
+    radius: float = DEFAULT_RADIUS_KM,
+    category: str = None,
+    cursor: str = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    """`radius` is in km. Pass `next_cursor` back as `cursor` for the next page."""
+    if lat is None or lon is None:
+        if not place:
+            raise HTTPException(status_code=400, detail="Pass lat and lon, or place")
+        point = geocode(place)
+        if not point:
+            raise HTTPException(status_code=404, detail="Unknown place")
+        lat, lon = point
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="lat must be within ±90 and lon within ±180")
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"radius must be between 0 and {MAX_RADIUS_KM} km")
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    after = _decode_cursor(cursor) if cursor else None
+
+    # Dense areas fill a page well inside the radius, so search a small
+    # circle first and widen it only while the page isn't full
+    reach = min(radius, max(radius / 16, after[0] * 1.5 if after else 0))
+    conn = get_read_db()
+    try:
+        db_cursor = conn.cursor(cursor_factory=RealDictCursor)
+        while True:
+            rows = _nearest(db_cursor, lat, lon, reach, category, after, limit + 1)
+            if len(rows) > limit or reach >= radius:
+                break
+            reach = min(radius, reach * 4)
+        db_cursor.close()
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "radius_km": radius,
+        "items": rows,
+        "next_cursor": _encode_cursor(rows[-1]['distance_km'], rows[-1]['equipment_id']) if has_more else None,
+    }
+
+
+def backfill():
+    """Geocode every listing that has no coordinates yet; returns the number placed"""
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        cursor = conn.cursor()
+        placed, after = 0, 0
+        while True:
+            cursor.execute("""
+                SELECT equipment_id, pickup_location
+                FROM equipment
+                WHERE geohash IS NULL AND equipment_id > %s
+                ORDER BY equipment_id
+                LIMIT %s
+            """, (after, BACKFILL_BATCH_SIZE))
+            rows = cursor.fetchall()
+            if not rows:
+                return placed
+            after = rows[-1][0]
+            located = []
+            for equipment_id, location in rows:
+                point = geocode(location)
+                if point:
+                    located.append((equipment_id, point[0], point[1], encode_geohash(*point)))
+            if located:
+                cursor.execute("""
+                    UPDATE equipment e
+                    SET latitude = v.latitude, longitude = v.longitude, geohash = v.geohash
+                    FROM unnest(%s::int[], %s::float8[], %s::float8[], %s::text[])
+                         AS v(equipment_id, latitude, longitude, geohash)
+                    WHERE e.equipment_id = v.equipment_id
+                """, tuple(map(list, zip(*located))))
+            conn.commit()
+            placed += len(located)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(f"[geo] geocoded {backfill()} listings")
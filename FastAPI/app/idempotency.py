@@ -0,0 +1,207 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from psycopg2.extras import RealDictCursor, Json
+
+from .database import get_db
+
+# How long a stored response can be replayed for a repeated Idempotency-Key
+KEY_TTL_SECONDS = 24 * 60 * 60
+# A claimed key with no response yet can be taken over after this long, so a
+# request that died mid-way doesn't block retries until KEY_TTL_SECONDS
+CLAIM_LEASE_SECONDS = 60
+# Upper bound on responses kept in the in-process front cache
+MEMORY_CACHE_SIZE = 1_000
+# Expired rows are purged from the table at most this often (per process)
+PURGE_INTERVAL_SECONDS = 10 * 60
+MAX_KEY_LENGTH = 255
+
+_cache = OrderedDict()          # (scope, key) -> (expires_at, request_hash, response)
+_inflight = {}                  # (scope, key) -> threading.Event
+_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def fingerprint(*parts) -> str:
+    """Hash the parts of a request that must match for a key to be replayed"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, bytes):
+            part = repr(part).encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def _cache_get(cache_key, request_hash):
+    entry = _cache.get(cache_key)
+    if not entry:
+        return None
+    expires_at, stored_hash, response = entry
+    if expires_at < time.time():
+        _cache.pop(cache_key, None)
+        return None
+    if stored_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    _cache.move_to_end(cache_key)
+    return response
+
+
+def _cache_put(cache_key, request_hash, response, expires_at):
+    _cache[cache_key] = (expires_at, request_hash, response)
+    _cache.move_to_end(cache_key)
+    while len(_cache) > MEMORY_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _purge_expired(cursor):
+    global _last_purge
+    now = time.time()
+    if now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = now
+    cursor.execute("DELETE FROM idempotency_key WHERE expires_at < CURRENT_TIMESTAMP")
+
+
+def _claim(scope: str, key: str, request_hash: str):
+    """Insert a placeholder row for the key, leased for CLAIM_LEASE_SECONDS.
+
+    Returns None when this request owns the key and must run the handler,
+    or the stored response when the key was already completed.
+    """
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        _purge_expired(cursor)
+        cursor.execute("""
+            DELETE FROM idempotency_key
+            WHERE scope = %s AND idem_key = %s AND expires_at < CURRENT_TIMESTAMP
+        """, (scope, key))
+        cursor.execute("""
+            INSERT INTO idempotency_key (scope, idem_key, request_hash, expires_at)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+            ON CONFLICT (scope, idem_key) DO NOTHING
+            RETURNING idem_key
+        """, (scope, key, request_hash, CLAIM_LEASE_SECONDS))
+        claimed = cursor.fetchone()
+
+        if not claimed:
+            cursor.execute("""
+                SELECT request_hash, response, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP) as ttl
+                FROM idempotency_key
+                WHERE scope = %s AND idem_key = %s
+            """, (scope, key))
+            existing = cursor.fetchone()
+
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    if claimed:
+        return None
+
+    if not existing:
+        # Row expired and was purged between the INSERT and the SELECT
+        return _claim(scope, key, request_hash)
+
+    if existing['request_hash'] != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+    if existing['response'] is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    with _lock:
+        _cache_put((scope, key), request_hash, existing['response'], time.time() + float(existing['ttl']))
+    return existing['response']
+
+
+def _complete(scope: str, key: str, response):
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE idempotency_key
+            SET response = %s, expires_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+            WHERE scope = %s AND idem_key = %s
+        """, (Json(response), KEY_TTL_SECONDS, scope, key))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def _release(scope: str, key: str):
+    """Drop the placeholder of a failed request so the client can retry it"""
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM idempotency_key
+            WHERE scope = %s AND idem_key = %s AND response IS NULL
+        """, (scope, key))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def run_idempotent(scope: str, key: str, request_hash: str, handler):
+    """Run `handler` at most once per (scope, key) and replay its response.
+
+    Returns `(response, replayed)`. Without a key the handler simply runs.
+    Concurrent duplicates in this process wait for the first one to finish;
+    duplicates in other workers get a 409 until the first one completes.
+    """
+    if not key:
+        return handler(), False
+
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    cache_key = (scope, key)
+    while True:
+        with _lock:
+            cached = _cache_get(cache_key, request_hash)
+            if cached is not None:
+                return cached, True
+
+            event = _inflight.get(cache_key)
+            if event is None:
+                event = threading.Event()
+                _inflight[cache_key] = event
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            break
+
+        # Another thread is running the same request; wait for it and re-check
+        if not event.wait(CLAIM_LEASE_SECONDS):
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    try:
+        stored = _claim(scope, key, request_hash)
+        if stored is not None:
+            return stored, True
+
+        try:
+            response = jsonable_encoder(handler())
+        except BaseException:
+            _release(scope, key)
+            raise
+
+        _complete(scope, key, response)
+        with _lock:
+            _cache_put(cache_key, request_hash, response, time.time() + KEY_TTL_SECONDS)
+        return response, False
+    finally:
+        with _lock:
+            _inflight.pop(cache_key, None)
+        event.set()
@@ -0,0 +1,128 @@
+"""
+Bearer-token identity for route dependencies.
+
+Verified tokens are cached by SHA-256 of the token until they expire, and
+user records for a few seconds, so authenticating a request is a hash and
+two dict lookups instead of a JWT decode and a database round trip.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, Header, HTTPException
+from jose import JWTError, jwt
+from psycopg2.extras import RealDictCursor
+
+from .database import get_read_db
+from .security import SECRET_KEY, ALGORITHM
+
+# Upper bound on verified tokens kept in memory
+TOKEN_CACHE_SIZE = 10_000
+# User records (role, verification) are re-read after this long
+USER_CACHE_TTL_SECONDS = 30
+USER_CACHE_SIZE = 10_000
+
+_tokens = OrderedDict()         # sha256(token) -> (exp, claims)
+_users = OrderedDict()          # username -> (expires_at, user)
+_lock = threading.Lock()
+stats = {"token_hits": 0, "token_misses": 0, "user_hits": 0, "user_misses": 0}
+
+
+def _unauthorized(detail: str):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def verify_token(token: str) -> dict:
+    """Claims of a valid token; raises 401 for invalid or expired tokens"""
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    now = time.time()
+    with _lock:
+        entry = _tokens.get(key)
+        if entry and entry[0] > now:
+            _tokens.move_to_end(key)
+            stats["token_hits"] += 1
+            return entry[1]
+
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _unauthorized("Invalid or expired token")
+    if not claims.get("sub") or not claims.get("exp"):
+        raise _unauthorized("Invalid token")
+
+    with _lock:
+        stats["token_misses"] += 1
+        _tokens[key] = (claims["exp"], claims)
+        _tokens.move_to_end(key)
+        while len(_tokens) > TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+    return claims
+
+
+def load_user(username: str):
+    """User record for a username (cached for USER_CACHE_TTL_SECONDS), or None"""
+    now = time.monotonic()
+    with _lock:
+        entry = _users.get(username)
+        if entry and entry[0] > now:
+            stats["user_hits"] += 1
+            return entry[1]
+
+    conn = get_read_db(username)
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("""
+            SELECT "UserName_PK", "Email", "Role", "Location", "VerificationStatus"
+            FROM "User"
+            WHERE "UserName_PK" = %s
+        """, (username,))
+        user = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+
+    with _lock:
+        stats["user_misses"] += 1
+        _users[username] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+        _users.move_to_end(username)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return user
+
+
+def invalidate_user(username: str):
+    """Drop a cached user record after its role or status changes"""
+    with _lock:
+        _users.pop(username, None)
+
+
+def optional_user(authorization: str = Header(None)):
+    """The authenticated user, or None when no bearer token was sent"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise _unauthorized("Authorization header must be 'Bearer <token>'")
+
+    claims = verify_token(token.strip())
+    user = load_user(claims["sub"])
+    if not user:
+        raise _unauthorized("User no longer exists")
+    return user
+
+
+def current_user(user=Depends(optional_user)):
+    """The authenticated user; 401 without a bearer token"""
+    if user is None:
+        raise _unauthorized("Not authenticated")
+    return user
+
+
+def require_role(*roles: str):
+    """Dependency that also requires one of the given roles"""
+    def check(user=Depends(current_user)):
+        if user["Role"] not in roles:
+            raise HTTPException(status_code=403, detail="Not allowed for this role")
+        return user
+    return check
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -5,19 +7,60 @@ import os
 
 from .auth import router as auth_router
 from .equipment import router as equipment_router
+from .equipment_bulk import router as equipment_bulk_router
+from .catalog import router as catalog_router
+from .recommendations import router as recommendations_router
+from .rankings import router as rankings_router
+from .autocomplete import router as autocomplete_router
+from .geo import router as geo_router
 from .reservation import router as reservation_router
 from .users import router as users_router
 from .reports import router as reports_router
 from .review import router as review_router
+from .analytics import router as analytics_router
+from .occupancy import router as occupancy_router
+from .counters import router as counters_router
+from .moderation import router as moderation_router
+from .singleflight import read_group
+from .events import start_listener, stop_listener, broker
+from . import scheduler, outbox, analytics, recommendations, autocomplete, identity, ratelimit
+from .database import replica_snapshot
 
 # Create static directory for images if it doesn't exist
 os.makedirs("static/images", exist_ok=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Deliver reservation events published by any worker to this worker's clients
+    start_listener()
+    # Reservation lifecycle maintenance; advisory locks keep workers from overlapping
+    scheduler_task = asyncio.create_task(scheduler.run_forever()) if scheduler.RUN_IN_APP else None
+    # Apply write side effects (rating recompute, booking refresh) outside request transactions
+    outbox_task = asyncio.create_task(outbox.run_forever()) if outbox.RUN_IN_APP else None
+    # Keep this worker's cached pricing analytics fresh
+    analytics_task = asyncio.create_task(analytics.run_forever())
+    # Fold new reservations into this worker's similar-equipment index
+    recommendations_task = asyncio.create_task(recommendations.run_forever())
+    # Build this worker's search suggestions and follow equipment writes
+    autocomplete_task = asyncio.create_task(autocomplete.run_forever())
+    yield
+    for task in (scheduler_task, outbox_task, analytics_task, recommendations_task, autocomplete_task):
+        if task:
+            task.cancel()
+    stop_listener()
+
+
 app = FastAPI(
     title="GearShare API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Rate limits and load shedding; added before CORS so that CORS (the outer
+# middleware) still decorates 429/503 responses
+app.add_middleware(ratelimit.RateLimitMiddleware)
+
 # Add CORS middleware FIRST (before any routes)
 app.add_middleware(
     CORSMiddleware,
@@ -36,13 +79,73 @@ def root():
     return {"message": "GearShare API running"}
 
 
+@app.get("/metrics/singleflight")
+def singleflight_metrics():
+    """Counters for coalesced detail reads"""
+    return read_group.snapshot()
+
+
+@app.get("/metrics/events")
+def event_metrics():
+    """Open reservation event connections on this worker"""
+    return broker.stats()
+
+
+@app.get("/metrics/replicas")
+def replica_metrics():
+    """Read routing counters and replica availability on this worker"""
+    return replica_snapshot()
+
+
+@app.get("/metrics/analytics")
+def analytics_metrics():
+    """Refresh count and duration of the cached pricing analytics on this worker"""
+    return analytics.stats
+
+
+@app.get("/metrics/recommendations")
+def recommendation_metrics():
+    """Build counts, size and duration of the similar-equipment index on this worker"""
+    return recommendations.recommender.stats
+
+
+@app.get("/metrics/autocomplete")
+def autocomplete_metrics():
+    """Build and sync counters and size of the search suggestion index on this worker"""
+    return autocomplete.index.stats
+
+
+@app.get("/metrics/auth")
+def auth_metrics():
+    """Token and user cache hit counters on this worker"""
+    return identity.stats
+
+
+@app.get("/metrics/ratelimit")
+def ratelimit_metrics():
+    """Rate-limited and shed request counters, and concurrency slots in use, on this worker"""
+    return ratelimit.snapshot()
+
+
+@app.get("/metrics/scheduler")
+def scheduler_metrics():
+    """Timing of the last run of each maintenance job on this worker"""
+    return scheduler.job_stats
+
+
 # Include authentication routes
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 
 # Include users routes
 app.include_router(users_router, prefix="/users", tags=["Users"])
 
-# Include equipment routes
+# Include equipment routes (bulk, catalog, recommendation, ranking, suggestion and nearby routes first so their static paths win over /{equipment_id})
+app.include_router(equipment_bulk_router, prefix="/equipment", tags=["Equipment"])
+app.include_router(catalog_router, prefix="/equipment", tags=["Equipment"])
+app.include_router(recommendations_router, prefix="/equipment", tags=["Equipment"])
+app.include_router(rankings_router, prefix="/equipment", tags=["Equipment"])
+app.include_router(autocomplete_router, prefix="/equipment", tags=["Equipment"])
+app.include_router(geo_router, prefix="/equipment", tags=["Equipment"])
 app.include_router(equipment_router, prefix="/equipment", tags=["Equipment"])
 
 # Include reservation routes
@@ -52,4 +155,12 @@ app.include_router(reservation_router, prefix="/reservation", tags=["Reservation
 app.include_router(reports_router, prefix="/reports", tags=["Reports"])
 
 # Include review routes
-app.include_router(review_router, prefix="/review", tags=["Reviews"])
\ No newline at end of file
+app.include_router(review_router, prefix="/review", tags=["Reviews"])
+
+# Include analytics routes
+app.include_router(analytics_router, prefix="/analytics", tags=["Analytics"])
+app.include_router(occupancy_router, prefix="/analytics", tags=["Analytics"])
+
+# Include admin routes
+app.include_router(counters_router, prefix="/admin", tags=["Admin"])
+app.include_router(moderation_router, prefix="/admin", tags=["Admin"])
\ No newline at end of file
@@ -121,6 +121,12 @@ class Equipment(Base):
         server_default=text("CURRENT_TIMESTAMP")
     )
 
+    version = Column(
+        Integer,
+        nullable=False,
+        server_default=text("1")
+    )
+
 
 class Reservation(Base):
     __tablename__ = "reservation"
@@ -193,6 +199,12 @@ class Reservation(Base):
         server_default=text("CURRENT_TIMESTAMP")
     )
 
+    version = Column(
+        Integer,
+        nullable=False,
+        server_default=text("1")
+    )
+
 
 class Report(Base):
     __tablename__ = "report"
@@ -259,6 +271,12 @@ class Report(Base):
         server_default=text("CURRENT_TIMESTAMP")
     )
 
+    version = Column(
+        Integer,
+        nullable=False,
+        server_default=text("1")
+    )
+
 
 class Review(Base):
     __tablename__ = "review"
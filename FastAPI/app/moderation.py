@@ -0,0 +1,257 @@
+"""
+Bulk moderation for admins.
+
+Each endpoint takes a selection (an id list and/or filters) and applies one
+set-based statement in a single transaction. Derived updates are queued
+once per distinct equipment through the outbox, so deleting 1,000 reviews
+on 3 listings recomputes 3 ratings, not 1,000.
+"""
+from fastapi import APIRouter, HTTPException, Depends
+from psycopg2.extras import RealDictCursor
+
+from .database import get_db
+from .identity import require_role, invalidate_user
+from .outbox import enqueue_many
+from .schemas import ReviewSelection, ReportSelection, ReportBulkUpdate, UserSelection, UserBulkUpdate
+
+router = APIRouter()
+
+# Rows one request may touch; larger cleanups are split into several requests
+MAX_BULK_ROWS = 10_000
+
+_admin = require_role("Admin")
+
+
+def _where(selection, columns: dict):
+    """
+    SQL conditions for a selection. `columns` maps each selection field to
+    a condition with one placeholder. An empty selection is rejected so a
+    missing filter can never select a whole table.
+    """
+    conditions = []
+    values = []
+    for field, condition in columns.items():
+        value = getattr(selection, field)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            if not value:
+                raise HTTPException(status_code=400, detail=f"{field} must not be empty")
+            if len(value) > MAX_BULK_ROWS:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ROWS} {field} per request")
+        conditions.append(condition)
+        values.append(value)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Select rows by id or at least one filter")
+    return " AND ".join(conditions), values
+
+
+def _check_size(conn, rows):
+    if len(rows) > MAX_BULK_ROWS:
+        conn.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Selection matches more than {MAX_BULK_ROWS} rows; narrow the filters"
+        )
+
+
+def _not_found(requested, touched):
+    """Requested ids that matched nothing (deleted already, or excluded by the filters)"""
+    if not requested:
+        return []
+    touched = set(touched)
+    return [item for item in dict.fromkeys(requested) if item not in touched]
+
+
+_REVIEW_COLUMNS = {
+    "review_ids": "review_id = ANY(%s)",
+    "reviewer_username": "reviewer_username = %s",
+    "equipment_id": "equipment_id = %s",
+    "max_rating": "rating <= %s",
+    "created_after": "created_at >= %s",
+}
+
+_REPORT_COLUMNS = {
+    "report_ids": "report_id = ANY(%s)",
+    "reporter_username": "reporter_username = %s",
+    "status": "status = %s",
+    "report_type": "report_type = %s",
+    "created_before": "created_at < %s",
+}
+
+_USER_COLUMNS = {
+    "usernames": '"UserName_PK" = ANY(%s)',
+    "email_domain": """lower(split_part("Email", '@', 2)) = lower(%s)""",
+    "role": '"Role" = %s',
+    "verification_status": '"VerificationStatus" = %s',
+    "created_after": '"CreatedAt" >= %s',
+}
+
+
+# DELETE many reviews
+@router.post("/reviews/delete")
+def bulk_delete_reviews(selection: ReviewSelection, admin=Depends(_admin)):
+    conditions, values = _where(selection, _REVIEW_COLUMNS)
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"""
+            DELETE FROM review
+            WHERE {conditions}
+            RETURNING review_id, equipment_id
+        """, values)
+        deleted = cursor.fetchall()
+        _check_size(conn, deleted)
+
+        # One rating recompute per affected listing
+        equipment_ids = {row['equipment_id'] for row in deleted}
+        enqueue_many(cursor, "review.changed", equipment_ids, {"bulk": True})
+        conn.commit()
+        cursor.close()
+        return {
+            "deleted": len(deleted),
+            "review_ids": [row['review_id'] for row in deleted],
+            "not_found": _not_found(selection.review_ids, (row['review_id'] for row in deleted)),
+            "equipment_recomputed": len(equipment_ids),
+        }
+    finally:
+        conn.close()
+
+
+# DELETE many reports
+@router.post("/reports/delete")
+def bulk_delete_reports(selection: ReportSelection, admin=Depends(_admin)):
+    conditions, values = _where(selection, _REPORT_COLUMNS)
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"DELETE FROM report WHERE {conditions} RETURNING report_id", values)
+        deleted = [row['report_id'] for row in cursor.fetchall()]
+        _check_size(conn, deleted)
+        conn.commit()
+        cursor.close()
+        return {
+            "deleted": len(deleted),
+            "report_ids": deleted,
+            "not_found": _not_found(selection.report_ids, deleted),
+        }
+    finally:
+        conn.close()
+
+
+# UPDATE status/priority of many reports
+@router.patch("/reports")
+def bulk_update_reports(update: ReportBulkUpdate, admin=Depends(_admin)):
+    changes = {field: value for field, value in (("status", update.status), ("priority", update.priority))
+               if value is not None}
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update: pass status and/or priority")
+    conditions, values = _where(update.where, _REPORT_COLUMNS)
+    set_clauses = ", ".join(f"{field} = %s" for field in changes)
+
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"""
+            UPDATE report
+            SET {set_clauses}, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE {conditions}
+            RETURNING report_id
+        """, list(changes.values()) + values)
+        updated = [row['report_id'] for row in cursor.fetchall()]
+        _check_size(conn, updated)
+        conn.commit()
+        cursor.close()
+        return {
+            "updated": len(updated),
+            "report_ids": updated,
+            "not_found": _not_found(update.where.report_ids, updated),
+        }
+    finally:
+        conn.close()
+
+
+# UPDATE role/verification of many users
+@router.patch("/users")
+def bulk_update_users(update: UserBulkUpdate, admin=Depends(_admin)):
+    changes = {column: value for column, value in (("Role", update.role),
+                                                   ("VerificationStatus", update.verification_status))
+               if value is not None}
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update: pass role and/or verification_status")
+    conditions, values = _where(update.where, _USER_COLUMNS)
+    set_clauses = ", ".join(f'"{column}" = %s' for column in changes)
+
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        # Admins can't demote or suspend themselves by accident
+        cursor.execute(f"""
+            UPDATE "User"
+            SET {set_clauses}, "UpdatedAt" = CURRENT_TIMESTAMP
+            WHERE {conditions} AND "UserName_PK" <> %s
+            RETURNING "UserName_PK"
+        """, list(changes.values()) + values + [admin['UserName_PK']])
+        updated = [row['UserName_PK'] for row in cursor.fetchall()]
+        _check_size(conn, updated)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    for username in updated:
+        invalidate_user(username)
+    return {
+        "updated": len(updated),
+        "usernames": updated,
+        "not_found": _not_found(update.where.usernames, updated),
+    }
+
+
+# DELETE many users (their listings, reservations, reviews and reports cascade)
+@router.post("/users/delete")
+def bulk_delete_users(selection: UserSelection, admin=Depends(_admin)):
+    conditions, values = _where(selection, _USER_COLUMNS)
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        # Locking the users first blocks new rows referencing them until commit
+        cursor.execute(f"""
+            SELECT "UserName_PK"
+            FROM "User"
+            WHERE {conditions} AND "UserName_PK" <> %s
+            FOR UPDATE
+        """, values + [admin['UserName_PK']])
+        usernames = [row['UserName_PK'] for row in cursor.fetchall()]
+        _check_size(conn, usernames)
+
+        # Other users' listings whose rating or booking state the cascade changes
+        cursor.execute("""
+            SELECT DISTINCT r.equipment_id
+            FROM review r JOIN equipment e ON e.equipment_id = r.equipment_id
+            WHERE r.reviewer_username = ANY(%s) AND NOT e.owner_username = ANY(%s)
+        """, (usernames, usernames))
+        reviewed = [row['equipment_id'] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT DISTINCT equipment_id
+            FROM reservation
+            WHERE reserver_username = ANY(%s) AND status = 'running' AND NOT owner_username = ANY(%s)
+        """, (usernames, usernames))
+        rented = [row['equipment_id'] for row in cursor.fetchall()]
+
+        cursor.execute('DELETE FROM "User" WHERE "UserName_PK" = ANY(%s)', (usernames,))
+        enqueue_many(cursor, "review.changed", reviewed, {"bulk": True})
+        enqueue_many(cursor, "reservation.changed", rented, {"bulk": True})
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    for username in usernames:
+        invalidate_user(username)
+    return {
+        "deleted": len(usernames),
+        "usernames": usernames,
+        "not_found": _not_found(selection.usernames, usernames),
+        "equipment_recomputed": len(set(reviewed) | set(rented)),
+    }
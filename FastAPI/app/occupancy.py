@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+
+from .analytics import fetch_columns
+from .database import get_read_db
+from .singleflight import read_group
+
+router = APIRouter()
+
+MAX_RANGE_DAYS = 2 * 366
+# Computed ranges are reused for this long
+CACHE_TTL_SECONDS = 60
+CACHE_SIZE = 256
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+_cache = OrderedDict()      # (scope, value, start, end) -> (expires_at, result)
+_lock = threading.Lock()
+
+
+def _sweep(starts, ends, n_days: int):
+    """
+    Reservations active on each day of the range, from day offsets, using a
+    difference array: +1 at each start, -1 at each end, then a running sum.
+    A reservation occupies [start, end), matching the price calculation
+    (end_date - start_date days); offsets are clipped to the range.
+    """
+    starts = np.clip(starts, 0, n_days)
+    ends = np.clip(ends, 0, n_days)
+    delta = np.bincount(starts, minlength=n_days + 1) - np.bincount(ends, minlength=n_days + 1)
+    return np.cumsum(delta)[:n_days]
+
+
+def _load(scope: str, value, start: date, end: date):
+    if scope == "equipment_id":
+        items_sql = "SELECT COUNT(*) FROM equipment WHERE equipment_id = %s"
+        condition = "r.equipment_id = %s"
+    elif scope == "owner":
+        items_sql = "SELECT COUNT(*) FROM equipment WHERE owner_username = %s"
+        condition = "r.owner_username = %s"
+    else:
+        items_sql = "SELECT COUNT(*) FROM equipment WHERE category = %s"
+        condition = "r.equipment_id IN (SELECT equipment_id FROM equipment WHERE category = %s)"
+
+    conn = get_read_db(value if scope == "owner" else None)
+    try:
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cursor = conn.cursor()
+        cursor.execute(items_sql, (value,))
+        items = cursor.fetchone()[0]
+        # Day offsets from the start of the range; pending requests count as demand, not bookings
+        reservations = fetch_columns(cursor, [
+            ("start_day", "(r.start_date - %s::date)::int4", ">i4"),
+            ("end_day", "(r.end_date - %s::date)::int4", ">i4"),
+            ("booked", "(r.status <> 'pending')::int4", ">i4"),
+        ], f"""
+            FROM reservation r
+            WHERE {condition}
+              AND r.status <> 'cancelled'
+              AND r.end_date > %s AND r.start_date <= %s
+        """, (start, start, value, start, end))
+        conn.rollback()
+        cursor.close()
+    finally:
+        conn.close()
+    return items, reservations
+
+
+def _compute(scope: str, value, start: date, end: date):
+    items, reservations = _load(scope, value, start, end)
+    n_days = (end - start).days + 1
+    starts, ends = reservations["start_day"], reservations["end_day"]
+    booked_rows = reservations["booked"].astype(bool)
+
+    booked = _sweep(starts[booked_rows], ends[booked_rows], n_days)
+    requested = _sweep(starts[~booked_rows], ends[~booked_rows], n_days)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        occupancy = np.minimum(booked / items, 1.0) if items else np.zeros(n_days)
+
+    # Average booked items per weekday, to show where demand peaks
+    weekday = (np.arange(n_days) + start.weekday()) % 7
+    days_per_weekday = np.bincount(weekday, minlength=7)
+    booked_per_weekday = np.bincount(weekday, weights=booked, minlength=7)
+    requested_per_weekday = np.bincount(weekday, weights=requested, minlength=7)
+
+    peak = int(np.argmax(booked + requested)) if n_days else 0
+    return {
+        scope: value,
+        "start": start,
+        "end": end,
+        "items": items,
+        "days": [
+            {
+                "date": start + timedelta(days=day),
+                "booked": int(booked[day]),
+                "requested": int(requested[day]),
+                "occupancy": round(float(occupancy[day]), 4),
+            }
+            for day in range(n_days)
+        ],
+        "peak": {"date": start + timedelta(days=peak), "booked": int(booked[peak]), "requested": int(requested[peak])},
+        "by_weekday": [
+            {
+                "weekday": WEEKDAYS[day],
+                "avg_booked": round(float(booked_per_weekday[day] / days_per_weekday[day]), 2) if days_per_weekday[day] else 0.0,
+                "avg_requested": round(float(requested_per_weekday[day] / days_per_weekday[day]), 2) if days_per_weekday[day] else 0.0,
+            }
+            for day in range(7)
+        ],
+    }
+
+
+def _cached(key, compute):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            _cache.move_to_end(key)
+            return entry[1]
+    # Identical concurrent misses share one computation
+    result = read_group.do(("occupancy",) + key, compute)
+    with _lock:
+        _cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, result)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+# GET booked/requested reservations per day for an item, an owner or a category
+@router.get("/occupancy")
+def get_occupancy(
+    start: date,
+    end: date,
+    equipment_id: int = None,
+    owner: str = None,
+    category: str = None
+):
+    scopes = [(name, value) for name, value in
+              (("equipment_id", equipment_id), ("owner", owner), ("category", category)) if value is not None]
+    if len(scopes) != 1:
+        raise HTTPException(status_code=400, detail="Pass exactly one of equipment_id, owner or category")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_RANGE_DAYS} days")
+
+    scope, value = scopes[0]
+    result = _cached((scope, value, start, end), lambda: _compute(scope, value, start, end))
+    if not result["items"] and scope == "equipment_id":
+        raise HTTPException(status_code=404, detail="Equipment not found")
+    return result
@@ -0,0 +1,184 @@
+"""
+Transactional outbox for write side effects.
+
+Request handlers call `enqueue()` with their own cursor, so the event commits
+(or rolls back) together with the primary write. A worker drains the table in
+batches and applies the derived updates: delivery is at-least-once, handlers
+are idempotent, and duplicate events for the same aggregate in a batch are
+applied once.
+
+Runs inside the API process (started from main.lifespan) or standalone with
+`python -m app.outbox`.
+"""
+import asyncio
+import os
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, Json
+
+from .database import DB_PARAMS
+from .geo import locate
+
+BATCH_SIZE = 500
+# Idle workers check for new events this often
+POLL_SECONDS = 1.0
+# Events failing this many times are left in the table for inspection
+MAX_ATTEMPTS = 5
+# Set to "0" when a separate `python -m app.outbox` worker drains the table
+RUN_IN_APP = os.getenv("GEARSHARE_IN_APP_OUTBOX", "1") == "1"
+
+_handlers = {}
+
+
+def handler(event_type: str):
+    """Register a function `fn(cursor, aggregate_id, payloads)` for an event type"""
+    def register(fn):
+        _handlers.setdefault(event_type, []).append(fn)
+        return fn
+    return register
+
+
+def enqueue(cursor, event_type: str, aggregate_id, payload: dict = None):
+    """Record an event on the caller's transaction"""
+    cursor.execute("""
+        INSERT INTO outbox (event_type, aggregate_id, payload)
+        VALUES (%s, %s, %s)
+    """, (event_type, aggregate_id, Json(payload or {})))
+
+
+def enqueue_many(cursor, event_type: str, aggregate_ids, payload: dict = None):
+    """Record one event per distinct aggregate with a single statement"""
+    aggregate_ids = sorted(set(aggregate_ids))
+    if not aggregate_ids:
+        return
+    cursor.execute("""
+        INSERT INTO outbox (event_type, aggregate_id, payload)
+        SELECT %s, aggregate_id, %s
+        FROM unnest(%s::int[]) AS aggregate_id
+    """, (event_type, Json(payload or {}), aggregate_ids))
+
+
+@handler("review.changed")
+def recompute_equipment_rating(cursor, equipment_id, payloads):
+    cursor.execute("""
+        UPDATE equipment
+        SET rating_avg = COALESCE((SELECT AVG(rating) FROM review WHERE equipment_id = %s), 0.0),
+            rating_count = (SELECT COUNT(*) FROM review WHERE equipment_id = %s)
+        WHERE equipment_id = %s
+    """, (equipment_id, equipment_id, equipment_id))
+
+
+@handler("reservation.changed")
+def refresh_equipment_booking(cursor, equipment_id, payloads):
+    cursor.execute("""
+        UPDATE equipment e
+        SET status = CASE WHEN a.booked_till IS NULL THEN 'available' ELSE 'booked' END,
+            booked_till = a.booked_till,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT MAX(end_date) as booked_till
+            FROM reservation
+            WHERE equipment_id = %s AND status = 'running'
+        ) a
+        WHERE e.equipment_id = %s
+          AND e.status <> 'unavailable'
+          AND (e.booked_till IS DISTINCT FROM a.booked_till
+               OR e.status <> CASE WHEN a.booked_till IS NULL THEN 'available' ELSE 'booked' END)
+    """, (equipment_id, equipment_id))
+
+
+@handler("equipment.changed")
+def geocode_pickup_location(cursor, equipment_id, payloads):
+    # Edits that name their fields only matter here if the pickup location changed
+    if all("pickup_location" not in payload.get("fields", ["pickup_location"]) for payload in payloads):
+        return
+    locate(cursor, equipment_id)
+
+
+def drain(conn, batch_size: int = BATCH_SIZE):
+    """Apply one batch of pending events; returns the number of events consumed"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("""
+        SELECT id, event_type, aggregate_id, payload
+        FROM outbox
+        WHERE processed_at IS NULL AND attempts < %s
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, (MAX_ATTEMPTS, batch_size))
+    events = cursor.fetchall()
+    if not events:
+        conn.commit()
+        return 0
+
+    # Dedupe: one handler call per (event_type, aggregate), in first-seen order
+    groups = {}
+    for event in events:
+        groups.setdefault((event['event_type'], event['aggregate_id']), []).append(event)
+
+    done, failed = [], []
+    for (event_type, aggregate_id), group in groups.items():
+        ids = [event['id'] for event in group]
+        cursor.execute("SAVEPOINT outbox_event")
+        try:
+            for fn in _handlers.get(event_type, ()):
+                fn(cursor, aggregate_id, [event['payload'] for event in group])
+            cursor.execute("RELEASE SAVEPOINT outbox_event")
+            done.extend(ids)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT outbox_event")
+            print(f"[outbox] {event_type} {aggregate_id} failed: {e}")
+            failed.append((ids, str(e)))
+
+    cursor.execute("""
+        UPDATE outbox SET processed_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+        WHERE id = ANY(%s)
+    """, (done,))
+    for ids, error in failed:
+        cursor.execute("""
+            UPDATE outbox SET attempts = attempts + 1, last_error = %s
+            WHERE id = ANY(%s)
+        """, (error, ids))
+    conn.commit()
+    cursor.close()
+    return len(events)
+
+
+def purge_processed(cursor, older_than_hours: int = 24):
+    cursor.execute("""
+        DELETE FROM outbox
+        WHERE processed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+    """, (older_than_hours,))
+    return cursor.rowcount
+
+
+def drain_until_empty():
+    """Drain full batches back to back; returns the number of events consumed"""
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        total = 0
+        while True:
+            consumed = drain(conn)
+            total += consumed
+            if consumed < BATCH_SIZE:
+                return total
+    finally:
+        conn.close()
+
+
+async def run_forever():
+    """Poll the outbox and apply events; work runs in a thread so the event loop stays free"""
+    while True:
+        try:
+            started = time.perf_counter()
+            consumed = await asyncio.to_thread(drain_until_empty)
+            if consumed:
+                print(f"[outbox] applied {consumed} events in {(time.perf_counter() - started) * 1000:.1f}ms")
+        except Exception as e:
+            print(f"[outbox] drain failed: {e}")
+        await asyncio.sleep(POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_forever())
@@ -0,0 +1,107 @@
+"""
+Rental pricing.
+
+All amounts are Decimal (daily_price is NUMERIC in the database); the
+subtotal and each adjustment are rounded to cents. A rental covers
+[start_date, end_date), i.e. end_date - start_date days.
+
+Adjustments beyond days * daily_price come from RULES; each rule is a
+function `rule(equipment, start_date, end_date, days, subtotal)` returning
+a list of (label, amount) pairs, negative amounts being discounts. No rules
+are active by default, so quotes match the historical days * daily_price.
+"""
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from fastapi import HTTPException
+
+CENTS = Decimal("0.01")
+MAX_QUOTE_ITEMS = 100
+
+RULES = []
+
+
+def weekly_discount(percent, min_days: int = 7):
+    """Rule: take `percent` off rentals of at least `min_days` days"""
+    rate = Decimal(str(percent)) / 100
+
+    def rule(equipment, start_date, end_date, days, subtotal):
+        if days < min_days:
+            return []
+        return [(f"{percent}% off {min_days}+ day rentals", -subtotal * rate)]
+    return rule
+
+
+def seasonal_rate(first_day: tuple, last_day: tuple, percent, label: str):
+    """Rule: adjust the price of days falling between two (month, day) dates by `percent` (may be negative)"""
+    rate = Decimal(str(percent)) / 100
+
+    def in_season(day: date):
+        key = (day.month, day.day)
+        if first_day <= last_day:
+            return first_day <= key <= last_day
+        return key >= first_day or key <= last_day     # season wraps the new year
+
+    def rule(equipment, start_date, end_date, days, subtotal):
+        season_days = sum(1 for offset in range(days) if in_season(start_date + timedelta(days=offset)))
+        if not season_days:
+            return []
+        return [(label, Decimal(equipment['daily_price']) * season_days * rate)]
+    return rule
+
+
+def quote(equipment, start_date: date, end_date: date, rules=None) -> dict:
+    """Price one rental of `equipment` (a row with equipment_id and daily_price)"""
+    days = (end_date - start_date).days
+    if days <= 0:
+        raise HTTPException(status_code=400, detail="End date must be after start date")
+
+    daily_price = Decimal(equipment['daily_price'])
+    subtotal = (daily_price * days).quantize(CENTS, ROUND_HALF_UP)
+    adjustments = []
+    for rule in RULES if rules is None else rules:
+        adjustments += [
+            (label, amount.quantize(CENTS, ROUND_HALF_UP))
+            for label, amount in rule(equipment, start_date, end_date, days, subtotal)
+        ]
+    # Rounded parts, so the listed adjustments always add up to the total
+    total = subtotal + sum((amount for _, amount in adjustments), Decimal(0))
+
+    return {
+        "equipment_id": equipment['equipment_id'],
+        "start_date": start_date,
+        "end_date": end_date,
+        "days": days,
+        "daily_price": daily_price.quantize(CENTS, ROUND_HALF_UP),
+        "subtotal": subtotal,
+        "adjustments": [{"label": label, "amount": amount} for label, amount in adjustments],
+        "total": max(total, Decimal(0)),
+    }
+
+
+def load_equipment(cursor, equipment_ids) -> dict:
+    """Pricing fields for many listings with one query: {equipment_id: row}"""
+    cursor.execute("""
+        SELECT equipment_id, name, owner_username, daily_price, status
+        FROM equipment
+        WHERE equipment_id = ANY(%s)
+    """, (list(set(equipment_ids)),))
+    return {row['equipment_id']: row for row in cursor.fetchall()}
+
+
+def quote_many(cursor, requests) -> list:
+    """Price (equipment_id, start_date, end_date) tuples; failures are reported per item"""
+    equipment = load_equipment(cursor, [equipment_id for equipment_id, _, _ in requests])
+    quotes = []
+    for equipment_id, start_date, end_date in requests:
+        row = equipment.get(equipment_id)
+        if row is None:
+            quotes.append({"equipment_id": equipment_id, "start_date": start_date, "end_date": end_date,
+                           "error": "Equipment not found"})
+            continue
+        try:
+            quotes.append(quote(row, start_date, end_date))
+        except HTTPException as e:
+            quotes.append({"equipment_id": equipment_id, "start_date": start_date, "end_date": end_date,
+                           "error": e.detail})
+    return quotes
@@ -0,0 +1,108 @@
+"""
+"Top rated" and "trending" equipment rankings.
+
+Scores are computed in one batch by the scheduler (refresh_equipment_rankings)
+and stored with their rank in equipment_ranking, per category and overall,
+so serving a page is a primary-key range scan.
+
+- top-rated: Bayesian average rating. Every item starts with
+  RATING_PRIOR_WEIGHT virtual reviews at the catalog-wide mean, so one 5-star
+  review can't outrank dozens of 4.8s.
+- trending: reservation velocity. Each reservation made in the last
+  TRENDING_WINDOW_DAYS counts 1, halving every TRENDING_HALF_LIFE_DAYS of age.
+"""
+from fastapi import APIRouter, HTTPException
+
+from .singleflight import fetch_shared
+
+router = APIRouter()
+
+FEEDS = ("top-rated", "trending")
+# Virtual reviews at the mean rating added to every item
+RATING_PRIOR_WEIGHT = 5
+TRENDING_HALF_LIFE_DAYS = 7
+TRENDING_WINDOW_DAYS = 30
+# Ranking across all categories is stored under this category
+ALL_CATEGORIES = "*"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def refresh(cursor):
+    """Recompute both feeds; readers keep seeing the previous ranking until commit"""
+    cursor.execute("DELETE FROM equipment_ranking")
+    cursor.execute("""
+        WITH ratings AS (
+            SELECT equipment_id, COUNT(*) AS count, SUM(rating) AS total
+            FROM review
+            GROUP BY equipment_id
+        ), prior AS (
+            SELECT COALESCE(SUM(total)::float / NULLIF(SUM(count), 0), 0) AS mean
+            FROM ratings
+        ), velocity AS (
+            SELECT equipment_id,
+                   SUM(exp(-ln(2) * EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - created_at)
+                           / (%(half_life)s * 86400.0))) AS score
+            FROM reservation
+            WHERE created_at > CURRENT_TIMESTAMP - %(window)s * INTERVAL '1 day'
+              AND status <> 'cancelled'
+            GROUP BY equipment_id
+        ), scores AS (
+            SELECT 'top-rated' AS feed, e.equipment_id, COALESCE(e.category, 'Uncategorized') AS category,
+                   (%(prior_weight)s * p.mean + r.total) / (%(prior_weight)s + r.count) AS score
+            FROM equipment e
+            JOIN ratings r ON r.equipment_id = e.equipment_id
+            CROSS JOIN prior p
+            WHERE e.status <> 'unavailable'
+            UNION ALL
+            SELECT 'trending', e.equipment_id, COALESCE(e.category, 'Uncategorized'), v.score
+            FROM equipment e
+            JOIN velocity v ON v.equipment_id = e.equipment_id
+            WHERE e.status <> 'unavailable'
+        )
+        INSERT INTO equipment_ranking (feed, category, rank, equipment_id, score)
+        SELECT feed, %(all)s, row_number() OVER (PARTITION BY feed ORDER BY score DESC, equipment_id),
+               equipment_id, score
+        FROM scores
+        UNION ALL
+        SELECT feed, category, row_number() OVER (PARTITION BY feed, category ORDER BY score DESC, equipment_id),
+               equipment_id, score
+        FROM scores
+    """, {
+        "half_life": TRENDING_HALF_LIFE_DAYS,
+        "window": TRENDING_WINDOW_DAYS,
+        "prior_weight": RATING_PRIOR_WEIGHT,
+        "all": ALL_CATEGORIES,
+    })
+    return cursor.rowcount
+
+
+# GET a page of ranked equipment (top-rated or trending), overall or per category
+@router.get("/rankings/{feed}")
+def get_rankings(feed: str, category: str = None, cursor: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+    if feed not in FEEDS:
+        raise HTTPException(status_code=404, detail=f"feed must be one of: {', '.join(FEEDS)}")
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    # Concurrent requests for the same page share one DB round trip
+    rows = fetch_shared("""
+        SELECT r.rank, r.score, r.computed_at,
+               e.equipment_id, e.name, e.category, e.daily_price, e.photo_url, e.owner_username,
+               e.pickup_location, e.status, e.rating_avg, e.rating_count
+        FROM equipment_ranking r
+        JOIN equipment e ON e.equipment_id = r.equipment_id
+        WHERE r.feed = %s AND r.category = %s AND r.rank > %s
+        ORDER BY r.rank
+        LIMIT %s
+    """, (feed, category or ALL_CATEGORIES, cursor, limit + 1), many=True)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "feed": feed,
+        "category": category,
+        "items": [{key: value for key, value in row.items() if key != 'computed_at'} for row in rows],
+        # Pass back as `cursor` for the next page; None on the last page
+        "next_cursor": rows[-1]['rank'] if has_more else None,
+        "computed_at": rows[0]['computed_at'] if rows else None,
+    }
@@ -0,0 +1,308 @@
+"""
+Rate limiting and load shedding.
+
+Every request passes two checks before it reaches a route:
+
+1. Token buckets. The first entry in LIMITS matching the request gives a
+   per-client budget (and optionally a budget shared by all clients of the
+   route). Requests over budget get 429 with Retry-After.
+2. A concurrency limiter in front of the worker threadpool and the
+   database. At most MAX_CONCURRENT_REQUESTS requests run at once; the rest
+   queue. A request is shed with 503 + Retry-After when the expected queue
+   wait (queue length x recent service time) or its actual wait exceeds
+   MAX_QUEUE_WAIT_SECONDS. Expensive routes also have their own, smaller
+   concurrency cap so they can't take every slot.
+
+A slot is released when the response starts, so long-lived streams (reservation
+events, exports) don't hold one for their whole duration.
+
+Buckets live in memory per worker by default. With several workers, set
+GEARSHARE_RATE_LIMIT_BACKEND=postgres (table and function from
+rate_limit_table.sql) so all workers draw from the same buckets.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from .database import DB_PARAMS
+
+# Set to "0" to disable both rate limiting and load shedding
+ENABLED = os.getenv("GEARSHARE_RATE_LIMITS", "1") == "1"
+# "memory" (per worker) or "postgres" (shared by all workers)
+BACKEND = os.getenv("GEARSHARE_RATE_LIMIT_BACKEND", "memory")
+# Requests handled at once; matches the default size of the sync-handler threadpool
+MAX_CONCURRENT_REQUESTS = int(os.getenv("GEARSHARE_MAX_CONCURRENT_REQUESTS", "40"))
+# Longest a request may wait for a slot before it is shed
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("GEARSHARE_MAX_QUEUE_WAIT_SECONDS", "1.0"))
+# Use the first X-Forwarded-For address as the client (only behind a trusted proxy)
+TRUST_PROXY = os.getenv("GEARSHARE_TRUST_PROXY", "0") == "1"
+# Upper bound on in-memory buckets; the least recently used are dropped (i.e. refilled)
+MAX_BUCKETS = 100_000
+# Paths that are never limited
+EXEMPT_PREFIXES = ("/metrics", "/static", "/docs", "/redoc", "/openapi.json")
+
+
+class Limit:
+    """
+    Budget for the routes matching `methods` and `pattern` (a regex on the path).
+    `rate` is requests per second per client with bursts up to `burst`;
+    `route_rate`/`route_burst` cap all clients together; `max_concurrent`
+    gives the routes their own concurrency cap.
+    """
+
+    def __init__(self, name, methods, pattern, rate, burst,
+                 route_rate=None, route_burst=None, max_concurrent=None):
+        self.name = name
+        self.methods = set(methods) if methods else None
+        self.pattern = re.compile(pattern)
+        self.rate = rate
+        self.burst = burst
+        self.route_rate = route_rate
+        self.route_burst = route_burst or route_rate
+        self.limiter = ConcurrencyLimiter(max_concurrent) if max_concurrent else None
+
+    def matches(self, method, path):
+        return (self.methods is None or method in self.methods) and self.pattern.match(path)
+
+
+class ConcurrencyLimiter:
+    """FIFO admission to a fixed number of slots, with adaptive shedding"""
+
+    def __init__(self, limit: int, max_wait: float = MAX_QUEUE_WAIT_SECONDS):
+        self.limit = limit
+        self.max_wait = max_wait
+        self.active = 0
+        self.service_seconds = 0.05     # moving average of how long a slot is held
+        self._waiters = deque()
+        self.stats = {"admitted": 0, "queued": 0, "shed": 0}
+
+    def expected_wait(self):
+        return (len(self._waiters) + 1) * self.service_seconds / self.limit
+
+    async def acquire(self):
+        """None once a slot is held, or the seconds a shed client should wait before retrying"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return None
+        # Don't queue requests that would time out anyway
+        expected = self.expected_wait()
+        if expected > self.max_wait:
+            self.stats["shed"] += 1
+            return expected
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                self.stats["shed"] += 1
+                return self.expected_wait()
+            # The slot arrived just as the wait timed out; keep it
+        except asyncio.CancelledError:
+            # Client went away; pass on a slot handed over in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.stats["admitted"] += 1
+        return None
+
+    def release(self, held_seconds: float):
+        if held_seconds:
+            self.service_seconds += 0.1 * (held_seconds - self.service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)     # the slot passes to the next waiter
+                return
+        self.active -= 1
+
+    def snapshot(self):
+        return dict(self.stats, active=self.active, waiting=len(self._waiters),
+                    limit=self.limit, service_ms=round(self.service_seconds * 1000, 2))
+
+
+class MemoryBackend:
+    """Token buckets in this worker's memory (only touched from the event loop)"""
+
+    def __init__(self):
+        self._buckets = OrderedDict()   # key -> (tokens, updated_at)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """0 if a token was taken, else the seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > MAX_BUCKETS:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class PostgresBackend:
+    """Token buckets in the rate_limit_bucket table, shared by all workers"""
+
+    # Buckets idle this long are deleted (they would be full anyway)
+    PURGE_AFTER_SECONDS = 3600
+    PURGE_INTERVAL_SECONDS = 600
+
+    def __init__(self):
+        # One connection used from a single thread, so bucket updates never wait on the request threadpool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limit")
+        self._conn = None
+        self._purged_at = time.monotonic()
+        self.errors = 0
+
+    def _take(self, key, rate, burst):
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = psycopg2.connect(**DB_PARAMS)
+                self._conn.autocommit = True
+            cursor = self._conn.cursor()
+            cursor.execute("SELECT rate_limit_take(%s, %s, %s)", (key, rate, burst))
+            wait = float(cursor.fetchone()[0])
+            if time.monotonic() - self._purged_at > self.PURGE_INTERVAL_SECONDS:
+                self._purged_at = time.monotonic()
+                cursor.execute("""
+                    DELETE FROM rate_limit_bucket
+                    WHERE updated_at < clock_timestamp() - %s * INTERVAL '1 second'
+                """, (self.PURGE_AFTER_SECONDS,))
+            cursor.close()
+            return wait
+        except Exception as e:
+            # Fail open: an unavailable limiter must not take the API down with it
+            self.errors += 1
+            print(f"Rate limit backend error: {e}")
+            if self._conn is not None:
+                self._conn.close()
+            return 0.0
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._take, key, rate, burst)
+
+
+# First match wins; the last entry catches everything else
+LIMITS = [
+    # Login/signup run bcrypt; keep guessing and signup floods cheap to reject
+    Limit("auth", {"POST"}, r"^/auth/(login|signup)$", rate=10 / 60, burst=10, route_rate=50),
+    # Full scans over an owner's reservations/reviews
+    Limit("earnings", {"GET"}, r"^/reservation/earnings(-details)?/", rate=1, burst=5,
+          route_rate=20, max_concurrent=8),
+    Limit("rating_details", {"GET"}, r"^/review/owner/[^/]+/rating-details$", rate=1, burst=5,
+          route_rate=20, max_concurrent=8),
+    Limit("bulk", {"POST", "PATCH"}, r"^/(equipment/import|reservation/batch)$", rate=0.2, burst=3,
+          max_concurrent=4),
+    Limit("writes", {"POST", "PUT", "PATCH", "DELETE"}, r"^/", rate=5, burst=20),
+    Limit("default", None, r"^/", rate=20, burst=40),
+]
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS)
+backend = PostgresBackend() if BACKEND == "postgres" else MemoryBackend()
+stats = {"allowed": 0, "rate_limited": 0}
+
+
+def _client(scope) -> str:
+    if TRUST_PROXY:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _match(method: str, path: str):
+    for limit in LIMITS:
+        if limit.matches(method, path):
+            return limit
+    return None
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = ('{"detail":"%s"}' % detail).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying LIMITS and the concurrency limiters"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        limit = _match(scope["method"], path)
+        if limit is None or path == "/" or path.startswith(EXEMPT_PREFIXES):
+            return await self.app(scope, receive, send)
+
+        wait = await backend.take(f"{limit.name}:{_client(scope)}", limit.rate, limit.burst)
+        if not wait and limit.route_rate:
+            wait = await backend.take(f"{limit.name}:*", limit.route_rate, limit.route_burst)
+        if wait:
+            stats["rate_limited"] += 1
+            return await _reject(send, 429, "Too many requests", wait)
+
+        limiters = [limiter] if limit.limiter is None else [limit.limiter, limiter]
+        held = []
+        for concurrency in limiters:
+            retry_after = await concurrency.acquire()
+            if retry_after is not None:
+                for acquired in held:
+                    acquired.release(0.0)
+                return await _reject(send, 503, "Server busy, try again shortly", retry_after)
+            held.append(concurrency)
+        stats["allowed"] += 1
+
+        started = time.monotonic()
+
+        def release():
+            elapsed = time.monotonic() - started
+            while held:
+                held.pop().release(elapsed)
+
+        async def send_and_release(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
+
+
+def snapshot():
+    """Counters for GET /metrics/ratelimit"""
+    result = dict(stats, backend=BACKEND, requests=limiter.snapshot(), routes={
+        limit.name: limit.limiter.snapshot() for limit in LIMITS if limit.limiter
+    })
+    if isinstance(backend, PostgresBackend):
+        result["backend_errors"] = backend.errors
+    return result
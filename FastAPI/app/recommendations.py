@@ -0,0 +1,308 @@
+"""
+"Similar equipment" recommendations.
+
+Two items are similar when the same users rented both (cosine similarity of
+co-rental counts) and, to a lesser degree, when they share a category and
+have close daily prices. Co-rental counts are kept as a sparse list of
+(item, item) keys and updated incrementally from new reservations; the
+top-K neighbours of every item are then served from memory.
+"""
+import asyncio
+import threading
+import time
+
+import numpy as np
+from fastapi import APIRouter
+from psycopg2.extras import RealDictCursor
+
+from .analytics import fetch_columns
+from .database import get_read_db
+
+router = APIRouter()
+
+TOP_K = 10
+# New reservations are folded in this often
+REFRESH_SECONDS = 60
+# Full rebuilds pick up cancellations and category/price edits
+FULL_REBUILD_SECONDS = 60 * 60
+# Users who rented more items than this are left out of co-rental counts
+MAX_ITEMS_PER_USER = 100
+# Same-category items this many price ranks away count as content neighbours
+CONTENT_NEIGHBOURS = 10
+# Weight of category/price proximity next to co-rental cosine (both in 0..1)
+CONTENT_WEIGHT = 0.3
+
+_EMPTY_KEYS = np.empty(0, dtype=np.int64)
+
+
+def _pair_key(a, b):
+    return (a.astype(np.int64) << 32) | b.astype(np.int64)
+
+
+def _co_rentals(users, items):
+    """Sparse co-rental counts from distinct (user, item) rows: (sorted pair keys, counts)"""
+    order = np.lexsort((items, users))
+    users, items = users[order], items[order]
+    first = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else _EMPTY_KEYS
+    lengths = np.diff(np.r_[first, len(users)])
+    per_row = np.repeat(lengths, lengths)
+    keep = (per_row >= 2) & (per_row <= MAX_ITEMS_PER_USER)
+    if not keep.any():
+        return _EMPTY_KEYS, _EMPTY_KEYS
+
+    # Every ordered pair of items within each user's run
+    group_start = np.repeat(first, lengths)[keep]
+    per_row = per_row[keep]
+    rows = np.flatnonzero(keep)
+    left = np.repeat(rows, per_row)
+    offset = np.arange(len(left)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    right = np.repeat(group_start, per_row) + offset
+    distinct = left != right
+    return np.unique(_pair_key(items[left[distinct]], items[right[distinct]]), return_counts=True)
+
+
+def _add_counts(keys, counts, more_keys, more_counts):
+    """Sum two sparse count vectors; entries that drop to zero are removed"""
+    merged, inverse = np.unique(np.concatenate((keys, more_keys)), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate((counts, more_counts)), minlength=len(merged))
+    totals = np.rint(totals).astype(np.int64)
+    nonzero = totals > 0
+    return merged[nonzero], totals[nonzero]
+
+
+def _subtract_counts(keys, counts, less_keys, less_counts):
+    return _add_counts(keys, counts, less_keys, -less_counts)
+
+
+def _distinct_rentals(users, items):
+    """Distinct (user, item) rows"""
+    pairs = np.unique(_pair_key(users, items))
+    return (pairs >> 32).astype(np.int64), (pairs & 0xFFFFFFFF).astype(np.int64)
+
+
+class SimilarityIndex:
+    """Top-K neighbours per item in CSR form (item_ids[i] -> neighbours[indptr[i]:indptr[i+1]])"""
+
+    def __init__(self, item_ids, indptr, neighbours, scores):
+        self.item_ids = item_ids
+        self.indptr = indptr
+        self.neighbours = neighbours
+        self.scores = scores
+
+    def lookup(self, equipment_id: int, limit: int = TOP_K):
+        i = int(np.searchsorted(self.item_ids, equipment_id))
+        if i >= len(self.item_ids) or self.item_ids[i] != equipment_id:
+            return []
+        start, end = self.indptr[i], min(self.indptr[i + 1], self.indptr[i] + limit)
+        return [
+            {"equipment_id": int(neighbour), "score": round(float(score), 4)}
+            for neighbour, score in zip(self.neighbours[start:end], self.scores[start:end])
+        ]
+
+
+class Recommender:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pair_keys = _EMPTY_KEYS
+        self.pair_counts = _EMPTY_KEYS
+        self.item_ids = _EMPTY_KEYS        # sorted
+        self.item_users = _EMPTY_KEYS      # distinct renters per item
+        self.watermark = 0                 # highest reservation_id folded in
+        self.index = None
+        self.built_at = 0.0
+        self.stats = {"full_builds": 0, "incremental_updates": 0, "last_build_ms": None, "pairs": 0}
+
+    # Co-rental counts
+
+    def _full_counts(self, cursor):
+        cursor.execute("SELECT COALESCE(MAX(reservation_id), 0) FROM reservation")
+        watermark = cursor.fetchone()[0]
+        rentals = fetch_columns(cursor, [
+            ("user", "user_code", ">i4"),
+            ("item", "equipment_id", ">i4"),
+        ], """
+            FROM (
+                SELECT dense_rank() OVER (ORDER BY reserver_username)::int4 as user_code, equipment_id
+                FROM (
+                    SELECT DISTINCT reserver_username, equipment_id
+                    FROM reservation
+                    WHERE status <> 'cancelled' AND reservation_id <= %s
+                ) distinct_rentals
+            ) coded
+        """, (watermark,))
+        users, items = rentals["user"], rentals["item"]
+        self.pair_keys, self.pair_counts = _co_rentals(users, items)
+        self.item_ids, self.item_users = np.unique(items, return_counts=True)
+        self.watermark = watermark
+
+    def _incremental_counts(self, cursor):
+        """Fold in reservations created since the watermark; returns False if there were none"""
+        cursor.execute("SELECT COALESCE(MAX(reservation_id), 0) FROM reservation")
+        watermark = cursor.fetchone()[0]
+        if watermark <= self.watermark:
+            return False
+        # Full histories of the users who made new reservations, split at the old watermark
+        cursor.execute("""
+            SELECT DISTINCT reserver_username, equipment_id, reservation_id <= %s as seen
+            FROM reservation
+            WHERE reserver_username IN (
+                SELECT reserver_username FROM reservation
+                WHERE reservation_id > %s AND reservation_id <= %s
+            )
+              AND status <> 'cancelled' AND reservation_id <= %s
+        """, (self.watermark, self.watermark, watermark, watermark))
+        rows = cursor.fetchall()
+        self.watermark = watermark
+        if not rows:
+            return True
+
+        _, users = np.unique([row[0] for row in rows], return_inverse=True)
+        items = np.array([row[1] for row in rows], dtype=np.int64)
+        seen = np.array([row[2] for row in rows], dtype=bool)
+
+        users_after, items_after = _distinct_rentals(users, items)
+        users_before, items_before = _distinct_rentals(users[seen], items[seen])
+        # delta = pairs(after) - pairs(before), applied to the running counts
+        after_keys, after_counts = _co_rentals(users_after, items_after)
+        before_keys, before_counts = _co_rentals(users_before, items_before)
+        keys, counts = _add_counts(self.pair_keys, self.pair_counts, after_keys, after_counts)
+        self.pair_keys, self.pair_counts = _subtract_counts(keys, counts, before_keys, before_counts)
+
+        new_items, new_users = np.unique(items_after, return_counts=True)
+        old_items, old_users = np.unique(items_before, return_counts=True)
+        ids, renters = _add_counts(self.item_ids, self.item_users, new_items, new_users)
+        self.item_ids, self.item_users = _subtract_counts(ids, renters, old_items, old_users)
+        return True
+
+    # Index
+
+    def _build_index(self, cursor):
+        equipment = fetch_columns(cursor, [
+            ("equipment_id", "equipment_id", ">i4"),
+            ("category", "hashtext(COALESCE(category, ''))", ">i4"),
+            ("daily_price", "GREATEST(daily_price, 0.01)::float8", ">f8"),
+            ("available", "(status <> 'unavailable')::int4", ">i4"),
+        ], "FROM equipment")
+        order = np.argsort(equipment["equipment_id"])
+        ids = equipment["equipment_id"][order].astype(np.int64)
+        category = equipment["category"][order]
+        price = equipment["daily_price"][order]
+        available = equipment["available"][order].astype(bool)
+
+        # Co-rental cosine: count(a, b) / sqrt(renters(a) * renters(b))
+        a = self.pair_keys >> 32
+        b = self.pair_keys & 0xFFFFFFFF
+        renters_a = self.item_users[np.searchsorted(self.item_ids, a)] if len(a) else a
+        renters_b = self.item_users[np.searchsorted(self.item_ids, b)] if len(b) else b
+        cosine = self.pair_counts / np.sqrt(renters_a * renters_b) if len(a) else np.empty(0)
+
+        # Content: nearest prices within the same category, both directions
+        by_price = np.lexsort((price, category))
+        c_ids, c_category, c_price = ids[by_price], category[by_price], price[by_price]
+        content_a, content_b, content_score = [], [], []
+        for shift in range(1, CONTENT_NEIGHBOURS + 1):
+            if shift >= len(c_ids):
+                break
+            same = c_category[:-shift] == c_category[shift:]
+            low, high = c_ids[:-shift][same], c_ids[shift:][same]
+            ratio = c_price[:-shift][same] / c_price[shift:][same]
+            score = CONTENT_WEIGHT * np.minimum(ratio, 1 / ratio)
+            content_a += [low, high]
+            content_b += [high, low]
+            content_score += [score, score]
+
+        all_a = np.concatenate([a] + content_a).astype(np.int64)
+        all_b = np.concatenate([b] + content_b).astype(np.int64)
+        keys, inverse = np.unique(_pair_key(all_a, all_b), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([cosine] + content_score), minlength=len(keys))
+        a, b = keys >> 32, keys & 0xFFFFFFFF
+
+        # Only recommend listings that still exist and can be rented
+        position = np.minimum(np.searchsorted(ids, b), max(len(ids) - 1, 0))
+        valid = (ids[position] == b) & available[position] if len(ids) else np.zeros(len(b), dtype=bool)
+        a, b, scores = a[valid], b[valid], scores[valid]
+
+        # Top-K per item
+        order = np.lexsort((-scores, a))
+        a, b, scores = a[order], b[order], scores[order]
+        first = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]) if len(a) else _EMPTY_KEYS
+        lengths = np.diff(np.r_[first, len(a)])
+        rank = np.arange(len(a)) - np.repeat(first, lengths)
+        top = rank < TOP_K
+        a, b, scores = a[top], b[top], scores[top]
+        item_ids, counts = np.unique(a, return_counts=True)
+        return SimilarityIndex(item_ids, np.r_[0, np.cumsum(counts)], b, scores)
+
+    def refresh(self, full: bool = False):
+        """Rebuild (or incrementally update) counts and swap in a new index"""
+        with self.lock:
+            started = time.perf_counter()
+            full = full or self.index is None or time.monotonic() - self.built_at >= FULL_REBUILD_SECONDS
+            conn = get_read_db()
+            try:
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                cursor = conn.cursor()
+                if full:
+                    self._full_counts(cursor)
+                elif not self._incremental_counts(cursor):
+                    conn.rollback()
+                    return self.index
+                self.index = self._build_index(cursor)
+                conn.rollback()
+                cursor.close()
+            finally:
+                conn.close()
+
+            if full:
+                self.built_at = time.monotonic()
+                self.stats["full_builds"] += 1
+            else:
+                self.stats["incremental_updates"] += 1
+            self.stats["pairs"] = int(len(self.pair_keys))
+            self.stats["last_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return self.index
+
+    def get_index(self) -> SimilarityIndex:
+        return self.index if self.index is not None else self.refresh()
+
+
+recommender = Recommender()
+
+
+async def run_forever():
+    """Fold new reservations into this worker's index once something has asked for it"""
+    while True:
+        await asyncio.sleep(REFRESH_SECONDS)
+        if recommender.index is None:
+            continue
+        try:
+            await asyncio.to_thread(recommender.refresh)
+        except Exception as e:
+            print(f"[recommendations] refresh failed: {e}")
+
+
+# GET listings similar to one equipment (co-rentals, then same category at a similar price)
+@router.get("/{equipment_id}/similar")
+def get_similar_equipment(equipment_id: int, limit: int = TOP_K, details: bool = False):
+    similar = recommender.get_index().lookup(equipment_id, min(max(limit, 1), TOP_K))
+    if not details or not similar:
+        return {"equipment_id": equipment_id, "similar": similar}
+
+    conn = get_read_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("""
+            SELECT equipment_id, name, category, daily_price, photo_url, owner_username,
+                   pickup_location, status, rating_avg, rating_count
+            FROM equipment
+            WHERE equipment_id = ANY(%s)
+        """, ([item['equipment_id'] for item in similar],))
+        rows = {row['equipment_id']: row for row in cursor.fetchall()}
+        cursor.close()
+    finally:
+        conn.close()
+
+    return {
+        "equipment_id": equipment_id,
+        "similar": [dict(item, **rows[item['equipment_id']]) for item in similar if item['equipment_id'] in rows]
+    }
@@ -1,10 +1,25 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response, Depends
 from psycopg2.extras import RealDictCursor
 from .database import get_db
-from .schemas import ReportCreate, ReportUpdate, ReportResponse
+from .schemas import ReportCreate, ReportUpdate, ReportResponse, ReportClaimRequest
+from .versioning import parse_if_match, set_etag
+from .identity import require_role
+from . import counters
 
 router = APIRouter()
 
+# Reports handed out per claim
+MAX_CLAIM_SIZE = 50
+# Bounds on how long a claim keeps a report away from other moderators
+MAX_LEASE_SECONDS = 60 * 60
+MIN_LEASE_SECONDS = 30
+
+_CLAIM_COLUMNS = """
+    report_id, reporter_username, report_type, subject, description,
+    equipment_id, reservation_id, status, priority, created_at, version,
+    claimed_by, claim_expires_at
+"""
+
 
 # CREATE a new report
 @router.post("/", response_model=ReportResponse)
@@ -24,7 +39,7 @@ def create_report(
                               equipment_id, reservation_id, priority)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
             RETURNING report_id, reporter_username, report_type, subject, description, 
-                      equipment_id, reservation_id, status, priority, created_at
+                      equipment_id, reservation_id, status, priority, created_at, version
         """, (reporter_username, report.report_type, report.subject, report.description,
               report.equipment_id, report.reservation_id, report.priority or "medium"))
         
@@ -45,7 +60,7 @@ def get_all_reports():
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT report_id, reporter_username, report_type, subject, description,
-                   equipment_id, reservation_id, status, priority, created_at
+                   equipment_id, reservation_id, status, priority, created_at, version
             FROM report
         """)
         reports = cursor.fetchall()
@@ -64,7 +79,7 @@ def get_reports_by_status(status: str):
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT report_id, reporter_username, report_type, subject, description,
-                   equipment_id, reservation_id, status, priority, created_at
+                   equipment_id, reservation_id, status, priority, created_at, version
             FROM report
             WHERE status = %s
         """, (status,))
@@ -75,16 +90,106 @@ def get_reports_by_status(status: str):
         conn.close()
 
 
+# CLAIM the next open reports for a moderator
+# Rows locked by a concurrent claim are skipped, not waited on, so moderators
+# never block each other; the partial index keeps this to the open backlog
+@router.post("/claim")
+def claim_reports(claim: ReportClaimRequest, moderator=Depends(require_role("Admin"))):
+    """Lease up to `limit` open reports, highest priority and oldest first"""
+    limit = min(max(claim.limit, 1), MAX_CLAIM_SIZE)
+    lease_seconds = min(max(claim.lease_seconds, MIN_LEASE_SECONDS), MAX_LEASE_SECONDS)
+
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"""
+            UPDATE report
+            SET claimed_by = %s, claim_expires_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+            WHERE report_id IN (
+                SELECT report_id
+                FROM report
+                WHERE status = 'open'
+                  AND (claim_expires_at IS NULL OR claim_expires_at < CURRENT_TIMESTAMP)
+                ORDER BY priority_rank, created_at, report_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING priority_rank, {_CLAIM_COLUMNS}
+        """, (moderator['UserName_PK'], lease_seconds, limit))
+        reports = cursor.fetchall()
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    # UPDATE ... RETURNING doesn't keep the subquery's order
+    reports.sort(key=lambda r: (r['priority_rank'], r['created_at'], r['report_id']))
+    for report in reports:
+        del report['priority_rank']
+    return {
+        "reports": reports,
+        "lease_expires_at": reports[0]['claim_expires_at'] if reports else None,
+    }
+
+
+def _update_claim(report_id: int, moderator: str, lease_seconds):
+    """Renew (lease_seconds) or release (None) a claim the moderator currently holds"""
+    conn = get_db()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"""
+            UPDATE report
+            SET claimed_by = CASE WHEN %(lease)s::int IS NULL THEN NULL ELSE claimed_by END,
+                claim_expires_at = CURRENT_TIMESTAMP + %(lease)s::int * INTERVAL '1 second'
+            WHERE report_id = %(report_id)s
+              AND claimed_by = %(moderator)s
+              AND claim_expires_at >= CURRENT_TIMESTAMP
+            RETURNING {_CLAIM_COLUMNS}
+        """, {"lease": lease_seconds, "report_id": report_id, "moderator": moderator})
+        report = cursor.fetchone()
+        if not report:
+            conn.rollback()
+            cursor.execute("SELECT report_id FROM report WHERE report_id = %s", (report_id,))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail="Report not found")
+            raise HTTPException(status_code=409, detail="Report is not claimed by you, or the claim has expired")
+        conn.commit()
+        cursor.close()
+        return report
+    finally:
+        conn.close()
+
+
+# RENEW a claim before its lease runs out
+@router.post("/{report_id}/renew")
+def renew_report_claim(report_id: int, lease_seconds: int = 300, moderator=Depends(require_role("Admin"))):
+    lease_seconds = min(max(lease_seconds, MIN_LEASE_SECONDS), MAX_LEASE_SECONDS)
+    return _update_claim(report_id, moderator['UserName_PK'], lease_seconds)
+
+
+# RELEASE a claim so the report goes back to the queue
+@router.post("/{report_id}/release")
+def release_report_claim(report_id: int, moderator=Depends(require_role("Admin"))):
+    return _update_claim(report_id, moderator['UserName_PK'], None)
+
+
+# GET report count (declared before /{report_id} so "count" isn't parsed as an id)
+@router.get("/count")
+def get_report_count(approximate: bool = False):
+    """Get total count of reports, with counts by status and priority"""
+    return counters.count("reports", approximate)
+
+
 # GET specific report
 @router.get("/{report_id}", response_model=ReportResponse)
-def get_report(report_id: int):
+def get_report(report_id: int, response: Response):
     """Get a specific report"""
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT report_id, reporter_username, report_type, subject, description,
-                   equipment_id, reservation_id, status, priority, created_at
+                   equipment_id, reservation_id, status, priority, created_at, version
             FROM report
             WHERE report_id = %s
         """, (report_id,))
@@ -94,42 +199,62 @@ def get_report(report_id: int):
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
         
+        set_etag(response, report)
         return report
     finally:
         conn.close()
 
 
+# Explain why a conditional report write matched no rows: missing row or stale version
+def _raise_write_failure(cursor, report_id: int):
+    cursor.execute("SELECT report_id FROM report WHERE report_id = %s", (report_id,))
+    
+    if not cursor.fetchone():
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    raise HTTPException(status_code=412, detail="Report was modified by another request")
+
+
 # UPDATE report
 @router.put("/{report_id}", response_model=ReportResponse)
-def update_report(report_id: int, report_update: ReportUpdate):
+def update_report(
+    report_id: int,
+    report_update: ReportUpdate,
+    response: Response,
+    if_match: str = Header(None, alias="If-Match")
+):
     """Update a report"""
+    expected_version = parse_if_match(if_match)
+    
+    # Build update query
+    updates = {}
+    if report_update.status:
+        updates['status'] = report_update.status
+    if report_update.priority:
+        updates['priority'] = report_update.priority
+    
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("""
-            SELECT report_id FROM report
-            WHERE report_id = %s
-        """, (report_id,))
-        
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Report not found")
-        
-        # Build update query
-        updates = {}
-        if report_update.status:
-            updates['status'] = report_update.status
-        if report_update.priority:
-            updates['priority'] = report_update.priority
-        
         if not updates:
             cursor.execute("""
                 SELECT report_id, reporter_username, report_type, subject, description,
-                       equipment_id, reservation_id, status, priority, created_at
+                       equipment_id, reservation_id, status, priority, created_at, version
                 FROM report
                 WHERE report_id = %s
             """, (report_id,))
-            return cursor.fetchone()
+            report = cursor.fetchone()
+            cursor.close()
+            
+            if not report:
+                raise HTTPException(status_code=404, detail="Report not found")
+
+            if expected_version is not None and report['version'] != expected_version:
+                raise HTTPException(status_code=412, detail="Report was modified by another request")
+
+            set_etag(response, report)
+            return report
         
         set_clauses = []
         values = []
@@ -137,20 +262,30 @@ def update_report(report_id: int, report_update: ReportUpdate):
             set_clauses.append(f"{field} = %s")
             values.append(value)
         
+        conditions = "report_id = %s"
         values.append(report_id)
+        if expected_version is not None:
+            conditions += " AND version = %s"
+            values.append(expected_version)
         
         query = f"""
             UPDATE report
-            SET {', '.join(set_clauses)}
-            WHERE report_id = %s
+            SET {', '.join(set_clauses)}, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE {conditions}
             RETURNING report_id, reporter_username, report_type, subject, description,
-                     equipment_id, reservation_id, status, priority, created_at
+                     equipment_id, reservation_id, status, priority, created_at, version
         """
         
         cursor.execute(query, values)
         updated_report = cursor.fetchone()
+        
+        if not updated_report:
+            conn.rollback()
+            _raise_write_failure(cursor, report_id)
+        
         conn.commit()
         cursor.close()
+        set_etag(response, updated_report)
         return updated_report
     finally:
         conn.close()
@@ -158,36 +293,29 @@ def update_report(report_id: int, report_update: ReportUpdate):
 
 # DELETE report
 @router.delete("/{report_id}")
-def delete_report(report_id: int):
+def delete_report(report_id: int, if_match: str = Header(None, alias="If-Match")):
     """Delete a report"""
+    expected_version = parse_if_match(if_match)
+    
     conn = get_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("SELECT report_id FROM report WHERE report_id = %s", (report_id,))
+        conditions = "report_id = %s"
+        values = [report_id]
+        if expected_version is not None:
+            conditions += " AND version = %s"
+            values.append(expected_version)
+        
+        cursor.execute(f"DELETE FROM report WHERE {conditions} RETURNING report_id", values)
         
         if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Report not found")
+            conn.rollback()
+            _raise_write_failure(cursor, report_id)
         
-        cursor.execute("DELETE FROM report WHERE report_id = %s", (report_id,))
         conn.commit()
         cursor.close()
         
         return {"message": "Report deleted successfully"}
     finally:
         conn.close()
-
-
-# GET report count
-@router.get("/count")
-def get_report_count():
-    """Get total count of reports"""
-    conn = get_db()
-    try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT COUNT(*) as count FROM report")
-        result = cursor.fetchone()
-        cursor.close()
-        return {"count": result['count']}
-    finally:
-        conn.close()
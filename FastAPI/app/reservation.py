@@ -1,13 +1,31 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import json
 from datetime import date
+from decimal import Decimal
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
 
-from .schemas import ReservationCreate, ReservationUpdate, ReservationResponse
+from .database import get_read_db, mark_write
+from .schemas import ReservationCreate, ReservationUpdate, ReservationBatchUpdate, ReservationQuoteRequest, ReservationResponse
+from .versioning import parse_if_match, set_etag
+from .idempotency import run_idempotent, fingerprint
+from .events import broker, notify_reservation, notify_reservations, TooManyConnections
+from .outbox import enqueue, enqueue_many
+from .pricing import quote, quote_many, MAX_QUOTE_ITEMS
 
 router = APIRouter()
 
+# Status changes an owner may apply in bulk: new status -> statuses it can come from
+OWNER_TRANSITIONS = {
+    'running': ('pending',),
+    'returned': ('running',),
+    'completed': ('returned',),
+    'cancelled': ('pending',),
+}
+MAX_BATCH_SIZE = 500
+
 # Database connection parameters
 DB_PARAMS = {
     'host': 'localhost',
@@ -35,7 +53,7 @@ def get_all_reservations():
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT reservation_id, equipment_id, owner_username, reserver_username, 
-                   status, start_date, end_date, per_day_price, total_price, review_id, created_at
+                   status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
             FROM reservation
         """)
         reservations = cursor.fetchall()
@@ -48,7 +66,9 @@ def get_all_reservations():
 @router.post("/", response_model=ReservationResponse)
 def create_reservation(
     reservation: ReservationCreate,
-    reserver_username: str = Header(None, convert_underscores=False)
+    response: Response,
+    reserver_username: str = Header(None, convert_underscores=False),
+    idempotency_key: str = Header(None, alias="Idempotency-Key")
 ):
     print(f"\n=== CREATE RESERVATION REQUEST ===")
     print(f"Equipment ID: {reservation.equipment_id}")
@@ -60,81 +80,118 @@ def create_reservation(
         print("ERROR: reserver_username header is required")
         raise HTTPException(status_code=400, detail="reserver_username header is required")
     
-    conn = get_db_connection()
+    def insert_reservation():
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            
+            # Get equipment details
+            cursor.execute("""
+                SELECT equipment_id, name, owner_username, daily_price
+                FROM equipment
+                WHERE equipment_id = %s
+            """, (reservation.equipment_id,))
+            equipment = cursor.fetchone()
+            
+            if not equipment:
+                print(f"ERROR: Equipment not found with ID {reservation.equipment_id}")
+                raise HTTPException(status_code=404, detail="Equipment not found")
+            
+            print(f"Equipment found: {equipment['name']}, Owner: {equipment['owner_username']}")
+            
+            # Calculate total price
+            price = quote(equipment, reservation.start_date, reservation.end_date)
+            total_price = price['total']
+            print(f"Days: {price['days']}, Daily Price: {equipment['daily_price']}, Total: {total_price}")
+            
+            # Insert new reservation
+            cursor.execute("""
+                INSERT INTO reservation 
+                (equipment_id, owner_username, reserver_username, status, start_date, end_date, per_day_price, total_price)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING reservation_id, equipment_id, owner_username, reserver_username, 
+                          status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
+            """, (
+                reservation.equipment_id,
+                equipment['owner_username'],
+                reserver_username,
+                'pending',
+                reservation.start_date,
+                reservation.end_date,
+                equipment['daily_price'],
+                total_price
+            ))
+            
+            new_reservation = cursor.fetchone()
+            notify_reservation(cursor, "created", new_reservation)
+            enqueue(cursor, "reservation.changed", new_reservation['equipment_id'], {"reservation_id": new_reservation['reservation_id']})
+            conn.commit()
+            cursor.close()
+            mark_write(reserver_username, equipment['owner_username'])
+            
+            print(f"SUCCESS: Reservation created with ID {new_reservation['reservation_id']}")
+            print(f"=== END CREATE RESERVATION ===\n")
+            return new_reservation
+            
+        except HTTPException as he:
+            conn.rollback()
+            cursor.close()
+            raise he
+        except Exception as e:
+            conn.rollback()
+            print(f"ERROR during save: {str(e)}")
+            print(f"=== END CREATE RESERVATION ===\n")
+            cursor.close()
+            raise HTTPException(status_code=500, detail=f"Failed to create reservation: {str(e)}")
+        finally:
+            conn.close()
+    
+    new_reservation, replayed = run_idempotent(
+        f"POST /reservation/:{reserver_username}",
+        idempotency_key,
+        fingerprint(reservation.equipment_id, reservation.start_date, reservation.end_date),
+        insert_reservation
+    )
+    if replayed:
+        print(f"Replayed stored response for Idempotency-Key {idempotency_key}")
+        response.headers["Idempotent-Replayed"] = "true"
+    return new_reservation
+
+# QUOTE prices for many (equipment, dates) without creating reservations
+@router.post("/quote")
+def quote_reservations(request: ReservationQuoteRequest):
+    """
+    Price up to MAX_QUOTE_ITEMS rentals with one equipment lookup.
+    Items that cannot be priced carry an "error" instead of a total.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(request.items) > MAX_QUOTE_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUOTE_ITEMS} items per quote")
+    
+    conn = get_read_db()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get equipment details
-        cursor.execute("""
-            SELECT equipment_id, name, owner_username, daily_price
-            FROM equipment
-            WHERE equipment_id = %s
-        """, (reservation.equipment_id,))
-        equipment = cursor.fetchone()
-        
-        if not equipment:
-            print(f"ERROR: Equipment not found with ID {reservation.equipment_id}")
-            raise HTTPException(status_code=404, detail="Equipment not found")
-        
-        print(f"Equipment found: {equipment['name']}, Owner: {equipment['owner_username']}")
-        
-        # Calculate total price
-        days = (reservation.end_date - reservation.start_date).days
-        if days <= 0:
-            print(f"ERROR: Invalid date range. Days: {days}")
-            raise HTTPException(status_code=400, detail="End date must be after start date")
-        
-        total_price = float(equipment['daily_price']) * days
-        print(f"Days: {days}, Daily Price: {equipment['daily_price']}, Total: {total_price}")
-        
-        # Insert new reservation
-        cursor.execute("""
-            INSERT INTO reservation 
-            (equipment_id, owner_username, reserver_username, status, start_date, end_date, per_day_price, total_price)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING reservation_id, equipment_id, owner_username, reserver_username, 
-                      status, start_date, end_date, per_day_price, total_price, review_id, created_at
-        """, (
-            reservation.equipment_id,
-            equipment['owner_username'],
-            reserver_username,
-            'pending',
-            reservation.start_date,
-            reservation.end_date,
-            equipment['daily_price'],
-            total_price
-        ))
-        
-        new_reservation = cursor.fetchone()
-        conn.commit()
+        quotes = quote_many(cursor, [(item.equipment_id, item.start_date, item.end_date) for item in request.items])
         cursor.close()
-        
-        print(f"SUCCESS: Reservation created with ID {new_reservation['reservation_id']}")
-        print(f"=== END CREATE RESERVATION ===\n")
-        return new_reservation
-        
-    except HTTPException as he:
-        conn.rollback()
-        cursor.close()
-        raise he
-    except Exception as e:
-        conn.rollback()
-        print(f"ERROR during save: {str(e)}")
-        print(f"=== END CREATE RESERVATION ===\n")
-        cursor.close()
-        raise HTTPException(status_code=500, detail=f"Failed to create reservation: {str(e)}")
     finally:
         conn.close()
+    
+    return {
+        "quotes": quotes,
+        "total": sum((item['total'] for item in quotes if 'total' in item), Decimal(0)),
+        "currency": "BDT"
+    }
 
 # GET all reservations for reserver
 @router.get("/reserver/{username}", response_model=list[ReservationResponse])
 def get_reserver_reservations(username: str):
-    conn = get_db_connection()
+    conn = get_read_db(username)
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT reservation_id, equipment_id, owner_username, reserver_username, 
-                   status, start_date, end_date, per_day_price, total_price, review_id, created_at
+                   status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
             FROM reservation
             WHERE reserver_username = %s
         """, (username,))
@@ -147,12 +204,12 @@ def get_reserver_reservations(username: str):
 # GET all reservations for owner
 @router.get("/owner/{username}", response_model=list[ReservationResponse])
 def get_owner_reservations(username: str):
-    conn = get_db_connection()
+    conn = get_read_db(username)
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT reservation_id, equipment_id, owner_username, reserver_username, 
-                   status, start_date, end_date, per_day_price, total_price, review_id, created_at
+                   status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
             FROM reservation
             WHERE owner_username = %s
         """, (username,))
@@ -162,15 +219,155 @@ def get_owner_reservations(username: str):
     finally:
         conn.close()
 
+# STREAM reservation events for a user (Server-Sent Events)
+@router.get("/events/{username}")
+async def stream_reservation_events(username: str):
+    """
+    Push reservation changes where the user is owner or reserver, instead of
+    polling /reservation/owner/{username} and /reservation/reserver/{username}
+    """
+    try:
+        queue = broker.subscribe(username)
+    except TooManyConnections:
+        raise HTTPException(status_code=503, detail="Too many event connections", headers={"Retry-After": "30"})
+    
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                batch = await broker.next_batch(queue)
+                if batch is None:
+                    break
+                if not batch:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield "".join(f"event: reservation\ndata: {json.dumps(event)}\n\n" for event in batch)
+        finally:
+            broker.unsubscribe(username, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# STREAM reservation events for a user (WebSocket)
+@router.websocket("/ws/{username}")
+async def reservation_events_socket(websocket: WebSocket, username: str):
+    try:
+        queue = broker.subscribe(username)
+    except TooManyConnections:
+        await websocket.close(code=1013)
+        return
+    
+    await websocket.accept()
+    try:
+        while True:
+            batch = await broker.next_batch(queue)
+            if batch is None:
+                await websocket.close(code=1008)
+                break
+            # Heartbeats are sent as an empty batch
+            await websocket.send_json({"type": "reservation_events", "events": batch})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broker.unsubscribe(username, queue)
+
+# UPDATE status of many reservations (owner)
+@router.patch("/batch")
+def batch_update_reservations(
+    batch: ReservationBatchUpdate,
+    owner_username: str = Header(None, convert_underscores=False)
+):
+    """
+    Apply one status transition to many reservations in a single transaction.
+    Each id is reported as updated, not_found, forbidden or invalid_transition;
+    ids that fail do not block the rest.
+    """
+    if not owner_username:
+        raise HTTPException(status_code=400, detail="owner_username header is required")
+    
+    from_statuses = OWNER_TRANSITIONS.get(batch.status)
+    if from_statuses is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"status must be one of: {', '.join(OWNER_TRANSITIONS)}"
+        )
+    
+    reservation_ids = list(dict.fromkeys(batch.reservation_ids))
+    if not reservation_ids:
+        raise HTTPException(status_code=400, detail="reservation_ids must not be empty")
+    if len(reservation_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} reservations per batch")
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        
+        # Ownership and the allowed previous status are both checked by the UPDATE
+        cursor.execute("""
+            UPDATE reservation
+            SET status = %s, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE reservation_id = ANY(%s)
+              AND owner_username = %s
+              AND status = ANY(%s)
+            RETURNING reservation_id, equipment_id, owner_username, reserver_username, status, version
+        """, (batch.status, reservation_ids, owner_username, list(from_statuses)))
+        updated = cursor.fetchall()
+        
+        # Explain the ids that were not updated with one lookup
+        results = {row['reservation_id']: {"status": "updated", "version": row['version']} for row in updated}
+        missing = [reservation_id for reservation_id in reservation_ids if reservation_id not in results]
+        if missing:
+            cursor.execute("""
+                SELECT reservation_id, owner_username, status
+                FROM reservation
+                WHERE reservation_id = ANY(%s)
+            """, (missing,))
+            found = {row['reservation_id']: row for row in cursor.fetchall()}
+            for reservation_id in missing:
+                row = found.get(reservation_id)
+                if row is None:
+                    results[reservation_id] = {"status": "not_found"}
+                elif row['owner_username'] != owner_username:
+                    results[reservation_id] = {"status": "forbidden"}
+                else:
+                    results[reservation_id] = {
+                        "status": "invalid_transition",
+                        "detail": f"Cannot change a {row['status']} reservation to {batch.status}"
+                    }
+        
+        # Side effects for the whole batch: one NOTIFY statement and one outbox event per equipment
+        notify_reservations(cursor, "updated", updated)
+        enqueue_many(cursor, "reservation.changed", [row['equipment_id'] for row in updated])
+        conn.commit()
+        cursor.close()
+        if updated:
+            mark_write(owner_username, *{row['reserver_username'] for row in updated})
+        
+        return {
+            "status": batch.status,
+            "updated": len(updated),
+            "failed": len(reservation_ids) - len(updated),
+            "results": [
+                {"reservation_id": reservation_id, **results[reservation_id]}
+                for reservation_id in reservation_ids
+            ]
+        }
+    finally:
+        conn.close()
+
 # GET specific reservation
 @router.get("/{reservation_id}", response_model=ReservationResponse)
-def get_reservation(reservation_id: int):
+def get_reservation(reservation_id: int, response: Response):
     conn = get_db_connection()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         cursor.execute("""
             SELECT reservation_id, equipment_id, owner_username, reserver_username, 
-                   status, start_date, end_date, per_day_price, total_price, review_id, created_at
+                   status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
             FROM reservation
             WHERE reservation_id = %s
         """, (reservation_id,))
@@ -180,63 +377,116 @@ def get_reservation(reservation_id: int):
         if not reservation:
             raise HTTPException(status_code=404, detail="Reservation not found")
         
+        set_etag(response, reservation)
         return reservation
     finally:
         conn.close()
 
+# Explain why a conditional reservation write matched no rows
+def _diagnose_write_failure(cursor, reservation_id: int, username: str, expected_version,
+                         allowed_roles: tuple, forbidden_detail: str):
+    cursor.execute("""
+        SELECT owner_username, reserver_username, status, version
+        FROM reservation
+        WHERE reservation_id = %s
+    """, (reservation_id,))
+    reservation = cursor.fetchone()
+    
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    
+    if username not in [reservation[role] for role in allowed_roles]:
+        raise HTTPException(status_code=403, detail=forbidden_detail)
+    
+    if expected_version is not None and reservation['version'] != expected_version:
+        raise HTTPException(status_code=412, detail="Reservation was modified by another request")
+    
+    return reservation
+
+
 # UPDATE reservation status
 @router.put("/{reservation_id}", response_model=ReservationResponse)
 def update_reservation(
     reservation_id: int,
     reservation_update: ReservationUpdate,
-    owner_username: str = Header(None, convert_underscores=False)
+    response: Response,
+    owner_username: str = Header(None, convert_underscores=False),
+    if_match: str = Header(None, alias="If-Match")
 ):
+    expected_version = parse_if_match(if_match)
+    
+    # Build update query dynamically
+    update_data = {
+        field: value
+        for field, value in reservation_update.dict(exclude_unset=True).items()
+        if value is not None
+    }
+    
     conn = get_db_connection()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("""
-            SELECT reservation_id, equipment_id, owner_username, reserver_username, 
-                   status, start_date, end_date, per_day_price, total_price, review_id, created_at
-            FROM reservation
-            WHERE reservation_id = %s
-        """, (reservation_id,))
-        reservation = cursor.fetchone()
-        
-        if not reservation:
-            raise HTTPException(status_code=404, detail="Reservation not found")
-        
-        # Only owner or reserver can update
-        if owner_username != reservation['owner_username'] and owner_username != reservation['reserver_username']:
-            raise HTTPException(status_code=403, detail="Not authorized to update this reservation")
-        
-        # Build update query dynamically
-        update_data = reservation_update.dict(exclude_unset=True)
         if not update_data:
+            cursor.execute("""
+                SELECT reservation_id, equipment_id, owner_username, reserver_username, 
+                       status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
+                FROM reservation
+                WHERE reservation_id = %s
+            """, (reservation_id,))
+            reservation = cursor.fetchone()
+            cursor.close()
+            
+            if not reservation:
+                raise HTTPException(status_code=404, detail="Reservation not found")
+            
+            # Only owner or reserver can update
+            if owner_username != reservation['owner_username'] and owner_username != reservation['reserver_username']:
+                raise HTTPException(status_code=403, detail="Not authorized to update this reservation")
+
+            if expected_version is not None and reservation['version'] != expected_version:
+                raise HTTPException(status_code=412, detail="Reservation was modified by another request")
+
+            set_etag(response, reservation)
             return reservation
         
         set_clauses = []
         values = []
         for field, value in update_data.items():
-            if value is not None:
-                set_clauses.append(f"{field} = %s")
-                values.append(value)
+            set_clauses.append(f"{field} = %s")
+            values.append(value)
         
-        values.append(reservation_id)
+        # Only owner or reserver can update; checked by the UPDATE itself
+        conditions = "reservation_id = %s AND %s IN (owner_username, reserver_username)"
+        values.extend([reservation_id, owner_username])
+        if expected_version is not None:
+            conditions += " AND version = %s"
+            values.append(expected_version)
         
         query = f"""
             UPDATE reservation
-            SET {', '.join(set_clauses)}
-            WHERE reservation_id = %s
+            SET {', '.join(set_clauses)}, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE {conditions}
             RETURNING reservation_id, equipment_id, owner_username, reserver_username, 
-                      status, start_date, end_date, per_day_price, total_price, review_id, created_at
+                      status, start_date, end_date, per_day_price, total_price, review_id, created_at, version
         """
         
         cursor.execute(query, values)
         updated_reservation = cursor.fetchone()
+        
+        if not updated_reservation:
+            conn.rollback()
+            _diagnose_write_failure(cursor, reservation_id, owner_username, expected_version,
+                                 ('owner_username', 'reserver_username'),
+                                 "Not authorized to update this reservation")
+            raise HTTPException(status_code=409, detail="Reservation changed while processing the request")
+        
+        notify_reservation(cursor, "updated", updated_reservation)
+        enqueue(cursor, "reservation.changed", updated_reservation['equipment_id'], {"reservation_id": updated_reservation['reservation_id']})
         conn.commit()
         cursor.close()
+        mark_write(updated_reservation['owner_username'], updated_reservation['reserver_username'])
         
+        set_etag(response, updated_reservation)
         return updated_reservation
     finally:
         conn.close()
@@ -245,35 +495,42 @@ def update_reservation(
 @router.delete("/{reservation_id}")
 def delete_reservation(
     reservation_id: int,
-    reserver_username: str = Header(None, convert_underscores=False)
+    reserver_username: str = Header(None, convert_underscores=False),
+    if_match: str = Header(None, alias="If-Match")
 ):
+    expected_version = parse_if_match(if_match)
+    
     conn = get_db_connection()
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("""
-            SELECT reservation_id, reserver_username, status
-            FROM reservation
-            WHERE reservation_id = %s
-        """, (reservation_id,))
-        reservation = cursor.fetchone()
-        
-        if not reservation:
-            raise HTTPException(status_code=404, detail="Reservation not found")
+        conditions = "reservation_id = %s AND reserver_username = %s AND status = 'pending'"
+        values = [reservation_id, reserver_username]
+        if expected_version is not None:
+            conditions += " AND version = %s"
+            values.append(expected_version)
         
-        if reserver_username != reservation['reserver_username']:
-            raise HTTPException(status_code=403, detail="Only reserver can delete reservation")
-        
-        if reservation['status'] != 'pending':
-            raise HTTPException(status_code=400, detail="Can only delete pending reservations")
-        
-        cursor.execute("""
+        cursor.execute(f"""
             DELETE FROM reservation
-            WHERE reservation_id = %s
-        """, (reservation_id,))
+            WHERE {conditions}
+            RETURNING reservation_id, equipment_id, owner_username, reserver_username, status, version
+        """, values)
+        deleted_reservation = cursor.fetchone()
+        
+        if not deleted_reservation:
+            conn.rollback()
+            reservation = _diagnose_write_failure(cursor, reservation_id, reserver_username, expected_version,
+                                               ('reserver_username',),
+                                               "Only reserver can delete reservation")
+            if reservation['status'] != 'pending':
+                raise HTTPException(status_code=400, detail="Can only delete pending reservations")
+            raise HTTPException(status_code=409, detail="Reservation changed while processing the request")
         
+        notify_reservation(cursor, "deleted", deleted_reservation)
+        enqueue(cursor, "reservation.changed", deleted_reservation['equipment_id'], {"reservation_id": deleted_reservation['reservation_id']})
         conn.commit()
         cursor.close()
+        mark_write(deleted_reservation['owner_username'], deleted_reservation['reserver_username'])
         
         return {"message": "Reservation deleted successfully"}
     finally:
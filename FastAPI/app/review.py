@@ -1,12 +1,19 @@
+import base64
 from fastapi import APIRouter, HTTPException
 from psycopg2.extras import RealDictCursor
-from .database import get_db
+from .database import get_db, get_read_db
+from .singleflight import fetch_shared
+from .outbox import enqueue
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
 
+# Page size bounds for review lists
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
 
 class ReviewCreate(BaseModel):
     reservation_id: int
@@ -22,7 +29,7 @@ class ReviewResponse(BaseModel):
     reviewer_username: str
     owner_username: str
     rating: int
-    comment: str = None
+    comment: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -30,6 +37,44 @@ class ReviewResponse(BaseModel):
         from_attributes = True
 
 
+class ReviewPage(BaseModel):
+    reviews: List[ReviewResponse]
+    # Pass back as `cursor` for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
+# Review lists are ordered newest first by (created_at, review_id) and paged
+# by keyset: the cursor is the last row's key, so each page is one index range
+# scan (review_feed_indexes.sql) however many reviews come before it
+def _encode_cursor(row) -> str:
+    key = f"{row['created_at'].isoformat()},{row['review_id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, review_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(",")
+        return datetime.fromisoformat(created_at), int(review_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page_clause(cursor: str, limit: int):
+    """Keyset condition, its parameters and the clamped page size"""
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    if not cursor:
+        return "TRUE", (), limit
+    return "(created_at, review_id) < (%s, %s)", _decode_cursor(cursor), limit
+
+
+def _page(rows, limit: int):
+    """Trim the extra row fetched to detect a next page; returns (rows, next_cursor)"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, _encode_cursor(rows[-1])
+    return rows, None
+
+
 # CREATE review
 @router.post("/", response_model=ReviewResponse)
 def create_review(review_data: ReviewCreate):
@@ -76,20 +121,8 @@ def create_review(review_data: ReviewCreate):
         
         new_review = cursor.fetchone()
         
-        # Update equipment rating
-        cursor.execute("""
-            SELECT AVG(rating) as avg_rating, COUNT(*) as count
-            FROM review
-            WHERE equipment_id = %s
-        """, (review_data.equipment_id,))
-        
-        rating_data = cursor.fetchone()
-        if rating_data:
-            cursor.execute("""
-                UPDATE equipment
-                SET rating_avg = %s, rating_count = %s
-                WHERE equipment_id = %s
-            """, (float(rating_data['avg_rating']), rating_data['count'], review_data.equipment_id))
+        # Equipment rating is recomputed asynchronously by the outbox worker
+        enqueue(cursor, "review.changed", review_data.equipment_id, {"review_id": new_review['review_id']})
         
         conn.commit()
         cursor.close()
@@ -98,43 +131,44 @@ def create_review(review_data: ReviewCreate):
         conn.close()
 
 
-# GET all reviews (for admin panel)
-@router.get("/", response_model=List[ReviewResponse])
-def get_all_reviews():
-    conn = get_db()
+# GET all reviews, newest first (for admin panel)
+@router.get("/", response_model=ReviewPage)
+def get_all_reviews(cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    condition, params, limit = _page_clause(cursor, limit)
+    conn = get_read_db()
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
+        db_cursor = conn.cursor(cursor_factory=RealDictCursor)
+        db_cursor.execute(f"""
             SELECT review_id, reservation_id, equipment_id, reviewer_username, owner_username, 
                    rating, comment, created_at, updated_at
             FROM review
-            ORDER BY created_at DESC
-        """)
-        reviews = cursor.fetchall()
-        cursor.close()
-        return reviews
+            WHERE {condition}
+            ORDER BY created_at DESC, review_id DESC
+            LIMIT %s
+        """, (*params, limit + 1))
+        reviews = db_cursor.fetchall()
+        db_cursor.close()
     finally:
         conn.close()
+    reviews, next_cursor = _page(reviews, limit)
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 
-# GET reviews for equipment
-@router.get("/equipment/{equipment_id}", response_model=List[ReviewResponse])
-def get_equipment_reviews(equipment_id: int):
-    conn = get_db()
-    try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT review_id, reservation_id, equipment_id, reviewer_username, owner_username, 
-                   rating, comment, created_at, updated_at
-            FROM review
-            WHERE equipment_id = %s
-            ORDER BY created_at DESC
-        """, (equipment_id,))
-        reviews = cursor.fetchall()
-        cursor.close()
-        return reviews
-    finally:
-        conn.close()
+# GET reviews for equipment, newest first
+@router.get("/equipment/{equipment_id}", response_model=ReviewPage)
+def get_equipment_reviews(equipment_id: int, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    condition, params, limit = _page_clause(cursor, limit)
+    # Concurrent requests for the same page share one DB round trip
+    reviews = fetch_shared(f"""
+        SELECT review_id, reservation_id, equipment_id, reviewer_username, owner_username, 
+               rating, comment, created_at, updated_at
+        FROM review
+        WHERE equipment_id = %s AND {condition}
+        ORDER BY created_at DESC, review_id DESC
+        LIMIT %s
+    """, (equipment_id, *params, limit + 1), many=True)
+    reviews, next_cursor = _page(reviews, limit)
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 
 # UPDATE review (for admin)
@@ -172,37 +206,10 @@ def update_review(review_id: int, review_data: ReviewCreate):
         
         updated_review = cursor.fetchone()
         
-        # Recalculate rating for old equipment
-        cursor.execute("""
-            SELECT AVG(rating) as avg_rating, COUNT(*) as count
-            FROM review
-            WHERE equipment_id = %s
-        """, (old_equipment_id,))
-        
-        rating_data = cursor.fetchone()
-        if rating_data:
-            cursor.execute("""
-                UPDATE equipment
-                SET rating_avg = %s, rating_count = %s
-                WHERE equipment_id = %s
-            """, (float(rating_data['avg_rating']) if rating_data['avg_rating'] else 0, 
-                  rating_data['count'], old_equipment_id))
-        
-        # Recalculate rating for new equipment
-        cursor.execute("""
-            SELECT AVG(rating) as avg_rating, COUNT(*) as count
-            FROM review
-            WHERE equipment_id = %s
-        """, (review_data.equipment_id,))
-        
-        rating_data = cursor.fetchone()
-        if rating_data:
-            cursor.execute("""
-                UPDATE equipment
-                SET rating_avg = %s, rating_count = %s
-                WHERE equipment_id = %s
-            """, (float(rating_data['avg_rating']) if rating_data['avg_rating'] else 0, 
-                  rating_data['count'], review_data.equipment_id))
+        # Recalculate ratings for the old and new equipment asynchronously
+        enqueue(cursor, "review.changed", old_equipment_id, {"review_id": review_id})
+        if review_data.equipment_id != old_equipment_id:
+            enqueue(cursor, "review.changed", review_data.equipment_id, {"review_id": review_id})
         
         conn.commit()
         cursor.close()
@@ -242,40 +249,18 @@ def delete_review(review_id: int):
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         cursor.execute("""
-            SELECT review_id, equipment_id
-            FROM review
+            DELETE FROM review
             WHERE review_id = %s
+            RETURNING equipment_id
         """, (review_id,))
         review = cursor.fetchone()
         
         if not review:
+            conn.rollback()
             raise HTTPException(status_code=404, detail="Review not found")
         
-        equipment_id = review['equipment_id']
-        
-        # Delete review
-        cursor.execute("DELETE FROM review WHERE review_id = %s", (review_id,))
-        
-        # Recalculate equipment rating
-        cursor.execute("""
-            SELECT AVG(rating) as avg_rating, COUNT(*) as count
-            FROM review
-            WHERE equipment_id = %s
-        """, (equipment_id,))
-        
-        rating_data = cursor.fetchone()
-        if rating_data and rating_data['count'] > 0:
-            cursor.execute("""
-                UPDATE equipment
-                SET rating_avg = %s, rating_count = %s
-                WHERE equipment_id = %s
-            """, (float(rating_data['avg_rating']), rating_data['count'], equipment_id))
-        else:
-            cursor.execute("""
-                UPDATE equipment
-                SET rating_avg = 0.0, rating_count = 0
-                WHERE equipment_id = %s
-            """, (equipment_id,))
+        # Equipment rating is recomputed asynchronously by the outbox worker
+        enqueue(cursor, "review.changed", review['equipment_id'], {"review_id": review_id})
         
         conn.commit()
         cursor.close()
@@ -291,7 +276,7 @@ def get_owner_average_rating(owner_username: str):
     Calculate average rating for an owner by averaging all reviews 
     from returned or completed rentals where owner_username matches
     """
-    conn = get_db()
+    conn = get_read_db(owner_username)
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
@@ -319,65 +304,61 @@ def get_owner_average_rating(owner_username: str):
 
 # GET detailed rating breakdown for an owner
 @router.get("/owner/{owner_username}/rating-details")
-def get_owner_rating_details(owner_username: str):
+def get_owner_rating_details(owner_username: str, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
     """
-    Get detailed rating breakdown for an owner including all reviews on their equipment
+    Get detailed rating breakdown for an owner including the reviews on their
+    equipment, newest first and paged. The breakdown is only computed for the
+    first page (no cursor); later pages carry just the reviews.
     """
-    conn = get_db()
+    condition, params, limit = _page_clause(cursor, limit)
+    conn = get_read_db(owner_username)
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
+        db_cursor = conn.cursor(cursor_factory=RealDictCursor)
+        db_cursor.execute(f"""
             SELECT review_id, equipment_id, reviewer_username, rating, comment, created_at
             FROM review
-            WHERE owner_username = %s
-            ORDER BY created_at DESC
-        """, (owner_username,))
-        
-        reviews = cursor.fetchall()
-        cursor.close()
-        
-        if not reviews:
-            return {
-                "owner_username": owner_username,
-                "average_rating": 0.0,
-                "total_reviews": 0,
-                "rating_distribution": {
-                    "5_star": 0,
-                    "4_star": 0,
-                    "3_star": 0,
-                    "2_star": 0,
-                    "1_star": 0
-                },
-                "reviews": []
-            }
-        
-        # Calculate rating distribution
-        rating_distribution = {
-            "5_star": len([r for r in reviews if r['rating'] == 5]),
-            "4_star": len([r for r in reviews if r['rating'] == 4]),
-            "3_star": len([r for r in reviews if r['rating'] == 3]),
-            "2_star": len([r for r in reviews if r['rating'] == 2]),
-            "1_star": len([r for r in reviews if r['rating'] == 1])
-        }
-        
-        average_rating = sum(r['rating'] for r in reviews) / len(reviews)
-        
-        return {
-            "owner_username": owner_username,
-            "average_rating": float(average_rating),
-            "total_reviews": len(reviews),
-            "rating_distribution": rating_distribution,
-            "reviews": [
-                {
-                    "review_id": r['review_id'],
-                    "equipment_id": r['equipment_id'],
-                    "reviewer_username": r['reviewer_username'],
-                    "rating": r['rating'],
-                    "comment": r['comment'],
-                    "created_at": r['created_at'].isoformat() if hasattr(r['created_at'], 'isoformat') else str(r['created_at'])
-                }
-                for r in reviews
-            ]
-        }
+            WHERE owner_username = %s AND {condition}
+            ORDER BY created_at DESC, review_id DESC
+            LIMIT %s
+        """, (owner_username, *params, limit + 1))
+        reviews = db_cursor.fetchall()
+        
+        counts = {}
+        if not cursor:
+            # Index-only scan: the owner index includes rating
+            db_cursor.execute("""
+                SELECT rating, COUNT(*) AS count
+                FROM review
+                WHERE owner_username = %s
+                GROUP BY rating
+            """, (owner_username,))
+            counts = {row['rating']: row['count'] for row in db_cursor.fetchall()}
+        db_cursor.close()
     finally:
         conn.close()
+    
+    reviews, next_cursor = _page(reviews, limit)
+    result = {"owner_username": owner_username}
+    if not cursor:
+        total_reviews = sum(counts.values())
+        result.update({
+            "average_rating": float(sum(rating * count for rating, count in counts.items()) / total_reviews)
+                              if total_reviews else 0.0,
+            "total_reviews": total_reviews,
+            "rating_distribution": {f"{stars}_star": counts.get(stars, 0) for stars in (5, 4, 3, 2, 1)},
+        })
+    result.update({
+        "reviews": [
+            {
+                "review_id": r['review_id'],
+                "equipment_id": r['equipment_id'],
+                "reviewer_username": r['reviewer_username'],
+                "rating": r['rating'],
+                "comment": r['comment'],
+                "created_at": r['created_at'].isoformat() if hasattr(r['created_at'], 'isoformat') else str(r['created_at'])
+            }
+            for r in reviews
+        ],
+        "next_cursor": next_cursor,
+    })
+    return result
@@ -0,0 +1,227 @@
+"""
+Periodic maintenance jobs for reservation lifecycle and equipment aggregates.
+
+Runs inside the API process (started from main.lifespan) or standalone with
+`python -m app.scheduler`. Every job takes a Postgres advisory lock first, so
+running several workers at once never runs the same job twice concurrently.
+"""
+import asyncio
+import os
+import time
+
+import psycopg2
+
+from .database import DB_PARAMS
+from .events import CHANNEL
+from .outbox import purge_processed
+from .counters import compact as compact_counters
+from .rankings import refresh as refresh_equipment_rankings
+
+# Rows/ids handled per transaction, so no job holds row locks for long
+CHUNK_SIZE = 1000
+# Running rentals are marked returned this many days after end_date
+RETURN_GRACE_DAYS = 1
+# Set to "0" when a separate `python -m app.scheduler` worker runs the jobs
+RUN_IN_APP = os.getenv("GEARSHARE_IN_APP_SCHEDULER", "1") == "1"
+
+# Arbitrary base for the jobs' advisory lock keys; each job adds its own fixed offset in JOBS
+_LOCK_BASE = 0x6765_6172_0000
+
+job_stats = {}
+
+
+def _notify_sql(alias: str) -> str:
+    """pg_notify every reservation row in `alias` so connected clients hear about it"""
+    return f"""
+        SELECT COUNT(pg_notify('{CHANNEL}', json_build_object(
+            'type', 'updated',
+            'reservation_id', {alias}.reservation_id,
+            'equipment_id', {alias}.equipment_id,
+            'owner_username', {alias}.owner_username,
+            'reserver_username', {alias}.reserver_username,
+            'status', {alias}.status,
+            'version', {alias}.version
+        )::text))
+        FROM {alias}
+    """
+
+
+def expire_pending_reservations(cursor):
+    """Cancel pending reservations whose start date passed without the owner accepting"""
+    cursor.execute(f"""
+        WITH expired AS (
+            UPDATE reservation
+            SET status = 'cancelled', version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE reservation_id IN (
+                SELECT reservation_id
+                FROM reservation
+                WHERE status = 'pending' AND start_date < CURRENT_DATE
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING reservation_id, equipment_id, owner_username, reserver_username, status, version
+        )
+        {_notify_sql('expired')}
+    """, (CHUNK_SIZE,))
+    return cursor.fetchone()[0]
+
+
+def mark_ended_rentals(cursor):
+    """Mark running rentals as returned once their end date (plus grace) has passed"""
+    cursor.execute(f"""
+        WITH ended AS (
+            UPDATE reservation
+            SET status = 'returned', version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE reservation_id IN (
+                SELECT reservation_id
+                FROM reservation
+                WHERE status = 'running' AND end_date < CURRENT_DATE - %s
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING reservation_id, equipment_id, owner_username, reserver_username, status, version
+        )
+        {_notify_sql('ended')}
+    """, (RETURN_GRACE_DAYS, CHUNK_SIZE))
+    return cursor.fetchone()[0]
+
+
+def refresh_booked_till(cursor, low: int, high: int):
+    """Sync equipment.status/booked_till with the running reservations of ids in [low, high)"""
+    cursor.execute("""
+        UPDATE equipment e
+        SET status = CASE WHEN a.booked_till IS NULL THEN 'available' ELSE 'booked' END,
+            booked_till = a.booked_till,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT eq.equipment_id, MAX(r.end_date) as booked_till
+            FROM equipment eq
+            LEFT JOIN reservation r
+                ON r.equipment_id = eq.equipment_id AND r.status = 'running'
+            WHERE eq.equipment_id >= %s AND eq.equipment_id < %s
+            GROUP BY eq.equipment_id
+        ) a
+        WHERE e.equipment_id = a.equipment_id
+          AND e.status <> 'unavailable'
+          AND (e.booked_till IS DISTINCT FROM a.booked_till
+               OR e.status <> CASE WHEN a.booked_till IS NULL THEN 'available' ELSE 'booked' END)
+    """, (low, high))
+    return cursor.rowcount
+
+
+def reconcile_ratings(cursor, low: int, high: int):
+    """Recompute rating_avg/rating_count from review for equipment ids in [low, high)"""
+    cursor.execute("""
+        UPDATE equipment e
+        SET rating_avg = s.avg_rating, rating_count = s.count
+        FROM (
+            SELECT eq.equipment_id,
+                   COALESCE(ROUND(AVG(r.rating), 1), 0.0) as avg_rating,
+                   COUNT(r.review_id) as count
+            FROM equipment eq
+            LEFT JOIN review r ON r.equipment_id = eq.equipment_id
+            WHERE eq.equipment_id >= %s AND eq.equipment_id < %s
+            GROUP BY eq.equipment_id
+        ) s
+        WHERE e.equipment_id = s.equipment_id
+          AND (e.rating_avg IS DISTINCT FROM s.avg_rating OR e.rating_count IS DISTINCT FROM s.count)
+    """, (low, high))
+    return cursor.rowcount
+
+
+def refresh_equipment_facets(cursor):
+    """Rebuild the catalog facets view without blocking readers"""
+    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY equipment_facets")
+    cursor.execute("SELECT COUNT(*) FROM equipment_facets")
+    return cursor.fetchone()[0]
+
+
+def _run_until_drained(conn, cursor, step):
+    """Repeat a LIMIT-ed step, one transaction per chunk, until it touches no rows"""
+    total = 0
+    while True:
+        changed = step(cursor)
+        conn.commit()
+        total += changed
+        if changed < CHUNK_SIZE:
+            return total
+
+
+def _run_by_id_range(conn, cursor, step):
+    """Apply an id-range step over all equipment, one transaction per chunk"""
+    cursor.execute("SELECT MIN(equipment_id), MAX(equipment_id) FROM equipment")
+    low, high = cursor.fetchone()
+    conn.commit()
+    if low is None:
+        return 0
+    total = 0
+    for start in range(low, high + 1, CHUNK_SIZE):
+        total += step(cursor, start, start + CHUNK_SIZE)
+        conn.commit()
+    return total
+
+
+# name -> (interval seconds, advisory lock key, runner)
+# Lock keys must never change or be reused: workers of different releases run side by side during a deploy
+JOBS = {
+    "expire_pending_reservations": (15 * 60, _LOCK_BASE + 0, lambda conn, cur: _run_until_drained(conn, cur, expire_pending_reservations)),
+    "mark_ended_rentals": (15 * 60, _LOCK_BASE + 1, lambda conn, cur: _run_until_drained(conn, cur, mark_ended_rentals)),
+    "refresh_booked_till": (5 * 60, _LOCK_BASE + 2, lambda conn, cur: _run_by_id_range(conn, cur, refresh_booked_till)),
+    "reconcile_ratings": (60 * 60, _LOCK_BASE + 3, lambda conn, cur: _run_by_id_range(conn, cur, reconcile_ratings)),
+    "purge_outbox": (60 * 60, _LOCK_BASE + 4, lambda conn, cur: purge_processed(cur)),
+    "refresh_equipment_facets": (60, _LOCK_BASE + 5, lambda conn, cur: refresh_equipment_facets(cur)),
+    "compact_counters": (60, _LOCK_BASE + 6, lambda conn, cur: compact_counters(cur)),
+    "refresh_equipment_rankings": (15 * 60, _LOCK_BASE + 7, lambda conn, cur: refresh_equipment_rankings(cur)),
+}
+
+
+def run_job(name: str):
+    """Run one job if no other worker holds its advisory lock; returns rows changed or None"""
+    _, lock_key, runner = JOBS[name]
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (lock_key,))
+        locked = cursor.fetchone()[0]
+        conn.commit()
+        if not locked:
+            return None
+        try:
+            started = time.perf_counter()
+            changed = runner(conn, cursor)
+            conn.commit()
+            elapsed = time.perf_counter() - started
+            job_stats[name] = {
+                "last_run": time.time(),
+                "duration_ms": round(elapsed * 1000, 1),
+                "rows_changed": changed,
+            }
+            print(f"[scheduler] {name}: {changed} rows in {elapsed * 1000:.1f}ms")
+            return changed
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (lock_key,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+async def run_forever(poll_seconds: float = 30.0):
+    """Run each job on its interval; jobs run in a thread so the event loop stays free"""
+    next_run = {name: 0.0 for name in JOBS}
+    while True:
+        now = time.monotonic()
+        for name, (interval, _, _) in JOBS.items():
+            if now < next_run[name]:
+                continue
+            next_run[name] = now + interval
+            try:
+                await asyncio.to_thread(run_job, name)
+            except Exception as e:
+                job_stats.setdefault(name, {})["last_error"] = str(e)
+                print(f"[scheduler] {name} failed: {e}")
+        await asyncio.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_forever())
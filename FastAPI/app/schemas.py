@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import date, datetime
 
 class UserRegister(BaseModel):
@@ -25,6 +25,12 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class UserPage(BaseModel):
+    users: List[UserResponse]
+    # Pass back as `cursor` for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -62,6 +68,7 @@ class EquipmentResponse(BaseModel):
     rating_avg: float
     rating_count: int
     created_at: datetime
+    version: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -81,6 +88,11 @@ class ReportUpdate(BaseModel):
     priority: Optional[str] = None
 
 
+class ReportClaimRequest(BaseModel):
+    limit: int = 10
+    lease_seconds: int = 300
+
+
 class ReportResponse(BaseModel):
     report_id: int
     reporter_username: str
@@ -92,6 +104,7 @@ class ReportResponse(BaseModel):
     status: str
     priority: str
     created_at: datetime
+    version: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -107,6 +120,15 @@ class ReservationUpdate(BaseModel):
     review_id: Optional[int] = None
 
 
+class ReservationQuoteRequest(BaseModel):
+    items: List[ReservationCreate]
+
+
+class ReservationBatchUpdate(BaseModel):
+    reservation_ids: List[int]
+    status: str
+
+
 class ReservationResponse(BaseModel):
     reservation_id: int
     equipment_id: int
@@ -119,6 +141,44 @@ class ReservationResponse(BaseModel):
     total_price: float
     review_id: Optional[int] = None
     created_at: datetime
+    version: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# Bulk moderation: a selection is an id list and/or filters, all ANDed together
+class ReviewSelection(BaseModel):
+    review_ids: Optional[List[int]] = None
+    reviewer_username: Optional[str] = None
+    equipment_id: Optional[int] = None
+    max_rating: Optional[int] = None
+    created_after: Optional[datetime] = None
+
+
+class ReportSelection(BaseModel):
+    report_ids: Optional[List[int]] = None
+    reporter_username: Optional[str] = None
+    status: Optional[str] = None
+    report_type: Optional[str] = None
+    created_before: Optional[datetime] = None
+
+
+class ReportBulkUpdate(BaseModel):
+    where: ReportSelection
+    status: Optional[str] = None
+    priority: Optional[str] = None
+
+
+class UserSelection(BaseModel):
+    usernames: Optional[List[str]] = None
+    email_domain: Optional[str] = None
+    role: Optional[str] = None
+    verification_status: Optional[bool] = None
+    created_after: Optional[datetime] = None
+
+
+class UserBulkUpdate(BaseModel):
+    where: UserSelection
+    role: Optional[str] = None
+    verification_status: Optional[bool] = None
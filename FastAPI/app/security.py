@@ -1,14 +1,78 @@
+import asyncio
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+
+from fastapi import HTTPException
 from jose import jwt
+from passlib.context import CryptContext
 
 SECRET_KEY = "super-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt cost factor; each +1 doubles the time per hash (12 is ~250ms on one core)
+BCRYPT_ROUNDS = int(os.getenv("GEARSHARE_BCRYPT_ROUNDS", "12"))
+# Threads reserved for hashing, separate from the request threadpool
+HASH_WORKERS = int(os.getenv("GEARSHARE_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Hash jobs allowed to wait for a worker before logins are turned away with 503
+MAX_PENDING_HASHES = HASH_WORKERS * 16
+
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a thread pool hashes in parallel without pickling overhead
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def hash_password(plain: str) -> str:
+    return pwd_context.hash(plain)
+
 
-# Plain-text password (NO hashing)
 def verify_password(plain: str, stored: str) -> bool:
-    return plain == stored
+    """Check a password against a bcrypt hash or a legacy plain-text value"""
+    return verify_and_update(plain, stored)[0]
+
+
+def verify_and_update(plain: str, stored: str):
+    """
+    Returns (valid, new_hash). new_hash is set when the stored value should
+    be replaced: legacy plain-text passwords, or hashes made with a
+    different cost factor.
+    """
+    if not stored:
+        return False, None
+    if pwd_context.identify(stored) is None:
+        # Legacy plain-text row
+        valid = hmac.compare_digest(plain.encode("utf-8"), stored.encode("utf-8"))
+        return valid, (hash_password(plain) if valid else None)
+    valid = pwd_context.verify(plain, stored)
+    return valid, (hash_password(plain) if valid and pwd_context.needs_update(stored) else None)
+
+
+async def _run_in_hash_pool(fn, *args):
+    global _pending
+    with _pending_lock:
+        if _pending >= MAX_PENDING_HASHES:
+            raise HTTPException(status_code=503, detail="Too many logins in progress, try again shortly",
+                                headers={"Retry-After": "1"})
+        _pending += 1
+    try:
+        return await asyncio.wrap_future(_hash_pool.submit(fn, *args))
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+async def hash_password_async(plain: str) -> str:
+    return await _run_in_hash_pool(hash_password, plain)
+
+
+async def verify_and_update_async(plain: str, stored: str):
+    return await _run_in_hash_pool(verify_and_update, plain, stored)
 
 
 def create_access_token(data: dict):
@@ -0,0 +1,102 @@
+import threading
+from psycopg2.extras import RealDictCursor
+from .database import get_read_db
+
+# How long a follower waits on an in-flight query before running its own
+DEFAULT_TIMEOUT_SECONDS = 5.0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers using the same key.
+
+    Only calls that overlap in time are coalesced; nothing is cached once the
+    leader's call returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def do(self, key, fn, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if call.done.wait(timeout):
+                with self._lock:
+                    self.stats["coalesced"] += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # The leader is stuck; don't let it stall this request too
+            with self._lock:
+                self.stats["timeouts"] += 1
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self.stats["executed"] += 1
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                in_flight=len(self._calls),
+                # Followers attached to the calls still running
+                waiting=sum(call.waiters for call in self._calls.values()),
+            )
+
+
+read_group = SingleFlight()
+
+
+def _normalize(query: str) -> str:
+    return " ".join(query.split())
+
+
+def fetch_shared(query: str, params: tuple = (), many: bool = False, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+    """Run a read-only query, sharing the result with identical concurrent queries.
+
+    Callers must treat the returned rows as read-only since they may be handed
+    to several requests at once.
+    """
+    def run():
+        conn = get_read_db()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if many else cursor.fetchone()
+            cursor.close()
+            return rows
+        finally:
+            conn.close()
+
+    key = (_normalize(query), tuple(params), many)
+    return read_group.do(key, run, timeout)
@@ -1,45 +1,78 @@
 from fastapi import APIRouter
 from psycopg2.extras import RealDictCursor
-from .database import get_db
-from .schemas import UserResponse
+from .database import get_db, get_read_db
+from .schemas import UserResponse, UserPage
+from . import counters
 
 router = APIRouter()
 
 
-# GET all users (admin only)
-@router.get("/", response_model=list[UserResponse])
-def get_all_users():
-    """Get all users in the system"""
-    conn = get_db()
+# Page size bounds for the user directory
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _like_prefix(value: str) -> str:
+    """LIKE pattern matching strings that start with `value` literally"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+# GET one page of users (admin only)
+# Keyset pagination over "UserName_PK" in byte order (COLLATE "C"), so the
+# btree indexes from user_directory_indexes.sql serve ordering, the cursor
+# and prefix search at any table size
+@router.get("/", response_model=UserPage)
+def get_all_users(
+    q: str = None,
+    role: str = None,
+    verified: bool = None,
+    cursor: str = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    """Get users ordered by username; `q` matches a username or email prefix"""
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    conditions = []
+    values = []
+    if q:
+        conditions.append("""("UserName_PK" COLLATE "C" LIKE %s OR lower("Email") LIKE %s)""")
+        values += [_like_prefix(q), _like_prefix(q.lower())]
+    if role:
+        conditions.append('"Role" = %s')
+        values.append(role)
+    if verified is not None:
+        conditions.append('"VerificationStatus" = %s')
+        values.append(verified)
+    if cursor:
+        conditions.append('"UserName_PK" COLLATE "C" > %s')
+        values.append(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = get_read_db()
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
+        db_cursor = conn.cursor(cursor_factory=RealDictCursor)
+        db_cursor.execute(f"""
             SELECT "UserName_PK", "Email", "Role", "Location", "VerificationStatus", "CreatedAt"
             FROM "User"
-        """)
-        users = cursor.fetchall()
-        cursor.close()
-        return users
+            {where}
+            ORDER BY "UserName_PK" COLLATE "C"
+            LIMIT %s
+        """, values + [limit + 1])
+        users = db_cursor.fetchall()
+        db_cursor.close()
     finally:
         conn.close()
 
+    # One extra row tells whether another page exists
+    has_more = len(users) > limit
+    users = users[:limit]
+    return {"users": users, "next_cursor": users[-1]["UserName_PK"] if has_more else None}
+
 
 # GET user count
 @router.get("/count")
-def get_user_count():
-    """Get total count of users"""
-    conn = get_db()
-    try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM "User"
-        """)
-        result = cursor.fetchone()
-        cursor.close()
-        return {"count": result['count']}
-    finally:
-        conn.close()
+def get_user_count(approximate: bool = False):
+    """Get total count of users, with counts by role and verification status"""
+    return counters.count("users", approximate)
 
 
 # GET specific user by username
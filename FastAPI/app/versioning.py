@@ -0,0 +1,27 @@
+from fastapi import HTTPException, Response
+
+
+def parse_if_match(if_match: str):
+    """Extract the expected row version from an If-Match header value.
+
+    Accepts `"3"`, `W/"3"` and bare `3`. Returns None when the header is
+    absent or `*`, meaning the write is unconditional.
+    """
+    if if_match is None:
+        return None
+    value = if_match.strip()
+    if value in ("", "*"):
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+
+def set_etag(response: Response, row):
+    """Expose the row version as an ETag so clients can send it back in If-Match"""
+    if row and row.get('version') is not None:
+        response.headers["ETag"] = f'"{row["version"]}"'
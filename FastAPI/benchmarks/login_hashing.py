@@ -0,0 +1,53 @@
+"""
+Login throughput against the bcrypt cost factor.
+
+Runs the password check a login performs (verify_and_update_async) with
+many logins in flight at once, through the same bounded hash pool the API
+uses, and prints logins per second for each cost factor.
+
+    python -m benchmarks.login_hashing [--rounds 4 8 10 12] [--logins 200] [--concurrency 64]
+
+Run from the FastAPI directory; GEARSHARE_HASH_WORKERS sizes the pool.
+"""
+import argparse
+import asyncio
+import time
+
+from passlib.context import CryptContext
+
+from app import security
+
+
+async def _run(logins: int, concurrency: int, stored: str):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with gate:
+            valid, _ = await security.verify_and_update_async("correct horse", stored)
+            assert valid
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[4, 8, 10, 12])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=min(64, security.MAX_PENDING_HASHES))
+    args = parser.parse_args()
+
+    print(f"hash workers: {security.HASH_WORKERS}, concurrency: {args.concurrency}")
+    print(f"{'rounds':>6}  {'logins/s':>9}  {'ms/login':>9}")
+    for rounds in args.rounds:
+        security.pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        stored = security.hash_password("correct horse")
+        # Fewer logins at high cost factors so each run stays short
+        logins = max(args.concurrency, args.logins >> max(0, rounds - 8))
+        elapsed = asyncio.run(_run(logins, args.concurrency, stored))
+        print(f"{rounds:>6}  {logins / elapsed:>9.1f}  {1000 * elapsed / logins:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+-- Maintained row counters for GearShare (GET /users/count, /reports/count, /admin/stats)
+-- Run this once against an existing GearShare database (pgAdmin or psql)
+
+-- Every write to a tracked table appends signed deltas here in the same
+-- transaction, so counts are exact and never contend on a single hot row.
+-- The scheduler's compact_counters job folds them into one row per counter.
+CREATE TABLE IF NOT EXISTS counter_delta (
+    id BIGSERIAL PRIMARY KEY,
+    -- '<name>' for the total, '<name>.<column>:<value>' per group, e.g. 'users.Role:Admin'
+    counter VARCHAR(255) NOT NULL,
+    delta BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_counter_delta_counter ON counter_delta(counter);
+
+-- Statement-level trigger: TG_ARGV[0] is the counter name, the remaining
+-- arguments are the columns to count by. One INSERT per statement, however
+-- many rows it touched.
+CREATE OR REPLACE FUNCTION counter_track() RETURNS trigger AS $$
+DECLARE
+    added JSONB[];
+    removed JSONB[];
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT array_agg(to_jsonb(n)) INTO added FROM new_rows n;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        SELECT array_agg(to_jsonb(o)) INTO removed FROM old_rows o;
+    END IF;
+
+    INSERT INTO counter_delta (counter, delta)
+    SELECT k.counter, SUM(c.delta)
+    FROM (
+        SELECT 1 AS delta, r AS row FROM unnest(added) r
+        UNION ALL
+        SELECT -1, r FROM unnest(removed) r
+    ) c
+    CROSS JOIN LATERAL (
+        SELECT TG_ARGV[0]
+        UNION ALL
+        SELECT TG_ARGV[0] || '.' || col || ':' || COALESCE(c.row ->> col, 'null')
+        FROM unnest(TG_ARGV[1:TG_NARGS - 1]) col
+    ) k(counter)
+    GROUP BY k.counter
+    -- Updates that don't move a row between groups cancel out
+    HAVING SUM(c.delta) <> 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Lock out writers while the triggers are created and the counts seeded,
+-- so no write falls between the seed and the first delta
+BEGIN;
+LOCK TABLE "User", report IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS user_counter_insert ON "User";
+DROP TRIGGER IF EXISTS user_counter_update ON "User";
+DROP TRIGGER IF EXISTS user_counter_delete ON "User";
+CREATE TRIGGER user_counter_insert AFTER INSERT ON "User"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counter_track('users', 'Role', 'VerificationStatus');
+CREATE TRIGGER user_counter_update AFTER UPDATE ON "User"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counter_track('users', 'Role', 'VerificationStatus');
+CREATE TRIGGER user_counter_delete AFTER DELETE ON "User"
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counter_track('users', 'Role', 'VerificationStatus');
+
+DROP TRIGGER IF EXISTS report_counter_insert ON report;
+DROP TRIGGER IF EXISTS report_counter_update ON report;
+DROP TRIGGER IF EXISTS report_counter_delete ON report;
+CREATE TRIGGER report_counter_insert AFTER INSERT ON report
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counter_track('reports', 'status', 'priority');
+CREATE TRIGGER report_counter_update AFTER UPDATE ON report
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counter_track('reports', 'status', 'priority');
+CREATE TRIGGER report_counter_delete AFTER DELETE ON report
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counter_track('reports', 'status', 'priority');
+
+-- Seed from the current rows (safe to re-run: replaces earlier values)
+DELETE FROM counter_delta WHERE counter = 'users' OR counter LIKE 'users.%' OR counter = 'reports' OR counter LIKE 'reports.%';
+INSERT INTO counter_delta (counter, delta)
+SELECT 'users', COUNT(*) FROM "User"
+UNION ALL
+SELECT 'users.Role:' || COALESCE("Role", 'null'), COUNT(*) FROM "User" GROUP BY "Role"
+UNION ALL
+SELECT 'users.VerificationStatus:' || COALESCE("VerificationStatus"::text, 'null'), COUNT(*) FROM "User" GROUP BY "VerificationStatus"
+UNION ALL
+SELECT 'reports', COUNT(*) FROM report
+UNION ALL
+SELECT 'reports.status:' || COALESCE(status, 'null'), COUNT(*) FROM report GROUP BY status
+UNION ALL
+SELECT 'reports.priority:' || COALESCE(priority, 'null'), COUNT(*) FROM report GROUP BY priority;
+COMMIT;
@@ -0,0 +1,20 @@
+-- Catalog facets for GearShare (served by GET /equipment/facets)
+-- Use this SQL in pgAdmin or psql to create the view
+-- Refreshed by the refresh_equipment_facets job in app/scheduler.py
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS equipment_facets AS
+SELECT
+    COALESCE(category, 'Uncategorized') AS category,
+    COUNT(*) AS count,
+    COUNT(*) FILTER (WHERE status = 'available') AS available,
+    COUNT(*) FILTER (WHERE status = 'booked') AS booked,
+    COUNT(*) FILTER (WHERE status = 'unavailable') AS unavailable,
+    MIN(daily_price) AS min_price,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY daily_price) AS median_price,
+    MAX(daily_price) AS max_price,
+    CURRENT_TIMESTAMP AS refreshed_at
+FROM equipment
+GROUP BY COALESCE(category, 'Uncategorized');
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_equipment_facets_category ON equipment_facets(category);
@@ -27,6 +27,9 @@ CREATE TABLE equipment (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
+    -- Optimistic concurrency (sent back by clients as If-Match)
+    version INTEGER NOT NULL DEFAULT 1,
+
     CONSTRAINT fk_equipment_owner
         FOREIGN KEY (owner_username)
         REFERENCES "User"(UserName_PK)
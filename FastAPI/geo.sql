@@ -0,0 +1,12 @@
+-- Coordinates of pickup locations (GET /equipment/nearby)
+-- Use this SQL in pgAdmin or psql to add the columns, then run
+-- `python -m app.geo` once to geocode existing listings
+
+ALTER TABLE equipment ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE equipment ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+-- Byte order so that every cell is one contiguous range of the index
+ALTER TABLE equipment ADD COLUMN IF NOT EXISTS geohash VARCHAR(12) COLLATE "C";
+
+-- Nearby search scans the ranges of the geohash cells around the centre
+CREATE INDEX IF NOT EXISTS idx_equipment_geohash ON equipment(geohash)
+    WHERE geohash IS NOT NULL AND status <> 'unavailable';
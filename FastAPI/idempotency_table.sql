@@ -0,0 +1,23 @@
+-- Idempotency key store for GearShare
+-- Use this SQL in pgAdmin or psql to create the table
+
+CREATE TABLE IF NOT EXISTS idempotency_key (
+    -- Route + user the key belongs to, e.g. 'POST /reservation/:alice'
+    scope VARCHAR(300) NOT NULL,
+    idem_key VARCHAR(255) NOT NULL,
+
+    -- Hash of the request body; a reused key with a different body is rejected
+    request_hash CHAR(64) NOT NULL,
+
+    -- NULL while the first request is still running
+    response JSONB,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- While response is NULL this is the claim's short lease; a retry may take over once it passes
+    expires_at TIMESTAMP NOT NULL,
+
+    CONSTRAINT idempotency_key_pkey PRIMARY KEY (scope, idem_key)
+);
+
+-- Expired keys are purged in batches by expiry time
+CREATE INDEX IF NOT EXISTS idx_idempotency_key_expires ON idempotency_key(expires_at);
@@ -0,0 +1,23 @@
+-- Transactional outbox for GearShare
+-- Use this SQL in pgAdmin or psql to create the table
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGSERIAL PRIMARY KEY,
+
+    -- e.g. 'review.changed', 'reservation.changed', 'equipment.changed'
+    event_type VARCHAR(50) NOT NULL,
+    -- Row the derived update applies to (equipment_id for all current events)
+    aggregate_id INTEGER NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Set once the worker has applied the event
+    processed_at TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+
+-- The worker only ever scans pending events in id order
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(id) WHERE processed_at IS NULL;
+-- Processed events are purged by age
+CREATE INDEX IF NOT EXISTS idx_outbox_processed_at ON outbox(processed_at) WHERE processed_at IS NOT NULL;
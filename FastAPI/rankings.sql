@@ -0,0 +1,23 @@
+-- Precomputed equipment rankings (served by GET /equipment/rankings/{feed})
+-- Use this SQL in pgAdmin or psql to create the table
+-- Rebuilt by the refresh_equipment_rankings job in app/scheduler.py
+
+CREATE TABLE IF NOT EXISTS equipment_ranking (
+    -- 'top-rated' or 'trending'
+    feed VARCHAR(20) NOT NULL,
+    -- Equipment category, or '*' for the ranking across all categories
+    category VARCHAR(100) NOT NULL,
+    -- 1-based position within (feed, category)
+    rank INTEGER NOT NULL,
+    equipment_id INTEGER NOT NULL REFERENCES equipment(equipment_id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- A page of a feed is one range scan of the primary key
+    PRIMARY KEY (feed, category, rank)
+);
+
+-- Used by the cascade when equipment is deleted
+CREATE INDEX IF NOT EXISTS idx_equipment_ranking_equipment ON equipment_ranking(equipment_id);
+
+-- Trending only reads recent reservations
+CREATE INDEX IF NOT EXISTS idx_reservation_created_at ON reservation(created_at);
@@ -0,0 +1,37 @@
+-- Shared token buckets for GearShare rate limiting (GEARSHARE_RATE_LIMIT_BACKEND=postgres)
+-- Use this SQL in pgAdmin or psql to create the table and function
+
+-- Unlogged: buckets are cheap to lose on a crash and shouldn't cost WAL on every request
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_bucket (
+    -- '<limit name>:<client>' or '<limit name>:*' for route-wide budgets
+    bucket_key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Takes one token from a bucket refilling at p_rate per second up to p_burst.
+-- Returns 0 when a token was taken, otherwise the seconds until one is available.
+-- The upsert locks the row, so concurrent callers are serialized per bucket.
+CREATE OR REPLACE FUNCTION rate_limit_take(p_key TEXT, p_rate DOUBLE PRECISION, p_burst DOUBLE PRECISION)
+RETURNS DOUBLE PRECISION AS $$
+DECLARE
+    now_ts TIMESTAMPTZ := clock_timestamp();
+    available DOUBLE PRECISION;
+BEGIN
+    INSERT INTO rate_limit_bucket AS b (bucket_key, tokens, updated_at)
+    VALUES (p_key, p_burst, now_ts)
+    ON CONFLICT (bucket_key) DO UPDATE
+        SET tokens = LEAST(p_burst, b.tokens + EXTRACT(EPOCH FROM now_ts - b.updated_at) * p_rate),
+            updated_at = now_ts
+    RETURNING tokens INTO available;
+
+    IF available >= 1 THEN
+        UPDATE rate_limit_bucket SET tokens = available - 1 WHERE bucket_key = p_key;
+        RETURN 0;
+    END IF;
+    RETURN (1 - available) / p_rate;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Idle buckets are purged by age
+CREATE INDEX IF NOT EXISTS idx_rate_limit_bucket_updated_at ON rate_limit_bucket(updated_at);
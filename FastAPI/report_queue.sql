@@ -0,0 +1,24 @@
+-- Moderation work queue for reports (POST /reports/claim)
+-- Run this once against an existing GearShare database (pgAdmin or psql)
+
+-- A claim is a lease: the report stays 'open' but is skipped by other
+-- moderators until claim_expires_at, after which anyone may claim it again
+ALTER TABLE report ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+ALTER TABLE report ADD COLUMN IF NOT EXISTS claim_expires_at TIMESTAMP;
+
+-- Queue order: critical first, then high, medium, low (unknown values last)
+ALTER TABLE report ADD COLUMN IF NOT EXISTS priority_rank SMALLINT
+    GENERATED ALWAYS AS (
+        CASE lower(priority)
+            WHEN 'critical' THEN 0
+            WHEN 'high' THEN 1
+            WHEN 'medium' THEN 2
+            WHEN 'low' THEN 3
+            ELSE 4
+        END
+    ) STORED;
+
+-- Only open reports are ever claimed; the index stays as small as the backlog
+-- and is walked in claim order, so claiming never reads resolved rows
+CREATE INDEX IF NOT EXISTS idx_report_open_queue ON report (priority_rank, created_at, report_id)
+    WHERE status = 'open';
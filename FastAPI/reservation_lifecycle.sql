@@ -0,0 +1,11 @@
+-- Reservation lifecycle jobs (app/scheduler.py)
+-- Run this once against an existing GearShare database (pgAdmin or psql)
+
+-- expire_pending_reservations moves overdue pending reservations to 'cancelled'
+ALTER TABLE reservation DROP CONSTRAINT IF EXISTS chk_reservation_status;
+ALTER TABLE reservation ADD CONSTRAINT chk_reservation_status
+    CHECK (status IN ('pending','running','returned','completed','cancelled'));
+
+-- The jobs scan pending/running rows by date
+CREATE INDEX IF NOT EXISTS idx_reservation_pending_start ON reservation(start_date) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_reservation_running_end ON reservation(equipment_id, end_date) WHERE status = 'running';
@@ -8,7 +8,7 @@ CREATE TABLE reservation (
     owner_username VARCHAR(255) NOT NULL,
     reserver_username VARCHAR(255) NOT NULL,
 
-    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, running, returned, completed
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, running, returned, completed, cancelled
 
     start_date DATE NOT NULL,
     end_date DATE NOT NULL,
@@ -21,6 +21,9 @@ CREATE TABLE reservation (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
+    -- Optimistic concurrency (sent back by clients as If-Match)
+    version INTEGER NOT NULL DEFAULT 1,
+
     CONSTRAINT fk_reservation_owner
         FOREIGN KEY (owner_username)
         REFERENCES "User"("UserName_PK")
@@ -37,7 +40,7 @@ CREATE TABLE reservation (
         ON DELETE CASCADE,
 
     CONSTRAINT chk_reservation_status
-        CHECK (status IN ('pending','running','returned','completed'))
+        CHECK (status IN ('pending','running','returned','completed','cancelled'))
 );
 
 -- Indexes for faster lookups
@@ -50,3 +53,7 @@ CREATE INDEX idx_reservation_status ON reservation(status);
 -- ALTER TABLE reservation ADD CONSTRAINT fk_reservation_review FOREIGN KEY (review_id) REFERENCES review(review_id) ON DELETE SET NULL;
 
 -- Note: total_price should be calculated by the application as (per_day_price * number_of_days). This file intentionally does not include privacy or sensitive defaults.
+
+-- Lifecycle jobs (app/scheduler.py) scan pending/running rows by date
+CREATE INDEX idx_reservation_pending_start ON reservation(start_date) WHERE status = 'pending';
+CREATE INDEX idx_reservation_running_end ON reservation(equipment_id, end_date) WHERE status = 'running';
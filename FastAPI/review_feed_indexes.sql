@@ -0,0 +1,21 @@
+-- Indexes for keyset-paginated review lists
+-- Run this once against an existing GearShare database (pgAdmin or psql).
+-- On a large live table, run each statement as CREATE INDEX CONCURRENTLY instead.
+
+-- Reviews are listed newest first by (created_at, review_id); each index
+-- matches that order so a page is a single range scan from the cursor
+
+-- GET /review/equipment/{equipment_id} (replaces idx_review_equipment)
+CREATE INDEX IF NOT EXISTS idx_review_equipment_feed
+    ON review (equipment_id, created_at DESC, review_id DESC);
+DROP INDEX IF EXISTS idx_review_equipment;
+
+-- GET /review/owner/{owner_username}/rating-details (replaces idx_review_owner).
+-- rating is included so the rating breakdown is an index-only scan
+CREATE INDEX IF NOT EXISTS idx_review_owner_feed
+    ON review (owner_username, created_at DESC, review_id DESC) INCLUDE (rating);
+DROP INDEX IF EXISTS idx_review_owner;
+
+-- GET /review/ (admin feed)
+CREATE INDEX IF NOT EXISTS idx_review_feed
+    ON review (created_at DESC, review_id DESC);
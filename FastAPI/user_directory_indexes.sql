@@ -0,0 +1,19 @@
+-- Indexes for the paginated admin user directory (GET /users/)
+-- Run this once against an existing GearShare database (pgAdmin or psql).
+-- On a large live table, run each statement as CREATE INDEX CONCURRENTLY instead.
+
+-- Pages are ordered and resumed by username in byte order; a "C" collation
+-- btree also serves username prefix search (LIKE 'abc%'), like text_pattern_ops
+-- would, while still supporting ORDER BY and the keyset comparison
+CREATE INDEX IF NOT EXISTS idx_user_username_c ON "User" ("UserName_PK" COLLATE "C");
+
+-- Case-insensitive email prefix search
+CREATE INDEX IF NOT EXISTS idx_user_email_prefix ON "User" (lower("Email") text_pattern_ops);
+
+-- Role filter, walked in page order (replaces idx_user_role)
+CREATE INDEX IF NOT EXISTS idx_user_role_username ON "User" ("Role", "UserName_PK" COLLATE "C");
+DROP INDEX IF EXISTS idx_user_role;
+
+-- Unverified accounts are the rare case the admin panel filters for
+CREATE INDEX IF NOT EXISTS idx_user_unverified ON "User" ("UserName_PK" COLLATE "C")
+    WHERE "VerificationStatus" = FALSE;
@@ -0,0 +1,8 @@
+-- Row version columns for optimistic concurrency
+-- Run this once against an existing GearShare database (pgAdmin or psql)
+
+-- Every successful UPDATE bumps version; clients send the value they read
+-- back in an If-Match header and get 412 if the row changed in between.
+ALTER TABLE equipment ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE reservation ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE report ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
@@ -33,6 +33,7 @@ CREATE TABLE IF NOT EXISTS public.equipment
     rating_count integer DEFAULT 0,
     created_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
     updated_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    version integer NOT NULL DEFAULT 1,
     CONSTRAINT equipment_pkey PRIMARY KEY (equipment_id)
 );
 
@@ -49,6 +50,7 @@ CREATE TABLE IF NOT EXISTS public.report
     priority character varying(20) COLLATE pg_catalog."default" DEFAULT 'medium'::character varying,
     created_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
     updated_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    version integer NOT NULL DEFAULT 1,
     CONSTRAINT report_pkey PRIMARY KEY (report_id)
 );
 
@@ -66,7 +68,9 @@ CREATE TABLE IF NOT EXISTS public.reservation
     review_id integer,
     created_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
     updated_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
-    CONSTRAINT reservation_pkey PRIMARY KEY (reservation_id)
+    version integer NOT NULL DEFAULT 1,
+    CONSTRAINT reservation_pkey PRIMARY KEY (reservation_id),
+    CONSTRAINT chk_reservation_status CHECK (status IN ('pending','running','returned','completed','cancelled'))
 );
 
 CREATE TABLE IF NOT EXISTS public.review
@@ -154,6 +158,10 @@ ALTER TABLE IF EXISTS public.reservation
     ON DELETE CASCADE;
 CREATE INDEX IF NOT EXISTS idx_reservation_reserver
     ON public.reservation(reserver_username);
+CREATE INDEX IF NOT EXISTS idx_reservation_pending_start
+    ON public.reservation(start_date) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_reservation_running_end
+    ON public.reservation(equipment_id, end_date) WHERE status = 'running';
 
 
 ALTER TABLE IF EXISTS public.review
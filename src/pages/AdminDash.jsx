@@ -27,13 +27,13 @@ const AdminDash = ({ userData, onNavigate }) => {
     try {
       setLoading(true);
       const [usersRes, equipmentRes, reservationsRes, reportsRes] = await Promise.all([
-        apiRequest('/users/'),
+        apiRequest('/users/count'),
         apiRequest('/equipment/'),
         apiRequest('/reservation/'),
         apiRequest('/reports/')
       ]);
 
-      const usersData = usersRes.ok ? await usersRes.json() : [];
+      const usersCount = usersRes.ok ? (await usersRes.json()).count : 0;
       const equipmentData = equipmentRes.ok ? await equipmentRes.json() : [];
       const reservationsData = reservationsRes.ok ? await reservationsRes.json() : [];
       const reportsData = reportsRes.ok ? await reportsRes.json() : [];
@@ -53,7 +53,7 @@ const AdminDash = ({ userData, onNavigate }) => {
       const activeRentals = reservationsData.filter(r => r.status === 'active' || r.status === 'pending');
 
       setStats([
-        { label: 'Total Users', value: usersData.length, path: '/admin/users' },
+        { label: 'Total Users', value: usersCount, path: '/admin/users' },
         { label: 'Total Listings', value: equipmentData.length, path: '/admin/listings' },
         { label: 'Active Rentals', value: activeRentals.length, path: '/admin/rentals' },
         { label: 'Reviews', value: reportsData.length, path: '/admin/reviews' },
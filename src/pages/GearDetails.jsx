@@ -9,26 +9,37 @@ const GearDetails = ({ item, onBack }) => {
   const [loading, setLoading] = useState(false);
   const [equipmentData, setEquipmentData] = useState(item);
   const [reviews, setReviews] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingReviews, setLoadingReviews] = useState(false);
 
-  // Fetch reviews on component mount
-  useEffect(() => {
-    const fetchReviews = async () => {
-      try {
-        const response = await apiRequest(`/api/review/equipment/${item.id || item.equipment_id}`);
-        if (response.ok) {
-          const reviewsData = await response.json();
-          setReviews(reviewsData);
-        }
-      } catch (error) {
-        console.error('Failed to fetch reviews:', error);
+  // Reviews come in pages; pass the previous page's next_cursor to get the next one
+  const fetchReviews = async (cursor = null) => {
+    try {
+      setLoadingReviews(true);
+      const params = cursor ? `?${new URLSearchParams({ cursor })}` : '';
+      const response = await apiRequest(`/api/review/equipment/${item.id || item.equipment_id}${params}`);
+      if (response.ok) {
+        const reviewsData = await response.json();
+        setReviews((prev) => (cursor ? [...prev, ...reviewsData.reviews] : reviewsData.reviews));
+        setNextCursor(reviewsData.next_cursor);
       }
-    };
+    } catch (error) {
+      console.error('Failed to fetch reviews:', error);
+    } finally {
+      setLoadingReviews(false);
+    }
+  };
 
+  // Fetch reviews on component mount
+  useEffect(() => {
     if (item.id || item.equipment_id) {
       fetchReviews();
     }
   }, [item.id, item.equipment_id]);
 
+  // The list is paged, so the total comes from the equipment's maintained count
+  const reviewCount = Math.max(equipmentData.rating_count || item.reviews || 0, reviews.length);
+
   // Check if equipment has active reservation
   const hasActiveReservation = () => {
     // Check if equipment status is booked
@@ -173,7 +184,7 @@ const GearDetails = ({ item, onBack }) => {
             <h2 className="grid-title">Customer Reviews</h2>
             <div className="rating-summary">
               <span className="big-rating">{equipmentData.rating_avg || item.rating || 0}</span>
-              <span className="total-count">({reviews.length} reviews)</span>
+              <span className="total-count">({reviewCount} reviews)</span>
             </div>
           </div>
 
@@ -202,7 +213,17 @@ const GearDetails = ({ item, onBack }) => {
               className="show-all-btn" 
               onClick={() => setShowAllReviews(!showAllReviews)}
             >
-              {showAllReviews ? "Show Less" : `Show All ${reviews.length} Reviews`}
+              {showAllReviews ? "Show Less" : `Show All ${reviewCount} Reviews`}
+            </button>
+          )}
+
+          {showAllReviews && nextCursor && (
+            <button
+              className="show-all-btn"
+              disabled={loadingReviews}
+              onClick={() => fetchReviews(nextCursor)}
+            >
+              {loadingReviews ? "Loading..." : "Load More Reviews"}
             </button>
           )}
         </div>
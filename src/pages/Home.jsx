@@ -95,6 +95,7 @@ const Home = () => {
   const [loading, setLoading] = useState(false);
   const [currentUser, setCurrentUser] = useState(null);
   const [statusFilter, setStatusFilter] = useState('all'); // 'all', 'available', 'unavailable'
+  const [suggestions, setSuggestions] = useState([]);
 
   // Fetch equipment from API
   useEffect(() => {
@@ -153,6 +154,38 @@ const Home = () => {
     fetchEquipment();
   }, []);
 
+  // Name/category suggestions for the search box, fetched as the user types
+  useEffect(() => {
+    const q = searchQuery.trim();
+    if (!q) {
+      setSuggestions([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await apiRequest(`/equipment/suggest?q=${encodeURIComponent(q)}`, { method: 'GET' });
+        if (response.ok) {
+          const data = await response.json();
+          setSuggestions(data.suggestions);
+        }
+      } catch (error) {
+        console.error('Failed to fetch suggestions:', error);
+      }
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [searchQuery]);
+
+  const handleSearchChange = (value) => {
+    // Picking a category suggestion switches to that category instead of searching its name
+    const category = suggestions.find(s => s.type === 'category' && s.text === value);
+    if (category) {
+      setActiveCategory(category.text);
+      setSearchQuery('');
+      return;
+    }
+    setSearchQuery(value);
+  };
+
   // Filtering Logic - Show all equipment except owner's own equipment
   const filteredGear = equipment.filter(item => {
     const matchesSearch = item.name.toLowerCase().includes(searchQuery.toLowerCase());
@@ -228,8 +261,16 @@ const Home = () => {
                     placeholder="Search for cameras, drones, or tools..."
                     className="main-input"
                     value={searchQuery}
-                    onChange={(e) => setSearchQuery(e.target.value)}
+                    onChange={(e) => handleSearchChange(e.target.value)}
+                    list="search-suggestions"
                   />
+                  <datalist id="search-suggestions">
+                    {suggestions.map((s) => (
+                      <option key={`${s.type}-${s.text}`} value={s.text}>
+                        {s.type === 'category' ? 'Category' : `${s.listings} listing${s.listings === 1 ? '' : 's'}`}
+                      </option>
+                    ))}
+                  </datalist>
                 </div>
               </div>
             </form>
@@ -5,6 +5,7 @@ import { apiRequest } from '../utils/api';
 
 const ReviewsAdmin = ({ userData, onNavigate }) => {
   const [reviews, setReviews] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
@@ -17,18 +18,22 @@ const ReviewsAdmin = ({ userData, onNavigate }) => {
     fetchReviews();
   }, []);
 
-  const fetchReviews = async () => {
+  const fetchReviews = async (cursor = null) => {
     try {
       setLoading(true);
-      const response = await apiRequest('/review/');
+      const params = new URLSearchParams({ limit: '100' });
+      if (cursor) params.set('cursor', cursor);
+      const response = await apiRequest(`/review/?${params}`);
       if (!response.ok) throw new Error('Failed to fetch reviews');
       const data = await response.json();
-      setReviews(data);
+      setReviews((prev) => (cursor ? [...prev, ...data.reviews] : data.reviews));
+      setNextCursor(data.next_cursor);
       setError(null);
     } catch (err) {
       console.error('Error fetching reviews:', err);
       setError('Failed to load reviews');
       setReviews([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
@@ -252,7 +257,7 @@ const ReviewsAdmin = ({ userData, onNavigate }) => {
               </tr>
             </thead>
             <tbody>
-              {loading ? (
+              {loading && reviews.length === 0 ? (
                 <tr><td colSpan="9" style={{ textAlign: 'center', padding: '20px' }}>⏳ Loading reviews...</td></tr>
               ) : error ? (
                 <tr><td colSpan="9" style={{ textAlign: 'center', padding: '20px', color: 'red' }}>❌ {error}</td></tr>
@@ -287,6 +292,13 @@ const ReviewsAdmin = ({ userData, onNavigate }) => {
             </tbody>
           </table>
         </div>
+        {nextCursor && !error && (
+          <div className="filter-row">
+            <button className="action-btn" disabled={loading} onClick={() => fetchReviews(nextCursor)}>
+              {loading ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
       </div>
       <Footer />
     </div>
@@ -6,27 +6,36 @@ import { apiRequest } from '../utils/api';
 
 const TotalUser = ({ userData, onNavigate }) => {
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [filters, setFilters] = useState({ name: '', id: '', location: '', verified: 'any' });
   const [selectedUser, setSelectedUser] = useState(null);
 
+  // Name (username/email prefix) and verification are filtered by the server
   useEffect(() => {
-    fetchUsers();
-  }, []);
+    const timer = setTimeout(() => fetchUsers(), 250);
+    return () => clearTimeout(timer);
+  }, [filters.name, filters.verified]);
 
-  const fetchUsers = async () => {
+  const fetchUsers = async (cursor = null) => {
     try {
       setLoading(true);
-      const response = await apiRequest('/users/');
+      const params = new URLSearchParams({ limit: '100' });
+      if (filters.name.trim()) params.set('q', filters.name.trim());
+      if (filters.verified !== 'any') params.set('verified', filters.verified === 'verified');
+      if (cursor) params.set('cursor', cursor);
+      const response = await apiRequest(`/users/?${params}`);
       if (!response.ok) throw new Error('Failed to fetch users');
       const data = await response.json();
-      setUsers(data);
+      setUsers((prev) => (cursor ? [...prev, ...data.users] : data.users));
+      setNextCursor(data.next_cursor);
       setError(null);
     } catch (err) {
       console.error('Error fetching users:', err);
       setError('Failed to load users');
       setUsers([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
@@ -34,14 +43,11 @@ const TotalUser = ({ userData, onNavigate }) => {
 
   const filteredUsers = useMemo(() => {
     return users.filter((u) => {
-      if (filters.name && !u.UserName_PK.toLowerCase().includes(filters.name.trim().toLowerCase())) return false;
       if (filters.id && !u.UserName_PK.toLowerCase().includes(filters.id.trim().toLowerCase())) return false;
       if (filters.location && !u.Location?.toLowerCase().includes(filters.location.trim().toLowerCase())) return false;
-      if (filters.verified === 'verified' && !u.VerificationStatus) return false;
-      if (filters.verified === 'unverified' && u.VerificationStatus) return false;
       return true;
     });
-  }, [filters, users]);
+  }, [filters.id, filters.location, users]);
 
   const onChange = (key) => (e) => setFilters((p) => ({ ...p, [key]: e.target.value }));
   const resetFilters = () => setFilters({ name: '', id: '', location: '', verified: 'any' });
@@ -76,7 +82,7 @@ const TotalUser = ({ userData, onNavigate }) => {
         </div>
 
         <div className="filter-bar">
-          <input className="filter-input" placeholder="Name" value={filters.name} onChange={onChange('name')} />
+          <input className="filter-input" placeholder="Name or email" value={filters.name} onChange={onChange('name')} />
           <input className="filter-input" placeholder="User ID" value={filters.id} onChange={onChange('id')} />
           <input className="filter-input" placeholder="Location" value={filters.location} onChange={onChange('location')} />
           <select className="filter-select" value={filters.verified} onChange={onChange('verified')}>
@@ -90,7 +96,7 @@ const TotalUser = ({ userData, onNavigate }) => {
         </div>
 
         <div className="users-grid">
-          {loading ? (
+          {loading && users.length === 0 ? (
             <div className="table-placeholder">Loading users...</div>
           ) : error ? (
             <div className="table-placeholder">Error: {error}</div>
@@ -112,6 +118,13 @@ const TotalUser = ({ userData, onNavigate }) => {
             ))
           )}
         </div>
+        {nextCursor && !error && (
+          <div className="filter-actions">
+            <button className="btn btn-outline" disabled={loading} onClick={() => fetchUsers(nextCursor)}>
+              {loading ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
       </div>
       <Footer />
     </div>